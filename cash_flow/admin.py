@@ -1,8 +1,105 @@
 from django.contrib import admin
-from .models import Status, Type, Category, SubCategory, CashFlowRecord
 
-admin.site.register(Status)
-admin.site.register(Type)
-admin.site.register(Category)
-admin.site.register(SubCategory)
-admin.site.register(CashFlowRecord)
+from .directory_cache import get_directory
+from .models import (
+    BalanceCheckpoint, Status, Type, Category, SubCategory, CashFlowRecord
+)
+from .pagination import EstimatedCountPaginator
+
+DIRECTORY_KINDS_BY_MODEL = {
+    Status: "statuses",
+    Type: "types",
+    Category: "categories",
+    SubCategory: "subcategories",
+}
+
+
+class DirectoryListFilter(admin.RelatedFieldListFilter):
+    """ Фильтр по справочнику с вариантами из кэша справочников """
+
+    def field_choices(self, field, request, model_admin):
+        kind = DIRECTORY_KINDS_BY_MODEL[field.related_model]
+        return [
+            (entry.id, str(entry))
+            for entry in getattr(get_directory(), kind)
+        ]
+
+
+@admin.register(Status)
+class StatusAdmin(admin.ModelAdmin):
+    list_display = ("name",)
+    search_fields = ("name",)
+    ordering = ("name",)
+
+
+@admin.register(Type)
+class TypeAdmin(admin.ModelAdmin):
+    list_display = ("name", "is_expense")
+    search_fields = ("name",)
+    ordering = ("name",)
+
+
+@admin.register(Category)
+class CategoryAdmin(admin.ModelAdmin):
+    list_display = ("name", "type")
+    list_filter = (("type", DirectoryListFilter),)
+    list_select_related = ("type",)
+    search_fields = ("name",)
+    ordering = ("name",)
+
+    def get_queryset(self, request):
+        # __str__ категории читает тип - в том числе в подсказках автопоиска.
+        return super().get_queryset(request).select_related("type")
+
+
+@admin.register(SubCategory)
+class SubCategoryAdmin(admin.ModelAdmin):
+    list_display = ("name", "category")
+    list_filter = (("category", DirectoryListFilter),)
+    list_select_related = ("category__type",)
+    search_fields = ("name",)
+    autocomplete_fields = ("category",)
+    ordering = ("name",)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("category")
+
+
+@admin.register(CashFlowRecord)
+class CashFlowRecordAdmin(admin.ModelAdmin):
+    """
+    Список записей ДДС для таблиц в миллионы строк: связанные справочники
+    в одном запросе, навигация по дате операции, оценка количества
+    строк вместо COUNT(*) и фильтры по индексированным полям.
+    """
+    list_display = (
+        "effective_date", "status", "type", "category", "subcategory",
+        "amount", "comment",
+    )
+    list_select_related = (
+        "status", "type", "category__type", "subcategory__category",
+    )
+    list_filter = (
+        ("type", DirectoryListFilter),
+        ("status", DirectoryListFilter),
+        ("category", DirectoryListFilter),
+    )
+    date_hierarchy = "effective_date"
+    ordering = ("-effective_date", "-id")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    autocomplete_fields = ("category", "subcategory")
+    readonly_fields = ("effective_date",)
+
+
+@admin.register(BalanceCheckpoint)
+class BalanceCheckpointAdmin(admin.ModelAdmin):
+    """ Остатки ведутся автоматически, в админке только для просмотра """
+    list_display = ("month", "balance")
+    ordering = ("-month",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
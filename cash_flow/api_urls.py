@@ -1,12 +1,16 @@
+from django.urls import path, re_path
 from rest_framework.routers import DefaultRouter
 
+from . import async_views
 from .apps import CashFlowConfig
 from .views import (
     StatusViewSet,
     TypeViewSet,
     CategoryViewSet,
     SubcategoryViewSet,
-    CashFlowRecordViewSet
+    CashFlowRecordViewSet,
+    CashFlowReportView,
+    CashFlowBalanceView
 )
 
 app_name = CashFlowConfig.name
@@ -18,4 +22,15 @@ router.register(r'categories', CategoryViewSet)
 router.register(r'subcategories', SubcategoryViewSet)
 router.register(r'records', CashFlowRecordViewSet)
 
-urlpatterns = router.urls
+urlpatterns = [
+    path("reports/", CashFlowReportView.as_view(), name="reports"),
+    path("balance/", CashFlowBalanceView.as_view(), name="balance"),
+    path(
+        "async/records/", async_views.record_list, name="records_async"
+    ),
+    re_path(
+        r"^async/(?P<kind>statuses|types|categories|subcategories)/$",
+        async_views.directory_list,
+        name="directories_async"
+    ),
+] + router.urls
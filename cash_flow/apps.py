@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class CashFlowConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "cash_flow"
+
+    def ready(self):
+        from cash_flow import signals
+
+        post_migrate.connect(signals.ensure_record_partitions, sender=self)
@@ -0,0 +1,205 @@
+"""
+Асинхронные представления для справочников и чтения записей.
+
+Под ASGI-сервером (uvicorn, daphne) один процесс обслуживает много
+одновременных запросов: справочники отдаются из кэша в памяти процесса
+(холодная загрузка - асинхронным ORM), список записей читается
+асинхронным ORM с той же курсорной пагинацией и фильтрами, что и
+/api/records/. Под WSGI эти представления тоже работают, но каждый
+запрос запускает свой цикл событий - для WSGI остаются синхронные
+версии в views.py.
+"""
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.http import require_safe
+from rest_framework.fields import Field
+from rest_framework.relations import PKOnlyObject
+
+from cash_flow.counting import acount_rows
+from cash_flow.directory_cache import aget_directory, pin_directory
+from cash_flow.forms import CashFlowApiFilterForm
+from cash_flow.db_routing import adb_for_read, replica_view
+from cash_flow.models import CashFlowRecord
+from cash_flow.pagination import (
+    CashFlowRecordCursorPagination, InvalidCursor, KeysetPaginator, rank_field,
+)
+from cash_flow.serializers import CashFlowRecordSerializer
+from cash_flow.views import _int_or_none
+
+COMPACT_JSON = {"separators": (",", ":"), "ensure_ascii": False}
+
+DIRECTORY_PARENTS = {
+    "statuses": None,
+    "types": None,
+    "categories": "type",
+    "subcategories": "category",
+}
+
+
+@lru_cache(maxsize=None)
+def _record_fields() -> Tuple[Tuple[str, Field], ...]:
+    """ Поля CashFlowRecordSerializer для чтения, в том же порядке """
+    return tuple(
+        (name, field)
+        for name, field in CashFlowRecordSerializer().fields.items()
+        if not field.write_only
+    )
+
+
+def _record_payload(record: CashFlowRecord) -> dict:
+    """
+    Запись в том же виде, что в /api/records/: состав полей и их формат
+    берутся у CashFlowRecordSerializer, но без создания сериализатора
+    на каждую запись. Связи отдаются по *_id без запросов к БД.
+    """
+    payload = {}
+    for name, field in _record_fields():
+        attribute = field.get_attribute(record)
+        value = (
+            attribute.pk if isinstance(attribute, PKOnlyObject)
+            else attribute
+        )
+        payload[name] = (
+            None if value is None else field.to_representation(attribute)
+        )
+    return payload
+
+
+def _page_link(request: HttpRequest, cursor: Optional[str]) -> Optional[str]:
+    if cursor is None:
+        return None
+    query = request.GET.copy()
+    query["cursor"] = cursor
+    return request.build_absolute_uri(f"{request.path}?{query.urlencode()}")
+
+
+@require_safe
+async def load_categories(request: HttpRequest) -> JsonResponse:
+    """ Асинхронная версия views.load_categories """
+    directory = await aget_directory()
+    type_id = _int_or_none(request.GET.get("type_id"))
+    return JsonResponse({"categories": [
+        {"id": entry.id, "name": entry.name}
+        for entry in directory.categories_for(type_id)
+    ]})
+
+
+@require_safe
+async def load_subcategories(request: HttpRequest) -> JsonResponse:
+    """ Асинхронная версия views.load_subcategories """
+    directory = await aget_directory()
+    category_id = _int_or_none(request.GET.get("category_id"))
+    return JsonResponse({"subcategories": [
+        {"id": entry.id, "name": entry.name}
+        for entry in directory.subcategories_for(category_id)
+    ]})
+
+
+@require_safe
+async def directory_tree(request: HttpRequest) -> HttpResponse:
+    """ Асинхронная версия views.directory_tree с тем же ETag """
+    directory = await aget_directory()
+    etag = f'"{directory.etag}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(
+            directory.tree, json_dumps_params=COMPACT_JSON
+        )
+        response["ETag"] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@require_safe
+async def directory_list(request: HttpRequest, kind: str) -> JsonResponse:
+    """
+    Справочник целиком из кэша: /api/async/<kind>/,
+    категории фильтруются по ?type=<id>, подкатегории - по ?category=<id>.
+    """
+    directory = await aget_directory()
+    parent = DIRECTORY_PARENTS[kind]
+    entries = getattr(directory, kind)
+    if parent:
+        raw_parent_id = request.GET.get(parent)
+        if raw_parent_id not in (None, ""):
+            parent_id = _int_or_none(raw_parent_id)
+            if parent_id is None:
+                return JsonResponse(
+                    {parent: ["Ожидается целое число"]},
+                    status=400, json_dumps_params=COMPACT_JSON,
+                )
+            entries = [
+                entry for entry in entries if entry.parent_id == parent_id
+            ]
+    results = []
+    for entry in entries:
+        item = {"id": entry.id, "name": entry.name}
+        if parent:
+            item[parent] = entry.parent_id
+        results.append(item)
+    return JsonResponse(
+        {"next": None, "previous": None, "results": results},
+        json_dumps_params=COMPACT_JSON,
+    )
+
+
+@replica_view
+@require_safe
+async def record_list(request: HttpRequest) -> JsonResponse:
+    """
+    Асинхронная версия GET /api/records/: те же фильтры,
+    параметры cursor, page_size, ordering и формат ответа.
+    """
+    try:
+        page_size = max(1, min(
+            int(request.GET["page_size"]), settings.CASHFLOW_API_MAX_PAGE_SIZE
+        ))
+    except (KeyError, ValueError):
+        page_size = settings.CASHFLOW_API_PAGE_SIZE
+
+    using = await adb_for_read(CashFlowRecord)
+    with pin_directory(await aget_directory()):
+        form = CashFlowApiFilterForm(request.GET)
+        if not form.is_valid():
+            return JsonResponse(
+                form.errors, status=400, json_dumps_params=COMPACT_JSON
+            )
+
+    searched = bool(form.cleaned_data.get("search"))
+    ordering = request.GET.get(
+        "ordering", "-rank" if searched else "-effective_date"
+    )
+    choices = CashFlowRecordCursorPagination.get_ordering_choices(searched)
+    if ordering not in choices:
+        return JsonResponse({"ordering": [
+            f"Допустимые значения: {', '.join(choices)}"
+        ]}, status=400, json_dumps_params=COMPACT_JSON)
+
+    queryset = CashFlowRecord.objects.using(using).filter_by(
+        form.cleaned_data
+    )
+    ranked = rank_field(queryset)
+    paginator = KeysetPaginator(
+        queryset,
+        page_size,
+        descending=ordering.startswith("-"),
+        rank_field=ranked if ordering == "-rank" else None,
+    )
+    try:
+        page = await paginator.aget_page(request.GET.get("cursor"))
+    except InvalidCursor as e:
+        return JsonResponse(
+            {"detail": str(e)}, status=404, json_dumps_params=COMPACT_JSON
+        )
+    count = await acount_rows(queryset)
+    return JsonResponse({
+        "count": count.value,
+        "count_exact": count.exact,
+        "next": _page_link(request, page.next_cursor),
+        "previous": _page_link(request, page.previous_cursor),
+        "results": [_record_payload(record) for record in page],
+    }, json_dumps_params=COMPACT_JSON)
@@ -0,0 +1,132 @@
+"""
+Остаток денежных средств (поступления минус списания нарастающим итогом).
+
+Остаток на дату складывается из ближайшего сохранённого остатка
+на конец месяца (BalanceCheckpoint) и дневных итогов после него,
+поэтому расчёт за любой период просматривает только данные с начала
+месяца, к которому относится этот остаток. Нарастающий итог внутри
+периода считает СУБД оконной функцией SUM(...) OVER (ORDER BY ...):
+по дням - над дневными итогами, внутри дня - над самими записями.
+"""
+import datetime
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db import connections, router
+from django.db.models import F, Sum, Window
+
+from cash_flow.models import (
+    BalanceCheckpoint,
+    CashFlowDailyRollup,
+    CashFlowRecord,
+    Type,
+    signed_amount,
+)
+from cash_flow.months import add_months
+
+CENTS = Decimal("0.01")
+
+
+def _money(value) -> Decimal:
+    # SQLite возвращает результат оконной функции над numeric как float.
+    return Decimal(str(value or 0)).quantize(CENTS)
+
+
+def balance_before(
+        day: datetime.date, using: Optional[str] = None
+) -> Decimal:
+    """ Остаток на начало дня day """
+    using = using or router.db_for_read(CashFlowDailyRollup)
+    checkpoint = BalanceCheckpoint.objects.before(day, using)
+    rollups = CashFlowDailyRollup.objects.using(using).filter(date__lt=day)
+    balance = Decimal("0")
+    if checkpoint is not None:
+        balance = checkpoint.balance
+        rollups = rollups.filter(date__gte=add_months(checkpoint.month, 1))
+    total = rollups.aggregate(
+        total=Sum(signed_amount("amount_total"))
+    )["total"]
+    return _money(balance + (total or 0))
+
+
+def daily_balance(
+        date_from: datetime.date,
+        date_to: datetime.date,
+        using: Optional[str] = None,
+) -> Tuple[Decimal, List[dict]]:
+    """
+    Остаток на начало date_from и строки по дням с операциями:
+    date, income, expense и balance - остаток на конец дня.
+    """
+    using = using or router.db_for_read(CashFlowDailyRollup)
+    opening = balance_before(date_from, using)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    rollup_table = qn(CashFlowDailyRollup._meta.db_table)
+    type_table = qn(Type._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT day, income, expense, "
+            "SUM(income - expense) OVER (ORDER BY day) "
+            "FROM ("
+            "SELECT r.date AS day, "
+            "SUM(CASE WHEN t.is_expense THEN 0 ELSE r.amount_total END) "
+            "AS income, "
+            "SUM(CASE WHEN t.is_expense THEN r.amount_total ELSE 0 END) "
+            "AS expense "
+            f"FROM {rollup_table} r "
+            f"INNER JOIN {type_table} t ON t.id = r.type_id "
+            "WHERE r.date >= %s AND r.date <= %s "
+            "GROUP BY r.date"
+            ") days ORDER BY day",
+            [date_from, date_to],
+        )
+        rows = cursor.fetchall()
+    results = []
+    for day, income, expense, running in rows:
+        if isinstance(day, str):
+            # SQLite отдаёт даты из сырого запроса строками.
+            day = datetime.date.fromisoformat(day)
+        results.append({
+            "date": day,
+            "income": _money(income),
+            "expense": _money(expense),
+            "balance": _money(opening + _money(running)),
+        })
+    return opening, results
+
+
+def record_balances(
+        records: Iterable[CashFlowRecord], using: Optional[str] = None
+) -> Dict[int, Decimal]:
+    """
+    Остаток после каждой из записей по всем записям (без учёта
+    фильтров списка) в порядке (effective_date, id): {id: остаток}.
+    """
+    records = list(records)
+    days = sorted({record.effective_date for record in records})
+    if not days:
+        return {}
+    using = using or router.db_for_read(CashFlowRecord)
+    opening, rows = daily_balance(days[0], days[-1], using)
+    # Остаток на начало каждого дня страницы.
+    day_opening, balance = {}, opening
+    for row in rows:
+        day_opening[row["date"]] = balance
+        balance = row["balance"]
+
+    running = (
+        CashFlowRecord.objects.using(using)
+        .filter(effective_date__in=days)
+        .annotate(running=Window(
+            Sum(signed_amount()),
+            partition_by=F("effective_date"),
+            order_by=F("id").asc(),
+        ))
+        .values_list("id", "effective_date", "running")
+    )
+    wanted = {record.pk for record in records}
+    return {
+        pk: _money(day_opening.get(day, opening) + _money(total))
+        for pk, day, total in running if pk in wanted
+    }
@@ -0,0 +1,377 @@
+"""
+Набор замеров основных путей приложения.
+
+Запросы выполняются в процессе через тестовый клиент Django: замер
+включает маршрутизацию, промежуточные слои, представления, шаблоны
+и запросы к БД, но не сеть и не веб-сервер. Для каждого сценария
+считаются время (среднее, медиана, p95), число запросов к БД
+(на основной БД и репликах) и их суммарное время. Сценарии с записью
+выполняются в транзакции, которая откатывается, - данные не меняются.
+
+Результат - словарь, пригодный для json.dump; compare_results
+сравнивает два таких результата, например до и после изменения.
+"""
+import datetime
+import itertools
+import platform
+import statistics
+import time
+from contextlib import ExitStack, contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional
+from urllib.parse import urlencode
+
+import django
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from cash_flow.counting import estimated_count
+from cash_flow.db_routing import replica_aliases
+from cash_flow.models import CashFlowRecord, Status
+from cash_flow.row_cache import row_cache
+
+# Фильтры списка записей; сценарии строятся для каждого их сочетания.
+LIST_FILTERS = ("date", "status", "type", "category", "subcategory", "search")
+
+
+@dataclass
+class Case:
+    """ Сценарий: один HTTP-запрос """
+    name: str
+    path: str
+    method: str = "get"
+    data: Optional[dict] = None
+    json: bool = False
+    rollback: bool = False
+    # Подготовка перед каждым выполнением, в замер не входит.
+    before: Optional[Callable[[], None]] = None
+
+
+@dataclass
+class CaseResult:
+    name: str
+    method: str
+    path: str
+    status: int
+    runs: int
+    mean_ms: float
+    p50_ms: float
+    p95_ms: float
+    min_ms: float
+    max_ms: float
+    queries: int
+    db_ms: float
+    bytes: int
+
+
+@dataclass
+class Sample:
+    """ Значения фильтров и записи, на которых строятся сценарии """
+    record: CashFlowRecord
+    status_id: int
+    date_from: datetime.date
+    date_to: datetime.date
+    search: str
+    params: Dict[str, dict] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, search: str) -> "Sample":
+        record = (
+            CashFlowRecord.objects.order_by("-effective_date", "-id")
+            .filter(status__isnull=False).first()
+            or CashFlowRecord.objects.order_by("-effective_date", "-id")
+            .first()
+        )
+        if record is None:
+            raise ValueError(
+                "Нет записей для замеров: "
+                "python manage.py generate_cashflow_data"
+            )
+        status_id = record.status_id or (
+            Status.objects.values_list("id", flat=True).first()
+        )
+        sample = cls(
+            record=record,
+            status_id=status_id,
+            date_from=record.effective_date - datetime.timedelta(days=30),
+            date_to=record.effective_date,
+            search=search,
+        )
+        sample.params = {
+            "date": {
+                "date_from": sample.date_from.isoformat(),
+                "date_to": sample.date_to.isoformat(),
+            },
+            "status": {"status": status_id},
+            "type": {"type": record.type_id},
+            "category": {"category": record.category_id},
+            "subcategory": {"subcategory": record.subcategory_id},
+            "search": {"search": search},
+        }
+        return sample
+
+    def query(self, names: Iterable[str], **extra) -> str:
+        params = {}
+        for name in names:
+            params.update(self.params[name])
+        params.update(extra)
+        return urlencode(params)
+
+    def form_data(self, **overrides) -> dict:
+        record = self.record
+        return {
+            "custom_date": self.date_to.isoformat(),
+            "status": self.status_id or "",
+            "type": record.type_id,
+            "category": record.category_id,
+            "subcategory": record.subcategory_id,
+            "amount": "1234.56",
+            "comment": "Замер производительности",
+            **overrides,
+        }
+
+
+def build_cases(sample: Sample) -> List[Case]:
+    record = sample.record
+    list_url = reverse("cashflow:cashflow_list")
+    cases = []
+    for size in range(len(LIST_FILTERS) + 1):
+        for names in itertools.combinations(LIST_FILTERS, size):
+            cases.append(Case(
+                f"list[{'+'.join(names) or 'all'}]",
+                f"{list_url}?{sample.query(names)}",
+            ))
+    # Большая страница без кэша строк и с ним: разница - время
+    # рендеринга строк таблицы.
+    rows_url = f"{list_url}?page_size=200"
+    cases += [
+        Case("list_rows_uncached", rows_url, before=row_cache.clear),
+        Case("list_rows_cached", rows_url),
+    ]
+
+    create_url = reverse("cashflow:cashflow_create")
+    update_url = reverse("cashflow:cashflow_update", args=[record.pk])
+    records_url = reverse("cashflow_api:cashflowrecord-list")
+    record_url = reverse(
+        "cashflow_api:cashflowrecord-detail", args=[record.pk]
+    )
+    export_url = reverse("cashflow:cashflow_export")
+    cases += [
+        Case("record_create_form", create_url),
+        Case(
+            "record_create_submit", create_url, "post",
+            sample.form_data(), rollback=True,
+        ),
+        Case("record_update_form", update_url),
+        Case(
+            "record_update_submit", update_url, "post",
+            sample.form_data(amount=str(record.amount)), rollback=True,
+        ),
+        Case(
+            "load_categories",
+            f"{reverse('cashflow:load_categories')}"
+            f"?type_id={record.type_id}",
+        ),
+        Case(
+            "load_subcategories",
+            f"{reverse('cashflow:ajax_load_subcategories')}"
+            f"?category_id={record.category_id}",
+        ),
+        Case(
+            "load_categories_async",
+            f"{reverse('cashflow:load_categories_async')}"
+            f"?type_id={record.type_id}",
+        ),
+        Case(
+            "load_subcategories_async",
+            f"{reverse('cashflow:ajax_load_subcategories_async')}"
+            f"?category_id={record.category_id}",
+        ),
+        Case("directory_view", reverse("cashflow:directories")),
+        Case("directory_tree", reverse("cashflow:directory_tree")),
+        Case("api_records", f"{records_url}?page_size=50"),
+        Case(
+            "api_records_filtered",
+            f"{records_url}?"
+            f"{sample.query(('date', 'type', 'category'), page_size=50)}",
+        ),
+        Case(
+            "api_records_search",
+            f"{records_url}?{sample.query(('search',), page_size=50)}",
+        ),
+        Case(
+            "api_records_async",
+            f"{reverse('cashflow_api:records_async')}?page_size=50",
+        ),
+        Case("api_record_detail", record_url),
+        Case(
+            "api_record_create", records_url, "post",
+            sample.form_data(), json=True, rollback=True,
+        ),
+        Case(
+            "api_record_update", record_url, "patch",
+            {"amount": str(record.amount)}, json=True, rollback=True,
+        ),
+        Case(
+            "api_report",
+            f"{reverse('cashflow_api:reports')}"
+            "?period=month&group_by=category",
+        ),
+        Case(
+            "api_report_filtered",
+            f"{reverse('cashflow_api:reports')}?"
+            f"{sample.query(('date', 'type'), period='day')}",
+        ),
+        Case(
+            "export_csv",
+            f"{export_url}?{sample.query(('date',), format='csv')}",
+        ),
+        Case(
+            "export_xlsx",
+            f"{export_url}?{sample.query(('date',), format='xlsx')}",
+        ),
+    ]
+    return cases
+
+
+@contextmanager
+def capture_queries():
+    """ Запросы ко всем БД, куда может уйти чтение: основной и репликам """
+    with ExitStack() as stack:
+        yield [
+            stack.enter_context(CaptureQueriesContext(connections[alias]))
+            for alias in (DEFAULT_DB_ALIAS, *replica_aliases())
+        ]
+
+
+def _request(client: Client, case: Case):
+    method = getattr(client, case.method)
+    if case.json:
+        return method(case.path, case.data, content_type="application/json")
+    if case.data is not None:
+        return method(case.path, case.data)
+    return method(case.path)
+
+
+def _fetch(client: Client, case: Case):
+    response = _request(client, case)
+    body = (
+        b"".join(response.streaming_content)
+        if response.streaming else response.content
+    )
+    return response, body
+
+
+def _run_once(client: Client, case: Case):
+    if case.before:
+        case.before()
+    with capture_queries() as contexts:
+        started = time.perf_counter()
+        if case.rollback:
+            with transaction.atomic():
+                response, body = _fetch(client, case)
+                transaction.set_rollback(True)
+        else:
+            response, body = _fetch(client, case)
+        elapsed = time.perf_counter() - started
+    queries = [query for context in contexts for query in context]
+    db_time = sum(float(query["time"]) for query in queries)
+    return elapsed, response.status_code, len(queries), db_time, len(body)
+
+
+def run_case(case: Case, repeat: int, warmup: int = 1) -> CaseResult:
+    client = Client()
+    for _ in range(warmup):
+        _run_once(client, case)
+    runs = [_run_once(client, case) for _ in range(repeat)]
+    timings = sorted(run[0] * 1000 for run in runs)
+    _, status, queries, db_time, size = runs[-1]
+    return CaseResult(
+        name=case.name,
+        method=case.method.upper(),
+        path=case.path,
+        status=status,
+        runs=repeat,
+        mean_ms=round(statistics.fmean(timings), 3),
+        p50_ms=round(statistics.median(timings), 3),
+        p95_ms=round(timings[max(0, int(len(timings) * 0.95) - 1)], 3),
+        min_ms=round(timings[0], 3),
+        max_ms=round(timings[-1], 3),
+        queries=queries,
+        db_ms=round(db_time * 1000, 3),
+        bytes=size,
+    )
+
+
+def run_benchmarks(
+        repeat: int = 5,
+        warmup: int = 1,
+        only: Optional[List[str]] = None,
+        search: str = "аренды",
+        label: str = "",
+        progress=None,
+) -> dict:
+    """
+    Выполняет сценарии (only - подстроки имён для отбора)
+    и возвращает результат с описанием окружения.
+    """
+    sample = Sample.load(search)
+    cases = [
+        case for case in build_cases(sample)
+        if not only or any(part in case.name for part in only)
+    ]
+    results = []
+    for case in cases:
+        result = run_case(case, repeat, warmup)
+        results.append(result)
+        if progress:
+            progress(result)
+    connection = connections[DEFAULT_DB_ALIAS]
+    return {
+        "meta": {
+            "label": label,
+            "started_at": datetime.datetime.now().isoformat(
+                timespec="seconds"
+            ),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "replicas": replica_aliases(),
+            "records": estimated_count(CashFlowRecord.objects.all()),
+            "repeat": repeat,
+            "warmup": warmup,
+        },
+        "results": [asdict(result) for result in results],
+    }
+
+
+def compare_results(
+        baseline: dict, current: dict, tolerance: float = 0.2
+) -> List[dict]:
+    """
+    Сценарии, общие для двух результатов: изменение медианы и числа
+    запросов. regression - медиана выросла больше чем на tolerance
+    (доля) или запросов стало больше.
+    """
+    previous = {result["name"]: result for result in baseline["results"]}
+    changes = []
+    for result in current["results"]:
+        before = previous.get(result["name"])
+        if before is None:
+            continue
+        ratio = (
+            result["p50_ms"] / before["p50_ms"] if before["p50_ms"] else 1.0
+        )
+        changes.append({
+            "name": result["name"],
+            "p50_ms": [before["p50_ms"], result["p50_ms"]],
+            "queries": [before["queries"], result["queries"]],
+            "ratio": round(ratio, 3),
+            "regression": (
+                ratio > 1 + tolerance
+                or result["queries"] > before["queries"]
+            ),
+        })
+    return changes
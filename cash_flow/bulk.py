@@ -0,0 +1,236 @@
+"""
+Массовое создание, изменение и удаление записей ДДС.
+
+Каждый элемент проверяется лёгким сериализатором без обращений к БД,
+справочники для всего запроса загружаются одним набором запросов,
+а запись идёт через bulk_create/bulk_update в одной транзакции.
+"""
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+from django.db import router, transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from cash_flow.metrics import ingest_batch_duration, ingested_records
+from cash_flow.models import (
+    CashFlowDailyRollup,
+    CashFlowRecord,
+    add_rollup_deltas,
+)
+from cash_flow.validation import validate_records
+
+BULK_BATCH_SIZE = 1000
+
+RECORD_FIELDS = (
+    "custom_date", "status", "type", "category", "subcategory",
+    "amount", "comment",
+)
+
+
+class BulkRecordSerializer(serializers.Serializer):
+    """
+    Разбор одного элемента массового запроса.
+    Справочники принимаются идентификаторами и здесь в БД не проверяются.
+    """
+    id = serializers.IntegerField(required=False)
+    custom_date = serializers.DateField(required=False, allow_null=True)
+    status = serializers.IntegerField(required=False, allow_null=True)
+    type = serializers.IntegerField()
+    category = serializers.IntegerField()
+    subcategory = serializers.IntegerField()
+    amount = serializers.DecimalField(max_digits=12, decimal_places=2)
+    comment = serializers.CharField(
+        required=False, allow_null=True, allow_blank=True
+    )
+
+
+@dataclass
+class BulkResult:
+    ids: List[int] = field(default_factory=list)
+    errors: List[Dict[str, Any]] = field(default_factory=list)
+    applied: bool = True
+
+
+def _parse(items, partial=False):
+    """ Разбирает элементы, возвращает [(индекс, данные)] и ошибки """
+    parsed, errors = [], []
+    for index, item in enumerate(items):
+        serializer = BulkRecordSerializer(data=item, partial=partial)
+        if serializer.is_valid():
+            parsed.append((index, serializer.validated_data))
+        else:
+            errors.append({"index": index, "errors": serializer.errors})
+    return parsed, errors
+
+
+def _to_record_kwargs(payload):
+    kwargs = {}
+    for name in RECORD_FIELDS:
+        if name in payload:
+            key = f"{name}_id" if name in (
+                "status", "type", "category", "subcategory"
+            ) else name
+            kwargs[key] = payload[name]
+    return kwargs
+
+
+def _record_payload(record):
+    return {
+        "custom_date": record.custom_date,
+        "status": record.status_id,
+        "type": record.type_id,
+        "category": record.category_id,
+        "subcategory": record.subcategory_id,
+        "amount": record.amount,
+    }
+
+
+def _finish(result, errors, atomic):
+    result.errors = sorted(errors, key=lambda e: e["index"])
+    result.applied = not (atomic and errors)
+    return result
+
+
+def bulk_create_records(items, atomic=True) -> BulkResult:
+    """
+    Создаёт записи ДДС из списка словарей.
+
+    Args:
+        items: элементы в формате API записей (справочники - id).
+        atomic: True - при любой ошибке ничего не сохраняется,
+            False - сохраняются только корректные элементы.
+    """
+    parsed, errors = _parse(items)
+    records = []
+    for (position, payload), item_errors in zip(
+            parsed, validate_records(payload for _, payload in parsed)
+    ):
+        if item_errors:
+            errors.append({"index": position, "errors": item_errors})
+            continue
+        payload.pop("id", None)
+        record = CashFlowRecord(**_to_record_kwargs(payload))
+        record.effective_date = record.compute_effective_date()
+        records.append(record)
+
+    using = router.db_for_write(CashFlowRecord)
+    started = time.perf_counter()
+    with transaction.atomic(using=using):
+        result = BulkResult()
+        if not (atomic and errors):
+            CashFlowRecord.objects.using(using).bulk_create(
+                records, batch_size=BULK_BATCH_SIZE
+            )
+            CashFlowDailyRollup.objects.apply_deltas(
+                add_rollup_deltas({}, (r._rollup_values() for r in records)),
+                using=using,
+            )
+            result.ids = [record.pk for record in records]
+        result = _finish(result, errors, atomic)
+    if result.applied:
+        ingest_batch_duration.labels("bulk").observe(
+            time.perf_counter() - started
+        )
+    ingested_records.labels("bulk", "imported").inc(len(result.ids))
+    ingested_records.labels("bulk", "rejected").inc(
+        len(records) + len(errors) - len(result.ids)
+    )
+    return result
+
+
+def bulk_update_records(items, atomic=True) -> BulkResult:
+    """
+    Частично изменяет записи ДДС. Каждый элемент обязан содержать id,
+    остальные поля - только изменяемые.
+    """
+    parsed, errors = _parse(items, partial=True)
+    with_ids = []
+    for position, payload in parsed:
+        if payload.get("id") is None:
+            errors.append({"index": position, "errors": {
+                "id": ["Обязательное поле."]
+            }})
+        else:
+            with_ids.append((position, payload))
+
+    using = router.db_for_write(CashFlowRecord)
+    with transaction.atomic(using=using):
+        existing = CashFlowRecord.objects.using(using).select_for_update(
+        ).in_bulk([payload["id"] for _, payload in with_ids])
+
+        merged = []
+        for position, payload in with_ids:
+            record = existing.get(payload["id"])
+            if record is None:
+                errors.append({"index": position, "errors": {
+                    "id": [f"Запись с id={payload['id']} не существует"]
+                }})
+                continue
+            merged.append((
+                position, record, payload,
+                {**_record_payload(record), **payload}
+            ))
+
+        deltas, records, fields = {}, [], set()
+        # bulk_update не заполняет auto_now-поля сам.
+        updated_at = timezone.now()
+        for (position, record, payload, _), item_errors in zip(
+                merged, validate_records(full for _, _, _, full in merged)
+        ):
+            if item_errors:
+                errors.append({"index": position, "errors": item_errors})
+                continue
+            add_rollup_deltas(deltas, [record._rollup_values()], sign=-1)
+            payload.pop("id")
+            changes = _to_record_kwargs(payload)
+            for name, value in changes.items():
+                setattr(record, name, value)
+            record.effective_date = record.compute_effective_date()
+            record.updated_at = updated_at
+            add_rollup_deltas(deltas, [record._rollup_values()])
+            fields.update(changes)
+            records.append(record)
+
+        result = BulkResult()
+        if records and not (atomic and errors):
+            CashFlowRecord.objects.using(using).bulk_update(
+                records, [*fields, "effective_date", "updated_at"],
+                batch_size=BULK_BATCH_SIZE
+            )
+            CashFlowDailyRollup.objects.apply_deltas(deltas, using=using)
+            result.ids = [record.pk for record in records]
+        return _finish(result, errors, atomic)
+
+
+def bulk_delete_records(ids, atomic=True) -> BulkResult:
+    """ Удаляет записи ДДС по списку id """
+    errors, valid_ids = [], []
+    for position, value in enumerate(ids):
+        if isinstance(value, int) and not isinstance(value, bool):
+            valid_ids.append((position, value))
+        else:
+            errors.append({"index": position, "errors": {
+                "id": ["Ожидается целое число"]
+            }})
+
+    using = router.db_for_write(CashFlowRecord)
+    with transaction.atomic(using=using):
+        queryset = CashFlowRecord.objects.using(using).filter(
+            id__in=[pk for _, pk in valid_ids]
+        )
+        found = set(
+            queryset.select_for_update().values_list("id", flat=True)
+        )
+        for position, pk in valid_ids:
+            if pk not in found:
+                errors.append({"index": position, "errors": {
+                    "id": [f"Запись с id={pk} не существует"]
+                }})
+
+        result = BulkResult()
+        if found and not (atomic and errors):
+            queryset.delete()
+            result.ids = sorted(found)
+        return _finish(result, errors, atomic)
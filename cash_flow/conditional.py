@@ -0,0 +1,89 @@
+"""
+ETag и Last-Modified списка записей ДДС и /api/records/.
+
+Валидаторы строятся по меткам изменений месяцев (RecordChangeMarker),
+попадающих в период фильтра, - одним агрегатом по небольшой таблице,
+без запроса к самим записям. Декоратор condition сравнивает их
+с If-None-Match/If-Modified-Since и при совпадении отвечает 304,
+не вызывая представление: ни основного запроса, ни сериализации.
+
+В ETag входят все параметры запроса (фильтры, курсор, размер
+страницы), Accept и сумма версий меток. Страница списка показывает
+ещё названия справочников и остаток по всем записям, поэтому её ETag
+зависит от etag справочников и меток всех месяцев, а Last-Modified
+у неё нет: переименование справочника не меняет время изменения
+записей.
+"""
+import datetime
+import hashlib
+import json
+from typing import Optional, Tuple
+
+from django.db import router
+from django.http import HttpRequest
+from django.utils.dateparse import parse_date
+from django.utils.translation import get_language
+
+from cash_flow.directory_cache import get_directory
+from cash_flow.models import RecordChangeMarker
+
+
+def _date(request: HttpRequest, name: str) -> Optional[datetime.date]:
+    try:
+        return parse_date(request.GET.get(name) or "")
+    except ValueError:
+        return None
+
+
+def change_state(
+        request: HttpRequest, whole_table: bool = False
+) -> Tuple[int, Optional[datetime.datetime]]:
+    """
+    Сумма версий и время последнего изменения меток периода
+    из date_from/date_to запроса (whole_table - всех месяцев).
+    Считается один раз за запрос.
+    """
+    attribute = f"_record_change_state_{'all' if whole_table else 'period'}"
+    state = getattr(request, attribute, None)
+    if state is None:
+        markers = RecordChangeMarker.objects.using(
+            router.db_for_read(RecordChangeMarker)
+        )
+        if whole_table:
+            state = markers.state()
+        else:
+            state = markers.state(
+                _date(request, "date_from"), _date(request, "date_to")
+            )
+        setattr(request, attribute, state)
+    return state
+
+
+def _etag(request: HttpRequest, kind: str, state, *extra) -> str:
+    version, changed_at = state
+    payload = json.dumps(
+        [
+            kind, sorted(request.GET.lists()),
+            request.META.get("HTTP_ACCEPT", ""), version, changed_at,
+            *extra,
+        ],
+        ensure_ascii=False, default=str,
+    )
+    return f'"{hashlib.sha1(payload.encode()).hexdigest()}"'
+
+
+def record_list_etag(request: HttpRequest, *args, **kwargs) -> str:
+    return _etag(
+        request, "list", change_state(request, whole_table=True),
+        get_directory().etag, get_language(),
+    )
+
+
+def api_records_etag(request: HttpRequest, *args, **kwargs) -> str:
+    return _etag(request, "api", change_state(request))
+
+
+def api_records_last_modified(
+        request: HttpRequest, *args, **kwargs
+) -> Optional[datetime.datetime]:
+    return change_state(request)[1]
@@ -0,0 +1,124 @@
+"""
+Оценка количества строк без полного COUNT(*).
+
+На больших таблицах точный подсчёт читает все подходящие строки,
+поэтому на PostgreSQL берётся оценка: для запросов без фильтров -
+из статистики таблицы (pg_class.reltuples), для запросов с фильтрами -
+ожидаемое число строк из плана (EXPLAIN). Если оценка меньше порога,
+а также на других БД выполняется обычный COUNT(*): на малых объёмах
+он дёшев, а оценка планировщика там менее точна.
+"""
+import json
+from dataclasses import dataclass
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.db.models.query import QuerySet
+
+
+def table_row_estimate(model, using: str) -> Optional[int]:
+    """
+    Оценка числа строк таблицы модели по статистике PostgreSQL
+    (вместе с секциями, если таблица секционирована).
+    None - оценка недоступна.
+    """
+    connection = connections[using]
+    if connection.vendor != "postgresql":
+        return None
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        # reltuples = -1 у ещё не проанализированных таблиц.
+        cursor.execute(
+            "SELECT SUM(GREATEST(c.reltuples, 0))::bigint FROM pg_class c "
+            "WHERE c.oid = %s::regclass OR c.oid IN ("
+            "SELECT inhrelid FROM pg_inherits WHERE inhparent = %s::regclass"
+            ")",
+            [table, table],
+        )
+        row = cursor.fetchone()
+    return row[0] if row and row[0] is not None else None
+
+
+def is_unfiltered(queryset: QuerySet) -> bool:
+    """ Запрос выбирает все строки таблицы """
+    query = queryset.query
+    return (
+        not query.where
+        and not query.distinct
+        and query.low_mark == 0
+        and query.high_mark is None
+        and not query.combinator
+    )
+
+
+def query_row_estimate(queryset: QuerySet) -> Optional[int]:
+    """
+    Ожидаемое число строк запроса по плану PostgreSQL.
+    None - оценка недоступна.
+    """
+    connection = connections[queryset.db]
+    if (
+            connection.vendor != "postgresql"
+            or queryset.query.is_sliced
+            or queryset.query.combinator
+    ):
+        return None
+    sql, params = queryset.order_by().values("pk").query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+@dataclass(frozen=True)
+class RowCount:
+    """ Количество строк; exact = False - оценка """
+    value: int
+    exact: bool = True
+
+    @property
+    def display(self) -> int:
+        """ Для оценки - округление до трёх значащих цифр """
+        if self.exact or self.value < 1000:
+            return self.value
+        return round(self.value, 3 - len(str(self.value)))
+
+    def __str__(self) -> str:
+        return str(self.value) if self.exact else f"около {self.display}"
+
+
+def count_rows(
+        queryset: QuerySet, threshold: Optional[int] = None
+) -> RowCount:
+    """
+    Количество строк запроса: оценка (см. описание модуля), если она
+    не меньше threshold, иначе COUNT(*).
+    """
+    if threshold is None:
+        threshold = settings.CASHFLOW_ESTIMATED_COUNT_THRESHOLD
+    if is_unfiltered(queryset):
+        estimate = table_row_estimate(queryset.model, queryset.db)
+    else:
+        estimate = query_row_estimate(queryset)
+    if estimate is not None and estimate >= threshold:
+        return RowCount(estimate, exact=False)
+    return RowCount(queryset.count())
+
+
+async def acount_rows(
+        queryset: QuerySet, threshold: Optional[int] = None
+) -> RowCount:
+    """
+    count_rows для асинхронных представлений: оценка читается
+    курсором напрямую, поэтому подсчёт выполняется в потоке.
+    """
+    return await sync_to_async(count_rows)(queryset, threshold)
+
+
+def estimated_count(queryset: QuerySet, threshold: Optional[int] = None) -> int:
+    """ Количество строк запроса числом, см. count_rows """
+    return count_rows(queryset, threshold).value
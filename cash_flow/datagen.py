@@ -0,0 +1,223 @@
+"""
+Синтетические данные ДДС для нагрузочных проверок.
+
+Справочники строятся по шаблону, похожему на реальный учёт (плюс
+при необходимости дополнительные категории), записи генерируются
+потоком и загружаются тем же RecordImporter, что и импорт файлов:
+пачками, через COPY на PostgreSQL, с дневными итогами. Одинаковые
+seed, количество и период дают одинаковый набор записей.
+
+Распределения: списаний больше, чем пополнений; популярность категорий
+и подкатегорий убывает по закону Ципфа; суммы - логнормальные;
+часть записей без статуса, без комментария или без даты (дата
+операции - дата загрузки).
+"""
+import datetime
+import itertools
+import random
+from decimal import Decimal
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from django.db import transaction
+
+from cash_flow.directory_cache import directory_cache
+from cash_flow.importer import ImportStats, RecordImporter
+from cash_flow.models import Category, Status, SubCategory, Type
+from cash_flow.months import add_months, month_start
+from cash_flow.partitions import create_partition, is_partitioned
+
+STATUSES = ("Бизнес", "Личное", "Налог")
+# Типы шаблона, уменьшающие остаток (Type.is_expense).
+EXPENSE_TYPES = ("Списание",)
+
+# Тип -> категория -> подкатегории, в порядке убывания популярности.
+DIRECTORY_TEMPLATE = {
+    "Списание": {
+        "Маркетинг": ["Avito", "Farpost", "Контекстная реклама", "SMM"],
+        "Инфраструктура": ["VPS", "Proxy", "Домены", "SaaS-сервисы"],
+        "Зарплата": ["Оклад", "Премии", "Подрядчики"],
+        "Офис": ["Аренда", "Коммунальные услуги", "Канцелярия"],
+        "Логистика": ["Доставка", "Склад", "Упаковка"],
+        "Налоги": ["НДС", "НДФЛ", "Страховые взносы"],
+    },
+    "Пополнение": {
+        "Продажи": ["Avito", "Farpost", "Сайт", "Маркетплейсы"],
+        "Инвестиции": ["Дивиденды", "Проценты по вкладам"],
+        "Возвраты": ["Возврат от поставщика", "Возврат налога"],
+    },
+}
+
+# Доля записей по типам.
+TYPE_WEIGHTS = {"Списание": 0.7, "Пополнение": 0.3}
+# Параметры логнормального распределения сумм (mu, sigma) по типам.
+AMOUNT_PARAMS = {"Списание": (8.0, 1.2), "Пополнение": (9.0, 1.3)}
+AMOUNT_MAX = Decimal("9999999999.99")
+
+COMMENTS = (
+    "Оплата аренды офиса",
+    "Продление сервера",
+    "Закупка товара у поставщика",
+    "Возврат средств клиенту",
+    "Комиссия банка за перевод",
+    "Реклама в социальных сетях",
+    "Оплата услуг подрядчика",
+    "Перевод между счетами",
+    "Поступление оплаты от клиента",
+    "Выплата зарплаты сотрудникам",
+    "Оплата доставки заказа",
+    "Ежемесячная подписка",
+)
+
+EXTRA_SUBCATEGORIES = 5
+
+Template = Dict[str, Dict[str, List[str]]]
+
+
+def directory_template(extra_categories: int = 0) -> Template:
+    """
+    Шаблон справочников; extra_categories добавляет в каждый тип
+    столько категорий по EXTRA_SUBCATEGORIES подкатегорий.
+    """
+    template = {
+        type_name: {name: list(subs) for name, subs in categories.items()}
+        for type_name, categories in DIRECTORY_TEMPLATE.items()
+    }
+    for type_name, categories in template.items():
+        for number in range(1, extra_categories + 1):
+            categories[f"{type_name} {number}"] = [
+                f"Статья {number}.{sub}"
+                for sub in range(1, EXTRA_SUBCATEGORIES + 1)
+            ]
+    return template
+
+
+def ensure_directories(template: Template):
+    """ Создаёт недостающие справочники шаблона, существующие не меняет """
+    with transaction.atomic():
+        for name in STATUSES:
+            Status.objects.get_or_create(name=name)
+        for type_name, categories in template.items():
+            record_type, _ = Type.objects.get_or_create(
+                name=type_name,
+                defaults={"is_expense": type_name in EXPENSE_TYPES},
+            )
+            for category_name, subcategories in categories.items():
+                category, _ = Category.objects.get_or_create(
+                    name=category_name, type=record_type
+                )
+                existing = set(category.subcategories.values_list(
+                    "name", flat=True
+                ))
+                SubCategory.objects.bulk_create([
+                    SubCategory(name=name, category=category)
+                    for name in subcategories if name not in existing
+                ])
+    # bulk_create не отправляет сигналы, сбрасывающие кэш справочников.
+    directory_cache.invalidate()
+
+
+def _zipf_weights(count: int) -> List[float]:
+    return [1 / rank for rank in range(1, count + 1)]
+
+
+def generate_rows(
+        count: int,
+        seed: int,
+        start: datetime.date,
+        end: datetime.date,
+        template: Template,
+) -> Iterator[Tuple[int, dict]]:
+    """
+    Строки записей в формате RecordImporter.run: (номер, словарь
+    с названиями справочников и строковыми значениями).
+    """
+    rng = random.Random(seed)
+    days = (end - start).days
+    type_names = list(template)
+    type_weights = list(itertools.accumulate(
+        TYPE_WEIGHTS.get(name, 0.1) for name in type_names
+    ))
+    categories = {
+        name: (list(items.items()), list(itertools.accumulate(
+            _zipf_weights(len(items))
+        )))
+        for name, items in template.items()
+    }
+    subcategory_weights = {
+        size: list(itertools.accumulate(_zipf_weights(size)))
+        for size in {
+            len(subs) for items in template.values()
+            for subs in items.values()
+        }
+    }
+    statuses = list(STATUSES)
+    status_weights = list(itertools.accumulate(
+        _zipf_weights(len(statuses))
+    ))
+
+    for line_number in range(1, count + 1):
+        type_name = rng.choices(type_names, cum_weights=type_weights)[0]
+        items, weights = categories[type_name]
+        category_name, subcategories = rng.choices(
+            items, cum_weights=weights
+        )[0]
+        subcategory = rng.choices(
+            subcategories,
+            cum_weights=subcategory_weights[len(subcategories)],
+        )[0]
+        mu, sigma = AMOUNT_PARAMS.get(type_name, (8.0, 1.2))
+        amount = min(
+            Decimal(f"{rng.lognormvariate(mu, sigma):.2f}"), AMOUNT_MAX
+        )
+        date = (
+            start + datetime.timedelta(days=rng.randint(0, days))
+            if rng.random() >= 0.02 else None
+        )
+        status = (
+            rng.choices(statuses, cum_weights=status_weights)[0]
+            if rng.random() >= 0.1 else ""
+        )
+        comment = (
+            f"{rng.choice(COMMENTS)}: {subcategory}"
+            if rng.random() < 0.7 else ""
+        )
+        yield line_number, {
+            "date": date.isoformat() if date else "",
+            "status": status,
+            "type": type_name,
+            "category": category_name,
+            "subcategory": subcategory,
+            "amount": str(amount),
+            "comment": comment,
+        }
+
+
+def generate_records(
+        count: int,
+        seed: int = 42,
+        start: Optional[datetime.date] = None,
+        end: Optional[datetime.date] = None,
+        extra_categories: int = 0,
+        batch_size: Optional[int] = None,
+        progress=None,
+        using: Optional[str] = None,
+) -> ImportStats:
+    """
+    Создаёт справочники шаблона и загружает count случайных записей
+    с датами операций в [start, end] (по умолчанию - три года до сегодня).
+    """
+    end = end or datetime.date.today()
+    start = start or end - datetime.timedelta(days=3 * 365)
+    template = directory_template(extra_categories)
+    ensure_directories(template)
+
+    importer = RecordImporter(
+        batch_size=batch_size, progress=progress, using=using
+    )
+    if is_partitioned(importer.using):
+        # Иначе записи прошлых месяцев попадут в секцию по умолчанию.
+        month = month_start(start)
+        while month <= end:
+            create_partition(month, importer.using)
+            month = add_months(month, 1)
+    return importer.run(generate_rows(count, seed, start, end, template))
@@ -0,0 +1,255 @@
+"""
+Маршрутизация чтения на реплики PostgreSQL.
+
+Чтение моделей cash_flow уходит на реплику только внутри безопасных
+(GET/HEAD/OPTIONS) запросов к представлениям, помеченным как только
+читающие (см. replica_view). Запись, чтение внутри транзакции на основной БД,
+чтение в течение CASHFLOW_STICKY_PRIMARY_SECONDS после записи в той же
+сессии и всё, что выполняется вне запроса (команды, shell), идёт
+на основную БД. Реплики периодически проверяются на доступность
+и отставание; неисправная реплика исключается до следующей проверки.
+"""
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, router
+
+logger = logging.getLogger(__name__)
+
+STICKY_SESSION_KEY = "cash_flow:primary_until"
+REPLICA_APP_LABELS = ("cash_flow",)
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+@dataclass
+class RoutingState:
+    """
+    Состояние маршрутизации в рамках одного запроса.
+    replica_allowed = None - ещё не решено: решение принимается
+    при первом чтении, поэтому запросы без обращений к БД
+    не читают сессию.
+    """
+    request: Any = None
+    replica_allowed: Optional[bool] = None
+    alias: Optional[str] = None
+    wrote: bool = False
+
+
+_state: ContextVar[Optional[RoutingState]] = ContextVar(
+    "cash_flow_db_routing", default=None
+)
+
+
+def begin_request(request=None):
+    """ Новое состояние для запроса; возвращает токен для end_request """
+    return _state.set(RoutingState(request=request))
+
+
+def end_request(token) -> bool:
+    """ Сбрасывает состояние, возвращает True, если запрос писал в БД """
+    state = _state.get()
+    _state.reset(token)
+    return bool(state and state.wrote)
+
+
+def replica_view(view_func):
+    """ Помечает функцию-представление как читающую с реплики """
+    view_func.read_replica = True
+    return view_func
+
+
+def view_allows_replica(view_func) -> bool:
+    """
+    Представление помечено атрибутом read_replica: функция -
+    декоратором replica_view, класс - атрибутом класса.
+    """
+    if getattr(view_func, "read_replica", False):
+        return True
+    view_class = (
+        getattr(view_func, "view_class", None)
+        or getattr(view_func, "cls", None)
+    )
+    return bool(getattr(view_class, "read_replica", False))
+
+
+def request_allows_replica(request) -> bool:
+    match = getattr(request, "resolver_match", None)
+    return bool(
+        request.method in SAFE_METHODS
+        and match is not None
+        and view_allows_replica(match.func)
+        and not is_primary_sticky(request)
+    )
+
+
+@contextmanager
+def replica_reads():
+    """
+    Чтение с реплики вне HTTP-запроса, например в команде выгрузки.
+    """
+    token = _state.set(RoutingState(replica_allowed=True))
+    try:
+        yield
+    finally:
+        _state.reset(token)
+
+
+async def adb_for_read(model) -> str:
+    """
+    БД для чтения model в асинхронном представлении. Решение
+    о реплике читает сессию и проверяет реплику синхронными запросами,
+    поэтому принимается в потоке; выбранная БД запоминается
+    в состоянии запроса, и дальнейшие вызовы роутера (поля форм,
+    запросы ORM) обходятся без ввода-вывода в цикле событий.
+    """
+    return await sync_to_async(router.db_for_read)(model)
+
+
+def replica_aliases() -> List[str]:
+    return list(settings.CASHFLOW_REPLICA_DATABASES)
+
+
+def replica_lag(alias: str) -> float:
+    """
+    Отставание реплики в секундах. Реплика, воспроизведшая весь
+    полученный WAL, не отстаёт, даже если на основной БД давно
+    не было записей. Для других СУБД (SQLite для локальной проверки)
+    проверяется только соединение.
+    """
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        if connection.vendor != "postgresql":
+            cursor.execute("SELECT 1")
+            return 0.0
+        cursor.execute(
+            "SELECT CASE "
+            "WHEN NOT pg_is_in_recovery() THEN 0 "
+            "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+            "THEN 0 "
+            "ELSE COALESCE(EXTRACT(EPOCH FROM "
+            "now() - pg_last_xact_replay_timestamp()), 0) END"
+        )
+        return float(cursor.fetchone()[0])
+
+
+class ReplicaHealth:
+    """
+    Результаты проверки реплик, кэшируются в процессе
+    на CASHFLOW_REPLICA_CHECK_INTERVAL секунд.
+    """
+
+    def __init__(self):
+        self._results: Dict[str, Tuple[bool, float]] = {}
+        self._lock = threading.Lock()
+
+    def check(self, alias: str) -> Tuple[bool, Optional[float]]:
+        """ Проверяет реплику сейчас: (исправна, отставание) """
+        try:
+            lag = replica_lag(alias)
+        except DatabaseError:
+            logger.warning("Реплика %s недоступна", alias, exc_info=True)
+            connections[alias].close()
+            healthy, lag = False, None
+        else:
+            healthy = lag <= settings.CASHFLOW_REPLICA_MAX_LAG_SECONDS
+            if not healthy:
+                logger.warning("Реплика %s отстаёт на %.1f с", alias, lag)
+        with self._lock:
+            self._results[alias] = (healthy, time.monotonic())
+        return healthy, lag
+
+    def is_healthy(self, alias: str) -> bool:
+        result = self._results.get(alias)
+        if (
+                result is None
+                or time.monotonic() - result[1]
+                >= settings.CASHFLOW_REPLICA_CHECK_INTERVAL
+        ):
+            return self.check(alias)[0]
+        return result[0]
+
+    def reset(self):
+        with self._lock:
+            self._results.clear()
+
+
+replica_health = ReplicaHealth()
+
+
+def choose_replica() -> Optional[str]:
+    """ Случайная исправная реплика или None """
+    aliases = replica_aliases()
+    random.shuffle(aliases)
+    for alias in aliases:
+        if replica_health.is_healthy(alias):
+            return alias
+    return None
+
+
+def is_primary_sticky(request) -> bool:
+    session = getattr(request, "session", None)
+    return bool(
+        session is not None
+        and session.get(STICKY_SESSION_KEY, 0) > time.time()
+    )
+
+
+def mark_primary_sticky(request):
+    """ Следующие запросы сессии читают с основной БД """
+    session = getattr(request, "session", None)
+    if session is not None and settings.CASHFLOW_STICKY_PRIMARY_SECONDS:
+        session[STICKY_SESSION_KEY] = (
+            time.time() + settings.CASHFLOW_STICKY_PRIMARY_SECONDS
+        )
+
+
+class ReplicaRouter:
+    """
+    Роутер Django: запись - на основную БД, чтение моделей cash_flow -
+    на реплику, если текущий запрос это разрешает.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if (
+                state is None
+                or state.replica_allowed is False
+                or model._meta.app_label not in REPLICA_APP_LABELS
+                or not replica_aliases()
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        if state.replica_allowed is None:
+            state.replica_allowed = (
+                state.request is not None
+                and request_allows_replica(state.request)
+            )
+            if not state.replica_allowed:
+                return DEFAULT_DB_ALIAS
+        if state.alias is None:
+            # Реплика выбирается один раз на запрос, чтобы все чтения
+            # видели одно и то же состояние данных.
+            state.alias = choose_replica() or DEFAULT_DB_ALIAS
+        return state.alias
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and model._meta.app_label in REPLICA_APP_LABELS:
+            state.wrote = True
+            state.alias = None
+            state.replica_allowed = False
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
@@ -0,0 +1,338 @@
+"""
+Кэш справочников (статусы, типы, категории, подкатегории) в памяти процесса.
+
+Справочники меняются редко, а читаются на каждой странице, поэтому вся
+иерархия загружается одним снимком и переиспользуется до инвалидации.
+Инвалидация происходит по сигналам post_save/post_delete (см. signals.py).
+Сигналы срабатывают только в процессе, изменившем справочник, поэтому
+снимок старше CASHFLOW_DIRECTORY_TTL секунд перечитывается: изменения
+из других процессов видны не позже чем через TTL. При
+CASHFLOW_DIRECTORY_SHARED_VERSION = True дополнительно сверяется метка
+версии в общем кэше Django, и изменения видны сразу.
+"""
+import hashlib
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from cash_flow.metrics import cache_hit
+from cash_flow.models import Category, Status, SubCategory, Type
+
+DIRECTORY_VERSION_KEY = "cash_flow:directory_version"
+DIRECTORY_KINDS = ("statuses", "types", "categories", "subcategories")
+
+
+@dataclass(frozen=True)
+class DirectoryEntry:
+    """
+    Элемент справочника. parent_id - тип для категории
+    и категория для подкатегории, label - подпись как у __str__ модели.
+    """
+    id: int
+    name: str
+    parent_id: Optional[int] = None
+    label: str = ""
+
+    @property
+    def pk(self) -> int:
+        return self.id
+
+    def __str__(self) -> str:
+        return self.label or self.name
+
+
+class DirectorySnapshot:
+    """ Неизменяемый снимок всех справочников """
+
+    def __init__(
+            self,
+            statuses: Iterable[DirectoryEntry],
+            types: Iterable[DirectoryEntry],
+            categories: Iterable[DirectoryEntry],
+            subcategories: Iterable[DirectoryEntry],
+            version: int = 0,
+            stamp: Optional[str] = None,
+    ):
+        self.statuses = tuple(statuses)
+        self.types = tuple(types)
+        self.categories = tuple(categories)
+        self.subcategories = tuple(subcategories)
+        self.version = version
+        self.stamp = stamp
+        self.loaded_at = time.monotonic()
+        self._by_id: Dict[str, Dict[int, DirectoryEntry]] = {
+            kind: {entry.id: entry for entry in getattr(self, kind)}
+            for kind in DIRECTORY_KINDS
+        }
+        self._children: Dict[Tuple[str, int], List[DirectoryEntry]] = {}
+        for kind in ("categories", "subcategories"):
+            for entry in getattr(self, kind):
+                self._children.setdefault(
+                    (kind, entry.parent_id), []
+                ).append(entry)
+
+    @classmethod
+    def load(
+            cls,
+            version: int = 0,
+            stamp: Optional[str] = None,
+            using: Optional[str] = None,
+    ):
+        """
+        Загружает справочники четырьмя запросами без JOIN.
+        Снимок живёт в процессе до инвалидации, поэтому по умолчанию
+        читается с основной БД, а не с отстающей реплики.
+        """
+        rows = [
+            list(queryset) for queryset in cls._querysets(using)
+        ]
+        return cls._build(*rows, version=version, stamp=stamp)
+
+    @classmethod
+    async def aload(
+            cls,
+            version: int = 0,
+            stamp: Optional[str] = None,
+            using: Optional[str] = None,
+    ):
+        """ То же, что load, через асинхронный ORM """
+        rows = [
+            [row async for row in queryset]
+            for queryset in cls._querysets(using)
+        ]
+        return cls._build(*rows, version=version, stamp=stamp)
+
+    @staticmethod
+    def _querysets(using: Optional[str]):
+        using = using or DEFAULT_DB_ALIAS
+        return (
+            Status.objects.using(using).order_by("id").values_list(
+                "id", "name"
+            ),
+            Type.objects.using(using).order_by("id").values_list(
+                "id", "name"
+            ),
+            Category.objects.using(using).order_by("id").values_list(
+                "id", "name", "type_id"
+            ),
+            SubCategory.objects.using(using).order_by("id").values_list(
+                "id", "name", "category_id"
+            ),
+        )
+
+    @classmethod
+    def _build(
+            cls, status_rows, type_rows, category_rows, subcategory_rows,
+            version, stamp,
+    ):
+        statuses = [DirectoryEntry(pk, name) for pk, name in status_rows]
+        types = [DirectoryEntry(pk, name) for pk, name in type_rows]
+        type_names = {entry.id: entry.name for entry in types}
+        categories = [
+            DirectoryEntry(
+                pk, name, type_id, f"{name} ({type_names.get(type_id, '')})"
+            )
+            for pk, name, type_id in category_rows
+        ]
+        category_names = {entry.id: entry.name for entry in categories}
+        subcategories = [
+            DirectoryEntry(
+                pk, name, category_id,
+                f"{name} ({category_names.get(category_id, '')})"
+            )
+            for pk, name, category_id in subcategory_rows
+        ]
+        return cls(statuses, types, categories, subcategories, version, stamp)
+
+    def get(self, kind: str, pk) -> Optional[DirectoryEntry]:
+        return self._by_id[kind].get(pk)
+
+    @cached_property
+    def tree(self) -> dict:
+        """
+        Дерево Тип -> Категория -> Подкатегория и список статусов
+        для построения зависимых списков на клиенте.
+        """
+        return {
+            "statuses": [
+                {"id": entry.id, "name": entry.name}
+                for entry in self.statuses
+            ],
+            "types": [
+                {
+                    "id": type_entry.id,
+                    "name": type_entry.name,
+                    "categories": [
+                        {
+                            "id": category.id,
+                            "name": category.name,
+                            "subcategories": [
+                                {"id": sub.id, "name": sub.name}
+                                for sub in self.subcategories_for(category.id)
+                            ],
+                        }
+                        for category in self.categories_for(type_entry.id)
+                    ],
+                }
+                for type_entry in self.types
+            ],
+        }
+
+    @cached_property
+    def etag(self) -> str:
+        """
+        Хэш содержимого справочников: одинаков во всех процессах
+        для одинаковых данных, в отличие от локальной версии.
+        """
+        content = json.dumps(self.tree, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(content.encode()).hexdigest()
+
+    def categories_for(self, type_id: int) -> List[DirectoryEntry]:
+        return self._children.get(("categories", type_id), [])
+
+    def subcategories_for(self, category_id: int) -> List[DirectoryEntry]:
+        return self._children.get(("subcategories", category_id), [])
+
+
+class DirectoryCache:
+    """
+    Потокобезопасный держатель снимка справочников с версией.
+    """
+
+    def __init__(self):
+        self._snapshot: Optional[DirectorySnapshot] = None
+        self._version = 0
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self) -> bool:
+        return settings.CASHFLOW_DIRECTORY_SHARED_VERSION
+
+    @property
+    def _shared_cache(self):
+        return caches[settings.CASHFLOW_DIRECTORY_CACHE_ALIAS]
+
+    def _shared_stamp(self) -> Optional[str]:
+        if not self.shared:
+            return None
+        stamp = self._shared_cache.get(DIRECTORY_VERSION_KEY)
+        if stamp is None:
+            # Метка вытеснена из кэша - актуальность неизвестна,
+            # начинаем новую версию для всех процессов.
+            stamp = uuid.uuid4().hex
+            self._shared_cache.add(DIRECTORY_VERSION_KEY, stamp, None)
+            stamp = self._shared_cache.get(DIRECTORY_VERSION_KEY, stamp)
+        return stamp
+
+    async def _ashared_stamp(self) -> Optional[str]:
+        if not self.shared:
+            return None
+        stamp = await self._shared_cache.aget(DIRECTORY_VERSION_KEY)
+        if stamp is None:
+            stamp = uuid.uuid4().hex
+            await self._shared_cache.aadd(DIRECTORY_VERSION_KEY, stamp, None)
+            stamp = await self._shared_cache.aget(DIRECTORY_VERSION_KEY, stamp)
+        return stamp
+
+    @property
+    def ttl(self) -> int:
+        return settings.CASHFLOW_DIRECTORY_TTL
+
+    def _current(self, stamp) -> Optional[DirectorySnapshot]:
+        snapshot = self._snapshot
+        if (
+                snapshot is not None
+                and snapshot.version == self._version
+                and snapshot.stamp == stamp
+                and (
+                    self.ttl <= 0
+                    or time.monotonic() - snapshot.loaded_at < self.ttl
+                )
+        ):
+            return snapshot
+        return None
+
+    def _remember(self, snapshot: DirectorySnapshot):
+        with self._lock:
+            # Если справочники поменялись во время загрузки,
+            # снимок отдаём, но не запоминаем.
+            if snapshot.version == self._version:
+                self._snapshot = snapshot
+
+    def get(self) -> DirectorySnapshot:
+        stamp = self._shared_stamp()
+        snapshot = self._current(stamp)
+        cache_hit("directory", snapshot is not None)
+        if snapshot is None:
+            snapshot = DirectorySnapshot.load(self._version, stamp)
+            self._remember(snapshot)
+        return snapshot
+
+    async def aget(self) -> DirectorySnapshot:
+        """ То же, что get, для асинхронных представлений """
+        stamp = await self._ashared_stamp()
+        snapshot = self._current(stamp)
+        cache_hit("directory", snapshot is not None)
+        if snapshot is None:
+            snapshot = await DirectorySnapshot.aload(self._version, stamp)
+            self._remember(snapshot)
+        return snapshot
+
+    def invalidate(self, using: Optional[str] = None):
+        """
+        Сбрасывает снимок сразу и ещё раз после фиксации транзакции,
+        чтобы процесс не оставил у себя данные, прочитанные до коммита.
+        """
+        self._bump()
+        transaction.on_commit(self._bump, using=using)
+
+    def _bump(self):
+        with self._lock:
+            self._version += 1
+            self._snapshot = None
+        if self.shared:
+            self._shared_cache.set(
+                DIRECTORY_VERSION_KEY, uuid.uuid4().hex, None
+            )
+
+
+directory_cache = DirectoryCache()
+
+_pinned: ContextVar[Optional[DirectorySnapshot]] = ContextVar(
+    "cash_flow_directory_snapshot", default=None
+)
+
+
+def get_directory() -> DirectorySnapshot:
+    """
+    Актуальный снимок справочников или снимок, закреплённый
+    в текущем контексте через pin_directory.
+    """
+    return _pinned.get() or directory_cache.get()
+
+
+async def aget_directory() -> DirectorySnapshot:
+    return _pinned.get() or await directory_cache.aget()
+
+
+@contextmanager
+def pin_directory(snapshot: DirectorySnapshot):
+    """
+    Закрепляет снимок на время блока: формы и поля справочников внутри
+    асинхронного представления не обращаются к БД синхронно.
+    """
+    token = _pinned.set(snapshot)
+    try:
+        yield snapshot
+    finally:
+        _pinned.reset(token)
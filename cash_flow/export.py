@@ -0,0 +1,253 @@
+"""
+Потоковая выгрузка записей ДДС в CSV и XLSX.
+
+Строки читаются из БД итератором (на PostgreSQL - серверным курсором)
+порциями по CASHFLOW_EXPORT_CHUNK_SIZE и сразу отдаются клиенту,
+поэтому память не зависит от размера выгрузки. Лист XLSX вмещает
+не больше XLSX_MAX_ROWS строк (предел Excel), следующие записи
+продолжаются на новом листе.
+"""
+import csv
+import datetime
+import re
+import zipfile
+from decimal import Decimal
+from typing import Iterable, Iterator, Optional
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db.models.query import QuerySet
+
+EXPORT_HEADERS = (
+    "ID", "Дата", "Статус", "Тип", "Категория", "Подкатегория",
+    "Сумма", "Комментарий",
+)
+EXPORT_FIELDS = (
+    "id", "effective_date", "status__name", "type__name", "category__name",
+    "subcategory__name", "amount", "comment",
+)
+# Предел строк на листе Excel, включая заголовок.
+XLSX_MAX_ROWS = 1048576
+XLSX_SHEET_NAME = "ДДС"
+# Текст, который Excel и другие табличные редакторы примут за формулу.
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def export_rows(queryset: QuerySet) -> Iterator[tuple]:
+    """
+    Кортежи значений для выгрузки с названиями справочников,
+    от новых записей к старым.
+    """
+    return (
+        queryset
+        .order_by("-effective_date", "-id")
+        .values_list(*EXPORT_FIELDS)
+        .iterator(chunk_size=settings.CASHFLOW_EXPORT_CHUNK_SIZE)
+    )
+
+
+class _Buffer:
+    """ Файлоподобный приёмник: копит записанное до следующей выдачи """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = self.chunks
+        self.chunks = []
+        return data
+
+
+def _csv_value(value):
+    """
+    Текст, начинающийся как формула, предваряется апострофом: иначе
+    комментарий вида =HYPERLINK(...) выполнится при открытии файла.
+    """
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return f"'{value}"
+    return value
+
+
+def iter_csv(rows: Iterable[tuple]) -> Iterator[str]:
+    """
+    CSV в UTF-8 с BOM, чтобы Excel корректно открывал кириллицу.
+    """
+    buffer = _Buffer()
+    writer = csv.writer(buffer)
+    yield "\ufeff"
+    writer.writerow(EXPORT_HEADERS)
+    yield "".join(buffer.drain())
+
+    chunk_size = settings.CASHFLOW_EXPORT_CHUNK_SIZE
+    for number, row in enumerate(rows, start=1):
+        writer.writerow([_csv_value(value) for value in row])
+        if number % chunk_size == 0:
+            yield "".join(buffer.drain())
+    yield "".join(buffer.drain())
+
+
+_INVALID_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_EXCEL_EPOCH = datetime.date(1899, 12, 30)
+
+_SPREADSHEET_TYPE = (
+    "application/vnd.openxmlformats-officedocument.spreadsheetml"
+)
+
+_XLSX_STATIC_PARTS = {
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/'
+        '2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/'
+        'officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    # Стиль 1 - встроенный формат даты (numFmtId 14).
+    "xl/styles.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/'
+        'spreadsheetml/2006/main">'
+        '<fonts count="1"><font/></fonts>'
+        '<fills count="1"><fill/></fills>'
+        '<borders count="1"><border/></borders>'
+        '<cellStyleXfs count="1"><xf/></cellStyleXfs>'
+        '<cellXfs count="2"><xf/>'
+        '<xf numFmtId="14" applyNumberFormat="1"/></cellXfs>'
+        '</styleSheet>'
+    ),
+}
+
+
+def _xlsx_book_parts(sheets: int) -> dict:
+    """
+    Части книги, зависящие от числа листов: пишутся после листов,
+    когда их число известно.
+    """
+    numbers = range(1, sheets + 1)
+    return {
+        "[Content_Types].xml": (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/'
+            'content-types">'
+            '<Default Extension="rels" ContentType="application/'
+            'vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            f'ContentType="{_SPREADSHEET_TYPE}.sheet.main+xml"/>'
+            + "".join(
+                f'<Override PartName="/xl/worksheets/sheet{number}.xml" '
+                f'ContentType="{_SPREADSHEET_TYPE}.worksheet+xml"/>'
+                for number in numbers
+            )
+            + '<Override PartName="/xl/styles.xml" '
+            f'ContentType="{_SPREADSHEET_TYPE}.styles+xml"/>'
+            '</Types>'
+        ),
+        "xl/workbook.xml": (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/'
+            'spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/'
+            'officeDocument/2006/relationships"><sheets>'
+            + "".join(
+                f'<sheet name="{_sheet_name(number)}" sheetId="{number}" '
+                f'r:id="rId{number}"/>'
+                for number in numbers
+            )
+            + '</sheets></workbook>'
+        ),
+        "xl/_rels/workbook.xml.rels": (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/'
+            'package/2006/relationships">'
+            + "".join(
+                f'<Relationship Id="rId{number}" '
+                'Type="http://schemas.openxmlformats.org/'
+                'officeDocument/2006/relationships/worksheet" '
+                f'Target="worksheets/sheet{number}.xml"/>'
+                for number in numbers
+            )
+            + f'<Relationship Id="rId{sheets + 1}" '
+            'Type="http://schemas.openxmlformats.org/'
+            'officeDocument/2006/relationships/styles" '
+            'Target="styles.xml"/>'
+            '</Relationships>'
+        ),
+    }
+
+
+def _sheet_name(number: int) -> str:
+    return XLSX_SHEET_NAME if number == 1 else f"{XLSX_SHEET_NAME} {number}"
+
+
+def _xlsx_cell(value) -> str:
+    if value is None:
+        return "<c/>"
+    if isinstance(value, datetime.date):
+        return f'<c s="1"><v>{(value - _EXCEL_EPOCH).days}</v></c>'
+    if isinstance(value, (int, float, Decimal)):
+        return f"<c><v>{value}</v></c>"
+    text = escape(_INVALID_XML_CHARS.sub("", str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xlsx_row(values) -> str:
+    return "<row>" + "".join(_xlsx_cell(value) for value in values) + "</row>"
+
+
+def iter_xlsx(
+        rows: Iterable[tuple], max_rows: Optional[int] = None
+) -> Iterator[bytes]:
+    """
+    XLSX, собранный потоково стандартным zipfile. Zip пишется в поток
+    без перемотки, размеры файлов уходят в дескрипторах данных после
+    содержимого. На листе не больше max_rows строк с заголовком
+    (по умолчанию XLSX_MAX_ROWS), остальные записи - на следующих
+    листах; описание книги со списком листов пишется последним.
+    """
+    sheet_rows = (max_rows or XLSX_MAX_ROWS) - 1
+    chunk_size = settings.CASHFLOW_EXPORT_CHUNK_SIZE
+    rows = iter(rows)
+    buffer = _Buffer()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_STATIC_PARTS.items():
+            archive.writestr(name, content)
+        yield b"".join(buffer.drain())
+
+        sheets, row = 0, next(rows, None)
+        while sheets == 0 or row is not None:
+            sheets += 1
+            with archive.open(
+                    f"xl/worksheets/sheet{sheets}.xml", "w", force_zip64=True
+            ) as sheet:
+                sheet.write(
+                    b'<?xml version="1.0" encoding="UTF-8" '
+                    b'standalone="yes"?>'
+                    b'<worksheet xmlns="http://schemas.openxmlformats.org/'
+                    b'spreadsheetml/2006/main"><sheetData>'
+                )
+                sheet.write(_xlsx_row(EXPORT_HEADERS).encode())
+                lines, count = [], 0
+                while row is not None and count < sheet_rows:
+                    lines.append(_xlsx_row(row))
+                    count += 1
+                    if len(lines) == chunk_size:
+                        sheet.write("".join(lines).encode())
+                        lines = []
+                        yield b"".join(buffer.drain())
+                    row = next(rows, None)
+                sheet.write("".join(lines).encode())
+                sheet.write(b"</sheetData></worksheet>")
+            yield b"".join(buffer.drain())
+
+        for name, content in _xlsx_book_parts(sheets).items():
+            archive.writestr(name, content)
+    yield b"".join(buffer.drain())
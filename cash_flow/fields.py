@@ -0,0 +1,136 @@
+from django import forms
+from django.core.exceptions import ValidationError
+from django.db import models, router
+from django.utils.choices import BaseChoiceIterator
+
+from cash_flow.directory_cache import get_directory
+from cash_flow.models import Category, Status, SubCategory, Type
+
+DIRECTORY_MODELS = {
+    "statuses": Status,
+    "types": Type,
+    "categories": Category,
+    "subcategories": SubCategory,
+}
+# Поле родителя: тип для категории, категория для подкатегории.
+DIRECTORY_PARENT_FIELDS = {
+    "categories": "type_id",
+    "subcategories": "category_id",
+}
+
+
+def directory_instance(kind, entry, snapshot):
+    """
+    Экземпляр модели справочника, собранный из кэша без запроса к БД.
+    У категории и подкатегории заранее заполнены родители,
+    поэтому __str__ и сравнения по ним тоже не обращаются к БД.
+    """
+    model = DIRECTORY_MODELS[kind]
+    instance = model(id=entry.id, name=entry.name)
+    # Состояние - до присвоения родителя: иначе дескриптор связи
+    # спрашивает у роутера БД для записи, и запрос считается пишущим.
+    instance._state.adding = False
+    instance._state.db = router.db_for_read(model)
+    if kind == "categories":
+        instance.type = directory_instance(
+            "types", snapshot.get("types", entry.parent_id), snapshot
+        )
+    elif kind == "subcategories":
+        instance.category = directory_instance(
+            "categories", snapshot.get("categories", entry.parent_id),
+            snapshot
+        )
+    return instance
+
+
+class DirectoryChoiceIterator(BaseChoiceIterator):
+    """
+    Варианты выбора из кэша справочников вместо запроса к queryset.
+    Ленивый, как ModelChoiceIterator: справочники читаются при отрисовке,
+    а не при объявлении формы.
+    """
+
+    def __init__(self, field):
+        self.field = field
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield "", self.field.empty_label
+        for entry in self.field.get_entries():
+            yield entry.id, str(entry)
+
+    def __len__(self):
+        return len(self.field.get_entries()) + (
+            self.field.empty_label is not None
+        )
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(
+            self.field.get_entries()
+        )
+
+
+class DirectoryChoiceField(forms.ModelChoiceField):
+    """
+    ModelChoiceField, который берёт варианты и значения из кэша справочников.
+
+    Args:
+        kind: statuses, types, categories или subcategories.
+        parent_ids: если задано - допустимы только элементы с этими
+            родителями (тип для категорий, категория для подкатегорий).
+        check_db: выбранное значение читается из БД, а не из кэша.
+            Для форм, которые сохраняют данные: кэш процесса может
+            не знать об изменениях из других процессов до TTL
+            (см. directory_cache.py), и удалённый или перенесённый
+            справочник прошёл бы проверку.
+    """
+    iterator = DirectoryChoiceIterator
+
+    def __init__(self, kind, *, parent_ids=None, check_db=False, **kwargs):
+        self.kind = kind
+        self.parent_ids = parent_ids
+        self.check_db = check_db
+        super().__init__(
+            queryset=DIRECTORY_MODELS[kind].objects.all(), **kwargs
+        )
+
+    def get_entries(self):
+        entries = getattr(get_directory(), self.kind)
+        if self.parent_ids is not None:
+            entries = [e for e in entries if e.parent_id in self.parent_ids]
+        return entries
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        if self.check_db:
+            instance = super().to_python(value)
+            parent_field = DIRECTORY_PARENT_FIELDS.get(self.kind)
+            self._check_parent(
+                getattr(instance, parent_field) if parent_field else None,
+                value,
+            )
+            return instance
+
+        if isinstance(value, models.Model):
+            value = value.pk
+        snapshot = get_directory()
+        try:
+            entry = snapshot.get(self.kind, int(value))
+        except (TypeError, ValueError):
+            entry = None
+        if entry is None:
+            self._invalid_choice(value)
+        self._check_parent(entry.parent_id, value)
+        return directory_instance(self.kind, entry, snapshot)
+
+    def _check_parent(self, parent_id, value):
+        if self.parent_ids is not None and parent_id not in self.parent_ids:
+            self._invalid_choice(value)
+
+    def _invalid_choice(self, value):
+        raise ValidationError(
+            self.error_messages["invalid_choice"],
+            code="invalid_choice",
+            params={"value": value},
+        )
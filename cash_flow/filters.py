@@ -0,0 +1,39 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from cash_flow.forms import CashFlowApiFilterForm
+
+
+class CashFlowRecordFilterBackend(BaseFilterBackend):
+    """
+    Фильтрация записей ДДС в API: период, справочники и диапазон суммы.
+    Параметры проверяются формой CashFlowApiFilterForm, очищенные
+    значения сохраняются в request.record_filters для ключа кэша
+    результатов (см. result_cache.py).
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        form = CashFlowApiFilterForm(request.query_params)
+        if not form.is_valid():
+            raise ValidationError(form.errors)
+        request.record_filters = form.cleaned_data
+        return queryset.filter_by(form.cleaned_data)
+
+
+class ExactFieldFilterBackend(BaseFilterBackend):
+    """
+    Точная фильтрация по полям из атрибута view.filter_fields,
+    например /api/categories/?type=1.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        lookups = {}
+        for field_name in getattr(view, "filter_fields", ()):
+            value = request.query_params.get(field_name)
+            if value in (None, ""):
+                continue
+            try:
+                lookups[field_name] = int(value)
+            except ValueError:
+                raise ValidationError({field_name: ["Ожидается целое число"]})
+        return queryset.filter(**lookups)
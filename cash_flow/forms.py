@@ -1,14 +1,22 @@
+import datetime
+
 from django import forms
+from .fields import DirectoryChoiceField
 from .models import CashFlowRecord, Category, SubCategory, Type, Status
-from cash_flow.validation import (
-    validate_category_type_match,
-    validate_subcategory_category_match,
-    validate_custom_date,
-    validate_cash_flow_record_amount
-)
+from cash_flow.validation import validate_records
 
 
 class CashFlowRecordForm(forms.ModelForm):
+    """
+    Форма записи ДДС. Списки справочников строятся из кэша справочников,
+    поэтому отрисовка формы не делает запрос на каждый вариант выбора;
+    выбранные значения перед сохранением читаются из БД.
+    """
+    status = DirectoryChoiceField("statuses", required=False, check_db=True)
+    type = DirectoryChoiceField("types", check_db=True)
+    category = DirectoryChoiceField("categories", check_db=True)
+    subcategory = DirectoryChoiceField("subcategories", check_db=True)
+
     class Meta:
         model = CashFlowRecord
         fields = '__all__'
@@ -28,40 +36,18 @@ class CashFlowRecordForm(forms.ModelForm):
         elif instance:
             category_id = instance.category_id
 
-        if category_id:
-            self.fields["subcategory"].queryset = SubCategory.objects.filter(
-                category_id=category_id
-            )
-        else:
-            self.fields["subcategory"].queryset = SubCategory.objects.none()
+        self.fields["subcategory"].parent_ids = (
+            {category_id} if category_id else set()
+        )
 
     def clean(self):
         cleaned_data = super().clean()
-        record_type = cleaned_data.get("type")
-        category = cleaned_data.get("category")
-        subcategory = cleaned_data.get("subcategory")
-        custom_date = cleaned_data.get("custom_date")
-        amount = cleaned_data.get("amount")
-
-        try:
-            validate_category_type_match(category, record_type)
-        except ValueError as e:
-            self.add_error("category", str(e))
-
-        try:
-            validate_subcategory_category_match(subcategory, category)
-        except ValueError as e:
-            self.add_error("subcategory", str(e))
-
-        try:
-            validate_custom_date(custom_date)
-        except ValueError as e:
-            self.add_error("custom_date", str(e))
-
-        try:
-            validate_cash_flow_record_amount(amount)
-        except ValueError as e:
-            self.add_error("amount", str(e))
+        # Справочники здесь - экземпляры из БД с актуальными родителями,
+        # поэтому проверка иерархии не делает дополнительных запросов.
+        errors = validate_records([cleaned_data])[0]
+        for name, messages in errors.items():
+            for message in messages:
+                self.add_error(name, message)
 
 
 class StatusForm(forms.ModelForm):
@@ -83,6 +69,8 @@ class CategoryForm(forms.ModelForm):
 
 
 class SubCategoryForm(forms.ModelForm):
+    category = DirectoryChoiceField("categories", check_db=True)
+
     class Meta:
         model = SubCategory
         fields = '__all__'
@@ -97,21 +85,89 @@ class CashFlowFilterForm(forms.Form):
         label="По", required=False,
         widget=forms.DateInput(attrs={"type": "date", "class": "form-control"})
     )
-    status = forms.ModelChoiceField(
-        queryset=Status.objects.all(), required=False, label="Статус",
+    status = DirectoryChoiceField(
+        "statuses", required=False, label="Статус",
         widget=forms.Select(attrs={"class": "form-select"})
     )
-    type = forms.ModelChoiceField(
-        queryset=Type.objects.all(), required=False, label="Тип",
+    type = DirectoryChoiceField(
+        "types", required=False, label="Тип",
         widget=forms.Select(attrs={"class": "form-select"})
     )
-    category = forms.ModelChoiceField(
-        queryset=Category.objects.all(), required=False, label="Категория",
+    category = DirectoryChoiceField(
+        "categories", required=False, label="Категория",
         widget=forms.Select(attrs={"class": "form-select"})
     )
-    subcategory = forms.ModelChoiceField(
-        queryset=SubCategory.objects.all(),
+    subcategory = DirectoryChoiceField(
+        "subcategories",
         required=False,
         label="Подкатегория",
         widget=forms.Select(attrs={"class": "form-select"})
     )
+    search = forms.CharField(
+        label="Поиск", required=False, max_length=200,
+        widget=forms.TextInput(attrs={
+            "class": "form-control", "placeholder": "Комментарий"
+        })
+    )
+
+
+class CashFlowReportForm(CashFlowFilterForm):
+    PERIOD_CHOICES = [
+        ("day", "День"),
+        ("week", "Неделя"),
+        ("month", "Месяц"),
+        ("quarter", "Квартал"),
+        ("year", "Год"),
+    ]
+    GROUP_BY_CHOICES = [
+        ("type", "Тип"),
+        ("category", "Категория"),
+        ("subcategory", "Подкатегория"),
+        ("status", "Статус"),
+    ]
+
+    period = forms.ChoiceField(
+        choices=PERIOD_CHOICES, required=False, label="Период"
+    )
+    group_by = forms.MultipleChoiceField(
+        choices=GROUP_BY_CHOICES, required=False, label="Группировка"
+    )
+    # Отчёт строится по дневным итогам, комментариев в них нет.
+    search = None
+
+    def clean_period(self):
+        return self.cleaned_data["period"] or "month"
+
+
+class CashFlowBalanceForm(forms.Form):
+    """
+    Период для остатка по дням: по умолчанию с начала месяца date_to,
+    date_to по умолчанию - сегодня.
+    """
+    MAX_DAYS = 3660
+
+    date_from = forms.DateField(label="С", required=False)
+    date_to = forms.DateField(label="По", required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        date_to = cleaned_data.get("date_to") or datetime.date.today()
+        date_from = cleaned_data.get("date_from") or date_to.replace(day=1)
+        if date_from > date_to:
+            raise forms.ValidationError("Начало периода позже его конца")
+        if (date_to - date_from).days > self.MAX_DAYS:
+            raise forms.ValidationError(
+                f"Период не может быть длиннее {self.MAX_DAYS} дней"
+            )
+        cleaned_data["date_from"] = date_from
+        cleaned_data["date_to"] = date_to
+        return cleaned_data
+
+
+class CashFlowApiFilterForm(CashFlowFilterForm):
+    amount_min = forms.DecimalField(
+        label="Сумма от", required=False, max_digits=12, decimal_places=2
+    )
+    amount_max = forms.DecimalField(
+        label="Сумма до", required=False, max_digits=12, decimal_places=2
+    )
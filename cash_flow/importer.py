@@ -0,0 +1,413 @@
+"""
+Потоковый импорт записей ДДС из CSV и JSONL.
+
+Файл читается построчно, названия справочников переводятся в id по
+индексу в памяти, строки проверяются пачками. На PostgreSQL корректные
+строки загружаются через COPY FROM STDIN во временную таблицу и
+переносятся в таблицу записей одним INSERT ... SELECT, на остальных БД -
+через bulk_create. Отклонённые строки с причинами пишутся в отдельный CSV.
+"""
+import csv
+import datetime
+import io
+import json
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connections, router, transaction
+
+from cash_flow.metrics import ingest_batch_duration, ingested_records
+from cash_flow.models import (
+    BalanceCheckpoint,
+    CashFlowDailyRollup,
+    CashFlowRecord,
+    Category,
+    ROLLUP_CONFLICT_TARGET,
+    RecordChangeMarker,
+    Status,
+    SubCategory,
+    Type,
+    add_rollup_deltas,
+)
+from cash_flow.validation import HierarchyIndex, validate_records
+
+# Заголовки колонок: английские имена и заголовки выгрузки /record/export/.
+COLUMN_ALIASES = {
+    "date": "date", "custom_date": "date", "effective_date": "date",
+    "Дата": "date",
+    "status": "status", "Статус": "status",
+    "type": "type", "Тип": "type",
+    "category": "category", "Категория": "category",
+    "subcategory": "subcategory", "Подкатегория": "subcategory",
+    "amount": "amount", "Сумма": "amount",
+    "comment": "comment", "Комментарий": "comment",
+}
+
+STAGING_COLUMNS = (
+    "created_at", "custom_date", "effective_date", "status_id", "type_id",
+    "category_id", "subcategory_id", "amount", "comment",
+)
+
+AMOUNT_QUANT = Decimal("0.01")
+AMOUNT_LIMIT = Decimal("10") ** 10
+
+
+class ImportRowError(ValueError):
+    """ Строка файла отклонена """
+
+
+@dataclass
+class DirectoryIndex:
+    """
+    Справочники по названиям: тип и статус - по имени,
+    категория - по (тип, имя), подкатегория - по (категория, имя).
+    """
+    types: Dict[str, int] = field(default_factory=dict)
+    statuses: Dict[str, int] = field(default_factory=dict)
+    categories: Dict[Tuple[int, str], int] = field(default_factory=dict)
+    subcategories: Dict[Tuple[int, str], int] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, using: Optional[str] = None) -> "DirectoryIndex":
+        """ using - БД, в которую загружаются записи """
+        using = using or router.db_for_write(CashFlowRecord)
+        return cls(
+            types=dict(Type.objects.using(using).values_list("name", "id")),
+            statuses=dict(
+                Status.objects.using(using).values_list("name", "id")
+            ),
+            categories={
+                (type_id, name): pk
+                for pk, type_id, name in Category.objects.using(using)
+                .values_list("id", "type_id", "name")
+            },
+            subcategories={
+                (category_id, name): pk
+                for pk, category_id, name in SubCategory.objects.using(using)
+                .values_list("id", "category_id", "name")
+            },
+        )
+
+    def hierarchy(self) -> HierarchyIndex:
+        """ Тот же набор справочников для пакетной проверки записей """
+        return HierarchyIndex(
+            statuses=set(self.statuses.values()),
+            types=set(self.types.values()),
+            category_types={
+                pk: type_id
+                for (type_id, _), pk in self.categories.items()
+            },
+            subcategory_categories={
+                pk: category_id
+                for (category_id, _), pk in self.subcategories.items()
+            },
+        )
+
+    def resolve(self, row: Dict[str, str]) -> Dict[str, Optional[int]]:
+        type_name = row.get("type", "")
+        category_name = row.get("category", "")
+        subcategory_name = row.get("subcategory", "")
+        status_name = row.get("status", "")
+
+        type_id = self.types.get(type_name)
+        if type_id is None:
+            raise ImportRowError(f"Неизвестный тип «{type_name}»")
+        category_id = self.categories.get((type_id, category_name))
+        if category_id is None:
+            raise ImportRowError(
+                f"Категория «{category_name}» не относится к типу "
+                f"«{type_name}»"
+            )
+        subcategory_id = self.subcategories.get(
+            (category_id, subcategory_name)
+        )
+        if subcategory_id is None:
+            raise ImportRowError(
+                f"Подкатегория «{subcategory_name}» не относится "
+                f"к категории «{category_name}»"
+            )
+        status_id = None
+        if status_name:
+            status_id = self.statuses.get(status_name)
+            if status_id is None:
+                raise ImportRowError(f"Неизвестный статус «{status_name}»")
+        return {
+            "status_id": status_id,
+            "type_id": type_id,
+            "category_id": category_id,
+            "subcategory_id": subcategory_id,
+        }
+
+
+@dataclass
+class ImportStats:
+    read: int = 0
+    imported: int = 0
+    rejected: int = 0
+    started: float = field(default_factory=time.monotonic)
+    errors: List[dict] = field(default_factory=list)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def rate(self) -> float:
+        """ Обработанных строк в секунду """
+        return self.read / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "read": self.read,
+            "imported": self.imported,
+            "rejected": self.rejected,
+            "elapsed": round(self.elapsed, 3),
+            "rows_per_second": round(self.rate, 1),
+        }
+
+
+def read_rows(stream, file_format: str) -> Iterator[Tuple[int, dict]]:
+    """
+    Строки файла как (номер строки, словарь с нормализованными ключами).
+    """
+    if file_format == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, _normalize(row)
+    elif file_format == "jsonl":
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield line_number, {"__error__": "Строка не является JSON"}
+                continue
+            if not isinstance(row, dict):
+                yield line_number, {"__error__": "Ожидается JSON-объект"}
+                continue
+            yield line_number, _normalize(row)
+    else:
+        raise ValueError(f"Неизвестный формат: {file_format}")
+
+
+def _normalize(row: dict) -> dict:
+    normalized = {}
+    for key, value in row.items():
+        name = COLUMN_ALIASES.get((key or "").strip())
+        if name:
+            normalized[name] = "" if value is None else str(value).strip()
+    return normalized
+
+
+def _parse_date(value: str) -> Optional[datetime.date]:
+    if not value:
+        return None
+    for date_format in ("%Y-%m-%d", "%d.%m.%Y"):
+        try:
+            return datetime.datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    raise ImportRowError(f"Неверная дата «{value}»")
+
+
+def _parse_amount(value: str) -> Decimal:
+    try:
+        amount = Decimal(value.replace(" ", "").replace(",", "."))
+    except InvalidOperation:
+        raise ImportRowError(f"Неверная сумма «{value}»")
+    if not amount.is_finite() or abs(amount) >= AMOUNT_LIMIT:
+        raise ImportRowError(f"Неверная сумма «{value}»")
+    if amount != amount.quantize(AMOUNT_QUANT):
+        raise ImportRowError("Не более двух знаков после запятой")
+    return amount.quantize(AMOUNT_QUANT)
+
+
+def build_record_values(row: dict, index: DirectoryIndex, today) -> dict:
+    """
+    Значения колонок записи ДДС для строки файла.
+    Ошибки разбора - ImportRowError; правила validation.py
+    проверяются пачкой в RecordImporter.
+    """
+    if "__error__" in row:
+        raise ImportRowError(row["__error__"])
+    custom_date = _parse_date(row.get("date", ""))
+    amount = _parse_amount(row.get("amount", ""))
+    return {
+        "created_at": today,
+        "custom_date": custom_date,
+        "effective_date": custom_date or today,
+        **index.resolve(row),
+        "amount": amount,
+        "comment": row.get("comment") or None,
+    }
+
+
+def _validation_payload(values: dict) -> dict:
+    return {
+        "custom_date": values["custom_date"],
+        "status": values["status_id"],
+        "type": values["type_id"],
+        "category": values["category_id"],
+        "subcategory": values["subcategory_id"],
+        "amount": values["amount"],
+    }
+
+
+class RecordImporter:
+    """
+    Импорт записей ДДС пачками по batch_size строк,
+    каждая пачка загружается в отдельной транзакции.
+    """
+
+    def __init__(
+            self,
+            batch_size: Optional[int] = None,
+            error_writer=None,
+            progress: Optional[Callable[[ImportStats], None]] = None,
+            max_reported_errors: int = 100,
+            using: Optional[str] = None,
+    ):
+        self.batch_size = batch_size or settings.CASHFLOW_IMPORT_BATCH_SIZE
+        self.error_writer = error_writer
+        self.progress = progress
+        self.max_reported_errors = max_reported_errors
+        self.using = using or router.db_for_write(CashFlowRecord)
+        self.connection = connections[self.using]
+
+    def run(self, rows: Iterable[Tuple[int, dict]]) -> ImportStats:
+        stats = ImportStats()
+        index = DirectoryIndex.load(self.using)
+        hierarchy = index.hierarchy()
+        today = datetime.date.today()
+        if self.error_writer is not None:
+            self.error_writer.writerow(["line", "error", "row"])
+
+        pending = []
+        for line_number, row in rows:
+            stats.read += 1
+            try:
+                values = build_record_values(row, index, today)
+            except ImportRowError as e:
+                self._reject(stats, line_number, str(e), row)
+            else:
+                pending.append((line_number, row, values))
+            if len(pending) >= self.batch_size:
+                self._load(self._validate(pending, hierarchy, stats), stats)
+                pending = []
+        batch = self._validate(pending, hierarchy, stats)
+        if batch:
+            self._load(batch, stats)
+        elif self.progress:
+            self.progress(stats)
+        return stats
+
+    def _validate(self, pending, hierarchy, stats) -> List[dict]:
+        """ Проверка пачки по правилам validation.py, возвращает годные """
+        batch = []
+        results = validate_records(
+            (_validation_payload(values) for _, _, values in pending),
+            index=hierarchy,
+        )
+        for (line_number, row, values), errors in zip(pending, results):
+            if errors:
+                reason = "; ".join(
+                    message for messages in errors.values()
+                    for message in messages
+                )
+                self._reject(stats, line_number, reason, row)
+            else:
+                batch.append(values)
+        return batch
+
+    def _reject(self, stats, line_number, reason, row):
+        stats.rejected += 1
+        ingested_records.labels("import", "rejected").inc()
+        if self.error_writer is not None:
+            self.error_writer.writerow(
+                [line_number, reason, json.dumps(row, ensure_ascii=False)]
+            )
+        if len(stats.errors) < self.max_reported_errors:
+            stats.errors.append({"line": line_number, "error": reason})
+
+    def _load(self, batch: List[dict], stats: ImportStats):
+        if not batch:
+            if self.progress:
+                self.progress(stats)
+            return
+        started = time.perf_counter()
+        with transaction.atomic(using=self.using):
+            if self.connection.vendor == "postgresql":
+                self._copy_batch(batch)
+                deltas = add_rollup_deltas({}, batch)
+                BalanceCheckpoint.objects.apply_deltas(
+                    deltas, using=self.using
+                )
+                RecordChangeMarker.objects.touch(
+                    {key[0] for key in deltas}, using=self.using
+                )
+            else:
+                CashFlowRecord.objects.using(self.using).bulk_create(
+                    [CashFlowRecord(**values) for values in batch],
+                    batch_size=self.batch_size,
+                )
+                CashFlowDailyRollup.objects.apply_deltas(
+                    add_rollup_deltas({}, batch), using=self.using
+                )
+        ingest_batch_duration.labels("import").observe(
+            time.perf_counter() - started
+        )
+        ingested_records.labels("import", "imported").inc(len(batch))
+        stats.imported += len(batch)
+        if self.progress:
+            self.progress(stats)
+
+    def _copy_batch(self, batch: List[dict]):
+        qn = self.connection.ops.quote_name
+        records_table = qn(CashFlowRecord._meta.db_table)
+        rollup_table = qn(CashFlowDailyRollup._meta.db_table)
+        staging = qn("cash_flow_import_staging")
+        columns = ", ".join(STAGING_COLUMNS)
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for values in batch:
+            writer.writerow([
+                "" if values[name] is None else values[name]
+                for name in STAGING_COLUMNS
+            ])
+        buffer.seek(0)
+
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TEMP TABLE IF NOT EXISTS {staging} ("
+                "created_at date, custom_date date, effective_date date, "
+                "status_id bigint, type_id bigint, category_id bigint, "
+                "subcategory_id bigint, amount numeric(12, 2), comment text"
+                ") ON COMMIT DELETE ROWS"
+            )
+            # Пустое поле без кавычек в CSV-режиме COPY - NULL.
+            cursor.copy_expert(
+                f"COPY {staging} ({columns}) FROM STDIN WITH (FORMAT csv)",
+                buffer,
+            )
+            cursor.execute(
+                f"INSERT INTO {records_table} ({columns}) "
+                f"SELECT {columns} FROM {staging}"
+            )
+            cursor.execute(
+                f"INSERT INTO {rollup_table} (date, type_id, category_id, "
+                "subcategory_id, status_id, amount_total, record_count) "
+                "SELECT effective_date, type_id, category_id, subcategory_id, "
+                f"status_id, SUM(amount), COUNT(*) FROM {staging} "
+                "GROUP BY effective_date, type_id, category_id, "
+                "subcategory_id, status_id "
+                f"ON CONFLICT {ROLLUP_CONFLICT_TARGET} DO UPDATE SET "
+                f"amount_total = {rollup_table}.amount_total "
+                "+ EXCLUDED.amount_total, "
+                f"record_count = {rollup_table}.record_count "
+                "+ EXCLUDED.record_count"
+            )
@@ -0,0 +1,130 @@
+"""
+Профилирование SQL в рамках запроса.
+
+QueryProfile подключается к соединениям как execute_wrapper и для
+каждого выполненного запроса учитывает время и нормализованный текст:
+литералы и списки IN заменяются заглушками, так что запросы, которые
+отличаются только значениями, сводятся к одной форме. Одна и та же
+форма, выполненная много раз за запрос, - признак N+1.
+
+Учёт стоит два вызова perf_counter и обновление словаря на запрос
+к БД, нормализация кэшируется, тексты параметров не сохраняются.
+"""
+import heapq
+import re
+import time
+from contextlib import ExitStack, contextmanager
+from functools import lru_cache
+from itertools import count
+from typing import Dict, List
+
+from django.db import connections
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"(?<![\w.\"])-?\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(
+    r"\bIN \(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)", re.I
+)
+_SPACE_RE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(sql: str) -> str:
+    """ Форма запроса без значений: 'a', 1, IN (%s, %s) -> ?, IN (...) """
+    sql = _STRING_RE.sub("?", sql)
+    sql = _NUMBER_RE.sub("?", sql)
+    sql = _IN_LIST_RE.sub("IN (...)", sql)
+    return _SPACE_RE.sub(" ", sql).strip()
+
+
+class QueryCounter:
+    """
+    Число и суммарное время запросов к БД, всего и по алиасам.
+    Подключается к соединениям как execute_wrapper (instrument_queries).
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.by_alias: Dict[str, int] = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.record(
+                context["connection"].alias, sql,
+                time.perf_counter() - started,
+            )
+
+    def record(self, alias: str, sql: str, duration: float):
+        self.count += 1
+        self.time += duration
+        self.by_alias[alias] = self.by_alias.get(alias, 0) + 1
+
+
+class QueryProfile(QueryCounter):
+    """ Запросы к БД за время профилирования с разбивкой по формам """
+
+    def __init__(self, slowest: int = 5):
+        super().__init__()
+        self.slowest_limit = slowest
+        # Форма запроса -> [количество, суммарное время].
+        self.by_sql: Dict[str, List] = {}
+        # Куча (время, порядковый номер, форма, алиас) самых долгих.
+        self._slowest: list = []
+        self._sequence = count()
+
+    def record(self, alias: str, sql: str, duration: float):
+        super().record(alias, sql, duration)
+        shape = normalize_sql(sql)
+        stats = self.by_sql.get(shape)
+        if stats is None:
+            self.by_sql[shape] = [1, duration]
+        else:
+            stats[0] += 1
+            stats[1] += duration
+        item = (duration, next(self._sequence), shape, alias)
+        if len(self._slowest) < self.slowest_limit:
+            heapq.heappush(self._slowest, item)
+        elif self.slowest_limit:
+            heapq.heappushpop(self._slowest, item)
+
+    def slowest(self) -> List[dict]:
+        return [
+            {"sql": shape, "alias": alias, "time_ms": milliseconds(duration)}
+            for duration, _, shape, alias in sorted(
+                self._slowest, reverse=True
+            )
+        ]
+
+    def duplicates(self, threshold: int) -> List[dict]:
+        """ Формы, выполненные не меньше threshold раз, по убыванию """
+        return [
+            {"sql": shape, "count": number, "time_ms": milliseconds(duration)}
+            for shape, (number, duration) in sorted(
+                self.by_sql.items(), key=lambda item: -item[1][0]
+            )
+            if number >= threshold
+        ]
+
+
+def milliseconds(seconds: float) -> float:
+    return round(seconds * 1000, 3)
+
+
+@contextmanager
+def instrument_queries(counter: QueryCounter):
+    """ Подключает counter ко всем соединениям текущего потока """
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(
+                connections[alias].execute_wrapper(counter)
+            )
+        yield counter
+
+
+def profile_queries(slowest: int = 5):
+    """ QueryProfile, подключённый ко всем соединениям текущего потока """
+    return instrument_queries(QueryProfile(slowest))
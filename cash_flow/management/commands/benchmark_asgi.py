@@ -0,0 +1,159 @@
+import asyncio
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import AsyncClient, Client, override_settings
+
+from cash_flow.directory_cache import get_directory
+
+# Пары (синхронный путь для WSGI, асинхронный для ASGI).
+ENDPOINTS = {
+    "load-categories": (
+        "/ajax/load-categories/?type_id={type_id}",
+        "/ajax/async/load-categories/?type_id={type_id}",
+    ),
+    "load-subcategories": (
+        "/ajax/load-subcategories/?category_id={category_id}",
+        "/ajax/async/load-subcategories/?category_id={category_id}",
+    ),
+    "directory-tree": (
+        "/ajax/directory-tree/",
+        "/ajax/async/directory-tree/",
+    ),
+    "categories": (
+        "/api/categories/",
+        "/api/async/categories/",
+    ),
+    "records": (
+        "/api/records/?page_size=50",
+        "/api/async/records/?page_size=50",
+    ),
+}
+
+
+def _summary(mode, elapsed, results):
+    latencies = sorted(latency for latency, _, _ in results)
+    return {
+        "mode": mode,
+        "requests": len(latencies),
+        "failures": sum(1 for _, code, _ in results if code >= 400),
+        "threads": max(threads for _, _, threads in results),
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+class Command(BaseCommand):
+    """
+    Замер идёт в процессе через тестовые клиенты, без сети: он показывает
+    накладные расходы обработчиков и число потоков, которое нужно каждому
+    режиму для одинаковой конкурентности. Медленные клиенты и сетевые
+    задержки здесь не моделируются - под WSGI каждый из них держал бы
+    поток, под ASGI - только задачу в цикле событий. Асинхронный ORM
+    Django выполняет запросы в одном выделенном потоке.
+    """
+    help = (
+        "Сравнивает синхронные (WSGI) и асинхронные (ASGI) представления "
+        "справочников и списка записей при одновременных запросах"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests", type=int, default=500,
+            help="Запросов на каждый эндпоинт и режим"
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=50,
+            help="Одновременных запросов: потоков WSGI / задач ASGI"
+        )
+        parser.add_argument(
+            "--endpoint", action="append", choices=sorted(ENDPOINTS),
+            help="Эндпоинт для замера, можно несколько; по умолчанию все"
+        )
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1 or options["concurrency"] < 1:
+            raise CommandError("--requests и --concurrency должны быть > 0")
+
+        directory = get_directory()
+        params = {
+            "type_id": directory.types[0].id if directory.types else 0,
+            "category_id": (
+                directory.categories[0].id if directory.categories else 0
+            ),
+        }
+        hosts = [*settings.ALLOWED_HOSTS, "testserver"]
+        with override_settings(ALLOWED_HOSTS=hosts):
+            for name in options["endpoint"] or ENDPOINTS:
+                sync_path, async_path = (
+                    path.format(**params) for path in ENDPOINTS[name]
+                )
+                results = [
+                    self.run_wsgi(sync_path, **options),
+                    asyncio.run(self.run_asgi(async_path, **options)),
+                ]
+                self.report(name, results)
+
+    def run_wsgi(self, path, requests, concurrency, **options):
+        """
+        Синхронные представления через WSGI-обработчик тестового клиента,
+        по потоку на одновременный запрос - как у WSGI-сервера с потоками.
+        """
+        def fetch(_):
+            started = time.perf_counter()
+            response = Client().get(path)
+            return (
+                time.perf_counter() - started, response.status_code,
+                threading.active_count(),
+            )
+
+        def close_connections(_):
+            connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(fetch, range(concurrency)))  # прогрев
+            started = time.perf_counter()
+            results = list(executor.map(fetch, range(requests)))
+            elapsed = time.perf_counter() - started
+            list(executor.map(close_connections, range(concurrency)))
+        return _summary("wsgi", elapsed, results)
+
+    async def run_asgi(self, path, requests, concurrency, **options):
+        """
+        Асинхронные представления через ASGI-обработчик в одном
+        цикле событий без пула потоков на запросы.
+        """
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch():
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(path)
+                return (
+                    time.perf_counter() - started, response.status_code,
+                    threading.active_count(),
+                )
+
+        await asyncio.gather(*(fetch() for _ in range(concurrency)))
+        started = time.perf_counter()
+        results = await asyncio.gather(*(fetch() for _ in range(requests)))
+        elapsed = time.perf_counter() - started
+        return _summary("asgi", elapsed, results)
+
+    def report(self, name, results):
+        self.stdout.write(self.style.MIGRATE_HEADING(name))
+        for result in results:
+            self.stdout.write(
+                f"  {result['mode']}: {result['rps']:.0f} запр/с, "
+                f"p50 {result['p50_ms']:.1f} мс, "
+                f"p95 {result['p95_ms']:.1f} мс, "
+                f"потоков {result['threads']}, "
+                f"ошибок {result['failures']} из {result['requests']}"
+            )
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from cash_flow.db_routing import replica_aliases, replica_health
+
+
+class Command(BaseCommand):
+    help = "Проверяет доступность и отставание реплик для чтения"
+
+    def handle(self, *args, **options):
+        aliases = replica_aliases()
+        if not aliases:
+            self.stdout.write("Реплики не настроены (POSTGRES_REPLICA_HOSTS)")
+            return
+
+        failed = []
+        for alias in aliases:
+            healthy, lag = replica_health.check(alias)
+            if lag is None:
+                self.stdout.write(self.style.ERROR(f"{alias}: недоступна"))
+            elif healthy:
+                self.stdout.write(
+                    self.style.SUCCESS(f"{alias}: отставание {lag:.1f} с")
+                )
+            else:
+                self.stdout.write(self.style.WARNING(
+                    f"{alias}: отставание {lag:.1f} с превышает "
+                    f"{settings.CASHFLOW_REPLICA_MAX_LAG_SECONDS} с"
+                ))
+            if not healthy:
+                failed.append(alias)
+        if failed:
+            raise CommandError(
+                f"Неисправные реплики: {', '.join(failed)}"
+            )
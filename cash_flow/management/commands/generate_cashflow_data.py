@@ -0,0 +1,75 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cash_flow.datagen import generate_records
+
+
+class Command(BaseCommand):
+    help = (
+        "Генерирует синтетические записи ДДС (от тысяч до десятков "
+        "миллионов) по шаблону справочников для нагрузочных проверок"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--records", type=int, default=10000,
+            help="Количество записей, например 10000 или 50000000"
+        )
+        parser.add_argument(
+            "--seed", type=int, default=42,
+            help="Зерно генератора: одинаковые параметры - одинаковые данные"
+        )
+        parser.add_argument(
+            "--start", type=datetime.date.fromisoformat, default=None,
+            help="Первая дата операций (YYYY-MM-DD), по умолчанию "
+                 "три года назад"
+        )
+        parser.add_argument(
+            "--end", type=datetime.date.fromisoformat, default=None,
+            help="Последняя дата операций, по умолчанию сегодня"
+        )
+        parser.add_argument(
+            "--extra-categories", type=int, default=0,
+            help="Дополнительных категорий на каждый тип "
+                 "(по 5 подкатегорий)"
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=None,
+            help="Строк в одной пачке загрузки"
+        )
+        parser.add_argument(
+            "--database", default=None,
+            help="Алиас БД, по умолчанию БД для записи"
+        )
+
+    def handle(self, *args, **options):
+        if options["records"] < 1:
+            raise CommandError("--records должно быть больше нуля")
+        if options["extra_categories"] < 0:
+            raise CommandError("--extra-categories не может быть меньше нуля")
+        end = options["end"] or datetime.date.today()
+        if end > datetime.date.today():
+            raise CommandError("--end не может быть в будущем")
+        if options["start"] is not None and options["start"] > end:
+            raise CommandError("--start позже --end")
+
+        stats = generate_records(
+            options["records"],
+            seed=options["seed"],
+            start=options["start"],
+            end=end,
+            extra_categories=options["extra_categories"],
+            batch_size=options["batch_size"],
+            progress=self.report_progress,
+            using=options["database"],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово: загружено {stats.imported}, отклонено {stats.rejected} "
+            f"за {stats.elapsed:.1f} с ({stats.rate:.0f} строк/с)"
+        ))
+
+    def report_progress(self, stats):
+        self.stdout.write(
+            f"Загружено {stats.imported}, {stats.rate:.0f} строк/с"
+        )
@@ -0,0 +1,64 @@
+import csv
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cash_flow.importer import RecordImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Импорт записей ДДС из CSV или JSONL. Справочники указываются "
+        "названиями, отклонённые строки пишутся в отдельный CSV-файл."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Путь к файлу CSV или JSONL")
+        parser.add_argument(
+            "--format", choices=["csv", "jsonl"], default=None,
+            help="Формат файла, по умолчанию по расширению"
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=None,
+            help="Строк в одной пачке загрузки"
+        )
+        parser.add_argument(
+            "--errors", default=None,
+            help="Файл для отклонённых строк, по умолчанию <path>.errors.csv"
+        )
+        parser.add_argument(
+            "--database", default=None,
+            help="Алиас БД, по умолчанию БД для записи"
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        if not path.exists():
+            raise CommandError(f"Файл {path} не найден")
+        file_format = options["format"] or path.suffix.lstrip(".").lower()
+        if file_format not in ("csv", "jsonl"):
+            raise CommandError("Укажите --format csv или --format jsonl")
+        errors_path = Path(options["errors"] or f"{path}.errors.csv")
+
+        with open(path, encoding="utf-8-sig", newline="") as stream, \
+                open(errors_path, "w", encoding="utf-8", newline="") as errors:
+            importer = RecordImporter(
+                batch_size=options["batch_size"],
+                error_writer=csv.writer(errors),
+                progress=self.report_progress,
+                using=options["database"],
+            )
+            stats = importer.run(read_rows(stream, file_format))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово: загружено {stats.imported}, отклонено {stats.rejected} "
+            f"за {stats.elapsed:.1f} с ({stats.rate:.0f} строк/с)"
+        ))
+        if stats.rejected:
+            self.stdout.write(f"Отклонённые строки: {errors_path}")
+
+    def report_progress(self, stats):
+        self.stdout.write(
+            f"Прочитано {stats.read}, загружено {stats.imported}, "
+            f"отклонено {stats.rejected}, {stats.rate:.0f} строк/с"
+        )
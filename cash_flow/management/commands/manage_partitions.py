@@ -0,0 +1,65 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from cash_flow.partitions import (
+    detach_partitions, ensure_partitions, is_partitioned, list_partitions,
+)
+
+
+def month(value: str) -> datetime.date:
+    return datetime.datetime.strptime(value, "%Y-%m").date()
+
+
+class Command(BaseCommand):
+    help = (
+        "Создаёт помесячные секции таблицы записей ДДС заранее "
+        "и отключает или удаляет старые секции"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ahead", type=int, default=None,
+            help="На сколько месяцев вперёд создать секции, "
+                 "по умолчанию CASHFLOW_PARTITION_MONTHS_AHEAD"
+        )
+        parser.add_argument(
+            "--detach-before", type=month, default=None, metavar="YYYY-MM",
+            help="Отключить секции месяцев раньше указанного"
+        )
+        parser.add_argument(
+            "--drop", action="store_true",
+            help="Удалить отключённые секции вместе с данными"
+        )
+        parser.add_argument(
+            "--database", default=DEFAULT_DB_ALIAS,
+            help="Алиас БД"
+        )
+
+    def handle(self, *args, **options):
+        using = options["database"]
+        if not is_partitioned(using):
+            raise CommandError(
+                "Таблица записей не секционирована "
+                "(нужен PostgreSQL и миграция 0006)"
+            )
+        if options["drop"] and options["detach_before"] is None:
+            raise CommandError("--drop используется вместе с --detach-before")
+
+        for name in ensure_partitions(using, options["ahead"]):
+            self.stdout.write(self.style.SUCCESS(f"Создана секция {name}"))
+
+        if options["detach_before"] is not None:
+            removed = detach_partitions(
+                options["detach_before"], using, drop=options["drop"]
+            )
+            action = "удалена" if options["drop"] else "отключена"
+            for partition in removed:
+                self.stdout.write(self.style.WARNING(
+                    f"Секция {partition.name} ({partition.start:%Y-%m}) "
+                    f"{action}"
+                ))
+
+        partitions = list_partitions(using)
+        self.stdout.write(f"Секций: {len(partitions)}")
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from cash_flow.models import CashFlowDailyRollup
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает дневные итоги ДДС с нуля по таблице записей"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--database", default=None,
+            help="Алиас БД, по умолчанию БД для записи"
+        )
+
+    def handle(self, *args, **options):
+        rows = CashFlowDailyRollup.objects.rebuild(using=options["database"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Дневные итоги пересчитаны, строк: {rows}")
+        )
@@ -0,0 +1,108 @@
+import json
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from cash_flow.benchmarks import compare_results, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет время и число запросов к БД основных страниц и API "
+        "на текущих данных и выводит результат в JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repeat", type=int, default=5,
+            help="Замеров на каждый сценарий"
+        )
+        parser.add_argument(
+            "--warmup", type=int, default=1,
+            help="Прогревочных запросов перед замерами"
+        )
+        parser.add_argument(
+            "--only", action="append", default=None,
+            help="Только сценарии, в имени которых есть подстрока "
+                 "(можно несколько), например --only list --only api"
+        )
+        parser.add_argument(
+            "--search", default="аренды",
+            help="Строка для сценариев с поиском по комментарию"
+        )
+        parser.add_argument(
+            "--label", default="",
+            help="Метка прогона в результате, например версия"
+        )
+        parser.add_argument(
+            "--output", default=None,
+            help="Файл для JSON, по умолчанию stdout"
+        )
+        parser.add_argument(
+            "--compare", default=None,
+            help="JSON предыдущего прогона: вывести изменения и завершиться "
+                 "с ошибкой при регрессии"
+        )
+        parser.add_argument(
+            "--tolerance", type=float, default=0.2,
+            help="Допустимый рост медианы при --compare (доля), "
+                 "по умолчанию 0.2"
+        )
+
+    def handle(self, *args, **options):
+        if options["repeat"] < 1 or options["warmup"] < 0:
+            raise CommandError("--repeat должно быть > 0, --warmup >= 0")
+        # Прогресс - в stderr, чтобы stdout оставался чистым JSON.
+        progress = self.report_progress if options["output"] else None
+        hosts = [*settings.ALLOWED_HOSTS, "testserver"]
+        try:
+            with override_settings(ALLOWED_HOSTS=hosts):
+                result = run_benchmarks(
+                    repeat=options["repeat"],
+                    warmup=options["warmup"],
+                    only=options["only"],
+                    search=options["search"],
+                    label=options["label"],
+                    progress=progress,
+                )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        payload = json.dumps(result, ensure_ascii=False, indent=2)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as stream:
+                stream.write(payload)
+            self.stderr.write(f"Результат записан в {options['output']}")
+        else:
+            self.stdout.write(payload)
+
+        if options["compare"]:
+            self.compare(options["compare"], result, options["tolerance"])
+
+    def report_progress(self, result):
+        self.stderr.write(
+            f"{result.name}: {result.p50_ms:.1f} мс, "
+            f"запросов {result.queries}, HTTP {result.status}"
+        )
+
+    def compare(self, path, result, tolerance):
+        with open(path, encoding="utf-8") as stream:
+            baseline = json.load(stream)
+        changes = compare_results(baseline, result, tolerance)
+        regressions = [change for change in changes if change["regression"]]
+        for change in changes:
+            (before_ms, after_ms), (before_q, after_q) = (
+                change["p50_ms"], change["queries"]
+            )
+            line = (
+                f"{change['name']}: {before_ms:.1f} -> {after_ms:.1f} мс "
+                f"(x{change['ratio']:.2f}), запросов {before_q} -> {after_q}"
+            )
+            self.stderr.write(
+                self.style.ERROR(line) if change["regression"] else line
+            )
+        if regressions:
+            sys.stdout.flush()
+            raise CommandError(f"Регрессий: {len(regressions)}")
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from cash_flow.models import BalanceCheckpoint
+
+
+class Command(BaseCommand):
+    help = (
+        "Добавляет остатки на конец завершённых месяцев "
+        "(запускать после начала месяца, например по cron)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full", action="store_true",
+            help="Пересчитать все остатки с начала учёта по дневным итогам"
+        )
+        parser.add_argument(
+            "--database", default=None,
+            help="Алиас БД, по умолчанию БД для записи"
+        )
+
+    def handle(self, *args, **options):
+        created = BalanceCheckpoint.objects.refresh(
+            full=options["full"], using=options["database"]
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Остатки на конец месяца добавлены: {created}")
+        )
@@ -0,0 +1,87 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import router
+from django.db.models import Count, Max, Min, Sum
+
+from cash_flow.models import (
+    CashFlowDailyRollup,
+    CashFlowRecord,
+    ROLLUP_FIELDS,
+    ROLLUP_RECORD_FIELDS,
+)
+from cash_flow.months import add_months, months_between
+
+
+class Command(BaseCommand):
+    help = (
+        "Сверяет дневные итоги ДДС с таблицей записей. "
+        "Сравнение идёт помесячно, чтобы не держать в памяти всю историю."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--database", default=None,
+            help="Алиас БД, по умолчанию БД для записи"
+        )
+        parser.add_argument(
+            "--limit", type=int, default=50,
+            help="Сколько расхождений вывести"
+        )
+
+    def handle(self, *args, **options):
+        using = options["database"] or router.db_for_write(CashFlowRecord)
+        records = CashFlowRecord.objects.using(using).order_by()
+        rollup = CashFlowDailyRollup.objects.using(using).order_by()
+
+        bounds = [
+            records.aggregate(
+                start=Min("effective_date"), end=Max("effective_date")
+            ),
+            rollup.aggregate(start=Min("date"), end=Max("date")),
+        ]
+        starts = [b["start"] for b in bounds if b["start"]]
+        ends = [b["end"] for b in bounds if b["end"]]
+        if not starts:
+            self.stdout.write(self.style.SUCCESS("Записей и итогов нет"))
+            return
+
+        mismatches = 0
+        for month_start in months_between(min(starts), max(ends)):
+            month_end = add_months(month_start, 1)
+            expected = {
+                tuple(row[f] for f in ROLLUP_RECORD_FIELDS): (
+                    row["total"], row["count"]
+                )
+                for row in records.filter(
+                    effective_date__gte=month_start,
+                    effective_date__lt=month_end,
+                ).values(*ROLLUP_RECORD_FIELDS).annotate(
+                    total=Sum("amount"), count=Count("id")
+                )
+            }
+            actual = {
+                tuple(row[f] for f in ROLLUP_FIELDS): (
+                    row["amount_total"], row["record_count"]
+                )
+                for row in rollup.filter(
+                    date__gte=month_start, date__lt=month_end
+                ).values(*ROLLUP_FIELDS, "amount_total", "record_count")
+            }
+            for key in sorted(
+                    expected.keys() | actual.keys(),
+                    key=lambda k: tuple((v is None, v) for v in k)
+            ):
+                if expected.get(key) == actual.get(key):
+                    continue
+                mismatches += 1
+                if mismatches <= options["limit"]:
+                    self.stdout.write(
+                        f"{key}: записи {expected.get(key)}, "
+                        f"итоги {actual.get(key)}"
+                    )
+
+        if mismatches:
+            raise CommandError(
+                f"Найдено расхождений: {mismatches}. "
+                f"Выполните python manage.py rebuild_rollup"
+            )
+        self.stdout.write(self.style.SUCCESS("Итоги совпадают с записями"))
@@ -0,0 +1,143 @@
+"""
+Метрики приложения в текстовом формате Prometheus.
+
+Метрики объявлены на уровне модуля через prometheus_client. При
+нескольких процессах-воркерах на хосте задайте PROMETHEUS_MULTIPROC_DIR
+(общий пустой каталог, очищаемый при старте сервиса) до запуска
+воркеров: каждый процесс пишет значения в свои файлы, а представление
+metrics суммирует их по всем процессам, так что любой воркер отдаёт
+сводные данные по хосту. Без переменной отдаётся реестр текущего
+процесса.
+
+Метрики отдаются только адресам из CASHFLOW_METRICS_ALLOWED_IPS
+и staff-пользователям.
+"""
+import ipaddress
+import os
+
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+from cash_flow.instrumentation import QueryCounter
+
+# Представление для запросов, не сопоставленных ни одному URL:
+# произвольные пути не должны порождать новые ряды.
+UNRESOLVED_VIEW = "<unresolved>"
+
+REQUEST_LABELS = ("view", "method", "status")
+
+http_requests = Counter(
+    "cashflow_http_requests_total",
+    "HTTP-запросы по представлению, методу и статусу",
+    REQUEST_LABELS,
+)
+http_request_duration = Histogram(
+    "cashflow_http_request_duration_seconds",
+    "Время обработки HTTP-запроса",
+    REQUEST_LABELS,
+    buckets=(
+        0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75,
+        1.0, 2.5, 5.0, 10.0,
+    ),
+)
+db_queries = Histogram(
+    "cashflow_db_queries_per_request",
+    "Число запросов к БД за HTTP-запрос",
+    ("view",),
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144),
+)
+db_duration = Histogram(
+    "cashflow_db_duration_seconds",
+    "Суммарное время запросов к БД за HTTP-запрос",
+    ("view",),
+    buckets=(
+        0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+        1.0, 2.5, 5.0,
+    ),
+)
+cache_requests = Counter(
+    "cashflow_cache_requests_total",
+    "Обращения к кэшам приложения; result - hit или miss",
+    ("cache", "result"),
+)
+ingested_records = Counter(
+    "cashflow_ingested_records_total",
+    "Загруженные записи ДДС по источнику; outcome - imported или rejected",
+    ("source", "outcome"),
+)
+ingest_batch_duration = Histogram(
+    "cashflow_ingest_batch_duration_seconds",
+    "Время загрузки пачки записей в БД",
+    ("source",),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+
+
+def view_name(request: HttpRequest) -> str:
+    match = getattr(request, "resolver_match", None)
+    return match.view_name if match is not None else UNRESOLVED_VIEW
+
+
+def observe_request(
+        request: HttpRequest,
+        response: HttpResponse,
+        duration: float,
+        queries: QueryCounter,
+):
+    view = view_name(request)
+    labels = (view, request.method, str(response.status_code))
+    http_requests.labels(*labels).inc()
+    http_request_duration.labels(*labels).observe(duration)
+    db_queries.labels(view).observe(queries.count)
+    db_duration.labels(view).observe(queries.time)
+
+
+def cache_hit(cache: str, hit: bool, count: int = 1):
+    if count:
+        cache_requests.labels(cache, "hit" if hit else "miss").inc(count)
+
+
+def registry() -> CollectorRegistry:
+    """ Реестр для выдачи: сводный по процессам или текущего процесса """
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    collected = CollectorRegistry()
+    multiprocess.MultiProcessCollector(collected)
+    return collected
+
+
+def metrics_allowed(request: HttpRequest) -> bool:
+    """
+    Запрос со staff-пользователем или с адреса из
+    CASHFLOW_METRICS_ALLOWED_IPS. За обратным прокси REMOTE_ADDR -
+    адрес прокси: разрешайте его, а не заголовок X-Forwarded-For,
+    который задаёт клиент.
+    """
+    user = getattr(request, "user", None)
+    if user is not None and user.is_active and user.is_staff:
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get("REMOTE_ADDR", ""))
+    except ValueError:
+        return False
+    return any(
+        address in ipaddress.ip_network(network, strict=False)
+        for network in settings.CASHFLOW_METRICS_ALLOWED_IPS
+    )
+
+
+def metrics(request: HttpRequest) -> HttpResponse:
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        generate_latest(registry()), content_type=CONTENT_TYPE_LATEST
+    )
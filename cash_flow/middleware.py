@@ -0,0 +1,193 @@
+import json
+import logging
+import random
+import time
+
+from asgiref.sync import (
+    iscoroutinefunction,
+    markcoroutinefunction,
+    sync_to_async,
+)
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpRequest, HttpResponse
+
+from cash_flow import db_routing, metrics
+from cash_flow.instrumentation import (
+    QueryCounter,
+    QueryProfile,
+    instrument_queries,
+    milliseconds,
+    profile_queries,
+)
+
+sql_logger = logging.getLogger("cash_flow.sql")
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Задаёт состояние маршрутизации БД на время запроса: чтение
+    с реплики разрешается безопасным запросам к помеченным
+    представлениям (см. db_routing.replica_view). После успешного
+    запроса, который писал в БД (db_for_write роутера), сессия
+    на CASHFLOW_STICKY_PRIMARY_SECONDS закрепляется за основной БД,
+    чтобы пользователь видел свои изменения. Запросы с ошибкой
+    и небезопасные запросы без записи сессию не закрепляют.
+    Должна стоять после SessionMiddleware.
+    Работает и под WSGI, и под ASGI без перехода в синхронный режим.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = db_routing.begin_request(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = db_routing.end_request(token)
+        if self.sticks(wrote, response):
+            db_routing.mark_primary_sticky(request)
+        return response
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        token = db_routing.begin_request(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            wrote = db_routing.end_request(token)
+        if self.sticks(wrote, response):
+            await sync_to_async(db_routing.mark_primary_sticky)(request)
+        return response
+
+    @staticmethod
+    def sticks(wrote: bool, response: HttpResponse) -> bool:
+        """
+        Закрепить сессию: запрос писал и завершился успешно.
+        Перенаправление тоже успех - так отвечают формы после сохранения.
+        """
+        return wrote and response.status_code < 400
+
+
+class SqlInstrumentationMiddleware:
+    """
+    Профилирует запросы к БД для доли CASHFLOW_SQL_SAMPLE_RATE
+    HTTP-запросов: число запросов, время в БД, самые долгие формы
+    запросов и повторы (N+1, см. instrumentation.py). Итог пишется
+    в лог cash_flow.sql одной JSON-строкой (с повторами - WARNING)
+    и в заголовок Server-Timing, который показывают инструменты
+    разработчика браузера.
+    При нулевой доле не подключается вовсе. Должна стоять первой,
+    чтобы время app включало остальные промежуточные слои.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.sample_rate = settings.CASHFLOW_SQL_SAMPLE_RATE
+        if self.sample_rate <= 0:
+            raise MiddlewareNotUsed
+        self.slowest = settings.CASHFLOW_SQL_SLOWEST
+        self.duplicate_threshold = settings.CASHFLOW_SQL_DUPLICATE_THRESHOLD
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def sampled(self) -> bool:
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        started = time.perf_counter()
+        with profile_queries(self.slowest) as profile:
+            response = self.get_response(request)
+        self.report(request, response, profile, started)
+        return response
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        if not self.sampled():
+            return await self.get_response(request)
+        started = time.perf_counter()
+        with profile_queries(self.slowest) as profile:
+            response = await self.get_response(request)
+        self.report(request, response, profile, started)
+        return response
+
+    def report(
+            self, request: HttpRequest, response: HttpResponse,
+            profile: QueryProfile, started: float,
+    ):
+        elapsed = time.perf_counter() - started
+        duplicates = profile.duplicates(self.duplicate_threshold)
+        sql_logger.log(
+            logging.WARNING if duplicates else logging.INFO,
+            json.dumps({
+                "method": request.method,
+                "path": request.path,
+                "view": getattr(
+                    request.resolver_match, "view_name", None
+                ),
+                "status": response.status_code,
+                "duration_ms": milliseconds(elapsed),
+                "db_ms": milliseconds(profile.time),
+                "queries": profile.count,
+                "databases": profile.by_alias,
+                "slowest": profile.slowest(),
+                "duplicates": duplicates,
+            }, ensure_ascii=False),
+        )
+        timing = (
+            f"db;dur={milliseconds(profile.time)};"
+            f'desc="{profile.count} queries", '
+            f"app;dur={milliseconds(elapsed)}"
+        )
+        if response.has_header("Server-Timing"):
+            timing = f"{response['Server-Timing']}, {timing}"
+        response["Server-Timing"] = timing
+
+
+class MetricsMiddleware:
+    """
+    Учитывает в метриках Prometheus (см. metrics.py) каждый запрос:
+    время обработки, число и время запросов к БД по имени URL
+    представления, методу и статусу ответа.
+    Отключается CASHFLOW_METRICS_ENABLED = False. Должна стоять первой.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.CASHFLOW_METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with instrument_queries(QueryCounter()) as queries:
+            response = self.get_response(request)
+        metrics.observe_request(
+            request, response, time.perf_counter() - started, queries
+        )
+        return response
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        started = time.perf_counter()
+        with instrument_queries(QueryCounter()) as queries:
+            response = await self.get_response(request)
+        metrics.observe_request(
+            request, response, time.perf_counter() - started, queries
+        )
+        return response
@@ -0,0 +1,71 @@
+import datetime
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_effective_date(apps, schema_editor):
+    CashFlowRecord = apps.get_model("cash_flow", "CashFlowRecord")
+    CashFlowRecord.objects.using(schema_editor.connection.alias).update(
+        effective_date=Coalesce("custom_date", "created_at")
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cash_flow", "0003_alter_cashflowrecord_options"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="cashflowrecord",
+            name="effective_date",
+            field=models.DateField(
+                editable=False, null=True, verbose_name="Дата операции"
+            ),
+        ),
+        migrations.RunPython(fill_effective_date, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="cashflowrecord",
+            name="effective_date",
+            field=models.DateField(
+                default=datetime.date.today,
+                editable=False,
+                verbose_name="Дата операции",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name="cashflowrecord",
+            index=models.Index(
+                fields=["effective_date", "id"], name="cfr_effective_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="cashflowrecord",
+            index=models.Index(
+                fields=["status", "effective_date"], name="cfr_status_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="cashflowrecord",
+            index=models.Index(
+                fields=["type", "effective_date"], name="cfr_type_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="cashflowrecord",
+            index=models.Index(
+                fields=["category", "effective_date"],
+                name="cfr_category_date_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="cashflowrecord",
+            index=models.Index(
+                fields=["subcategory", "effective_date"],
+                name="cfr_subcategory_date_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,110 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:00
+
+import django.db.models.deletion
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+def fill_rollup(apps, schema_editor):
+    CashFlowDailyRollup = apps.get_model("cash_flow", "CashFlowDailyRollup")
+    CashFlowRecord = apps.get_model("cash_flow", "CashFlowRecord")
+    qn = schema_editor.connection.ops.quote_name
+    schema_editor.execute(
+        f"INSERT INTO {qn(CashFlowDailyRollup._meta.db_table)} "
+        "(date, type_id, category_id, subcategory_id, status_id, "
+        "amount_total, record_count) "
+        "SELECT effective_date, type_id, category_id, subcategory_id, "
+        "status_id, SUM(amount), COUNT(*) "
+        f"FROM {qn(CashFlowRecord._meta.db_table)} "
+        "GROUP BY effective_date, type_id, category_id, subcategory_id, "
+        "status_id"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cash_flow", "0004_cashflowrecord_effective_date"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CashFlowDailyRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField(verbose_name="Дата")),
+                (
+                    "amount_total",
+                    models.DecimalField(
+                        decimal_places=2, max_digits=18, verbose_name="Сумма"
+                    ),
+                ),
+                (
+                    "record_count",
+                    models.BigIntegerField(verbose_name="Количество записей"),
+                ),
+                (
+                    "category",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="cash_flow.category",
+                    ),
+                ),
+                (
+                    "status",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="cash_flow.status",
+                    ),
+                ),
+                (
+                    "subcategory",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="cash_flow.subcategory",
+                    ),
+                ),
+                (
+                    "type",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="cash_flow.type",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "дневной итог ДДС",
+                "verbose_name_plural": "дневные итоги ДДС",
+                "constraints": [
+                    # COALESCE вместо nulls_distinct=False: тот требует
+                    # PostgreSQL 15+, а на старых версиях Django его
+                    # пропускает, и у ON CONFLICT нет подходящего индекса.
+                    models.UniqueConstraint(
+                        models.F("date"),
+                        models.F("type"),
+                        models.F("category"),
+                        models.F("subcategory"),
+                        django.db.models.functions.comparison.Coalesce(
+                            "status", models.Value(0)
+                        ),
+                        name="cfr_rollup_unique_key",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(fill_rollup, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,184 @@
+"""
+Секционирование таблицы записей по месяцам effective_date (PostgreSQL).
+
+Существующая таблица переименовывается, на её месте создаётся
+секционированная таблица той же структуры с секциями на каждый месяц
+данных и CASHFLOW_PARTITION_MONTHS_AHEAD месяцев вперёд, строки
+копируются, индексы и внешние ключи создаются заново на родительской
+таблице (и тем самым в каждой секции), добавляется BRIN-индекс по дате.
+Первичный ключ секционированной таблицы - (id, effective_date):
+PostgreSQL требует ключ секционирования в уникальных ограничениях.
+Для других СУБД миграция ничего не делает.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import migrations
+
+TABLE = "cash_flow_cashflowrecord"
+OLD_TABLE = f"{TABLE}_unpartitioned"
+BRIN_INDEX = "cfr_effective_date_brin"
+
+
+def _add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def _relkind(cursor, table):
+    cursor.execute(
+        "SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [table]
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _rebuild(schema_editor, partitioned):
+    """
+    Пересоздаёт таблицу записей секционированной (partitioned=True)
+    или обычной, сохраняя строки, индексы, внешние ключи и счётчик id.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql":
+        return
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        if (_relkind(cursor, TABLE) == "p") == partitioned:
+            return
+
+        cursor.execute(
+            "SELECT i.relname, pg_get_indexdef(i.oid) "
+            "FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid "
+            "WHERE x.indrelid = %s::regclass AND NOT x.indisprimary",
+            [TABLE],
+        )
+        indexes = [
+            (name, definition) for name, definition in cursor.fetchall()
+            if partitioned or name != BRIN_INDEX
+        ]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype IN ('p', 'f')",
+            [TABLE],
+        )
+        constraints = cursor.fetchall()
+        cursor.execute(
+            "SELECT attidentity FROM pg_attribute "
+            "WHERE attrelid = %s::regclass AND attname = 'id'",
+            [TABLE],
+        )
+        is_identity = cursor.fetchone()[0] != ""
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [TABLE])
+        sequence = cursor.fetchone()[0]
+        cursor.execute(f"SELECT last_value FROM {sequence}")
+        last_id = cursor.fetchone()[0]
+        cursor.execute(
+            f"SELECT MIN(effective_date) FROM {qn(TABLE)}"
+        )
+        first_date = cursor.fetchone()[0]
+
+    # Старая таблица освобождает имена индексов, ограничений
+    # и последовательности.
+    schema_editor.execute(
+        f"ALTER TABLE {qn(TABLE)} RENAME TO {qn(OLD_TABLE)}"
+    )
+    for name, _ in indexes:
+        schema_editor.execute(f"DROP INDEX {qn(name)}")
+    for name, _ in constraints:
+        schema_editor.execute(
+            f"ALTER TABLE {qn(OLD_TABLE)} DROP CONSTRAINT {qn(name)}"
+        )
+    if is_identity:
+        schema_editor.execute(
+            f"ALTER TABLE {qn(OLD_TABLE)} ALTER COLUMN id DROP IDENTITY"
+        )
+    else:
+        schema_editor.execute(
+            f"ALTER TABLE {qn(OLD_TABLE)} ALTER COLUMN id DROP DEFAULT"
+        )
+        schema_editor.execute(f"DROP SEQUENCE {sequence}")
+
+    partition_clause = (
+        " PARTITION BY RANGE (effective_date)" if partitioned else ""
+    )
+    schema_editor.execute(
+        f"CREATE TABLE {qn(TABLE)} (LIKE {qn(OLD_TABLE)} "
+        f"INCLUDING DEFAULTS INCLUDING CONSTRAINTS){partition_clause}"
+    )
+    sequence = qn(f"{TABLE}_id_seq")
+    schema_editor.execute(
+        f"CREATE SEQUENCE {sequence} OWNED BY {qn(TABLE)}.id"
+    )
+    schema_editor.execute(
+        f"ALTER TABLE {qn(TABLE)} ALTER COLUMN id "
+        f"SET DEFAULT nextval('{sequence}')"
+    )
+    schema_editor.execute(
+        f"ALTER TABLE {qn(TABLE)} ADD CONSTRAINT {qn(f'{TABLE}_pkey')} "
+        + ("PRIMARY KEY (id, effective_date)" if partitioned
+           else "PRIMARY KEY (id)")
+    )
+
+    if partitioned:
+        today = datetime.date.today().replace(day=1)
+        month = min(first_date or today, today).replace(day=1)
+        last = _add_months(today, settings.CASHFLOW_PARTITION_MONTHS_AHEAD)
+        while month <= last:
+            following = _add_months(month, 1)
+            schema_editor.execute(
+                f"CREATE TABLE {qn(f'{TABLE}_p{month:%Y%m}')} "
+                f"PARTITION OF {qn(TABLE)} "
+                f"FOR VALUES FROM ('{month}') TO ('{following}')"
+            )
+            month = following
+        schema_editor.execute(
+            f"CREATE TABLE {qn(f'{TABLE}_default')} "
+            f"PARTITION OF {qn(TABLE)} DEFAULT"
+        )
+
+    schema_editor.execute(
+        f"INSERT INTO {qn(TABLE)} SELECT * FROM {qn(OLD_TABLE)}"
+    )
+    for _, definition in indexes:
+        schema_editor.execute(definition)
+    # Внешние ключи - после копирования: строки проверяются один раз.
+    for name, definition in constraints:
+        if not definition.startswith("PRIMARY KEY"):
+            schema_editor.execute(
+                f"ALTER TABLE {qn(TABLE)} ADD CONSTRAINT {qn(name)} "
+                f"{definition}"
+            )
+    if partitioned:
+        schema_editor.execute(
+            f"CREATE INDEX {qn(BRIN_INDEX)} ON {qn(TABLE)} "
+            "USING brin (effective_date)"
+        )
+    schema_editor.execute(
+        f"SELECT setval('{sequence}', GREATEST(%s, "
+        f"(SELECT COALESCE(MAX(id), 1) FROM {qn(TABLE)})))",
+        [last_id],
+    )
+    schema_editor.execute(f"DROP TABLE {qn(OLD_TABLE)}")
+    if partitioned:
+        # Секционированная таблица без статистики: список и оценка
+        # количества строк опираются на pg_class.reltuples секций.
+        schema_editor.execute(f"ANALYZE {qn(TABLE)}")
+
+
+def partition_records(apps, schema_editor):
+    _rebuild(schema_editor, partitioned=True)
+
+
+def unpartition_records(apps, schema_editor):
+    _rebuild(schema_editor, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cash_flow", "0005_cashflowdailyrollup"),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_records, unpartition_records),
+    ]
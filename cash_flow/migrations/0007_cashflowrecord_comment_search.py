@@ -0,0 +1,51 @@
+"""
+Индексы поиска по комментарию записей (PostgreSQL): GIN по русскому
+tsvector для поиска слов и GIN с gin_trgm_ops (pg_trgm) для нечёткого
+поиска и поиска подстроки. Выражение tsvector совпадает с тем, что
+строит SearchVector("comment", config="russian") в
+CashFlowRecordQuerySet.search, иначе индекс не будет использован.
+Для других СУБД миграция ничего не делает.
+"""
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+TABLE = "cash_flow_cashflowrecord"
+INDEXES = {
+    "cfr_comment_fts_idx": (
+        "USING gin (to_tsvector('russian'::regconfig, "
+        "COALESCE(comment, ''::text)))"
+    ),
+    "cfr_comment_trgm_idx": "USING gin (comment gin_trgm_ops)",
+}
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    qn = schema_editor.quote_name
+    for name, definition in INDEXES.items():
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {qn(name)} ON {qn(TABLE)} "
+            f"{definition}"
+        )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name in INDEXES:
+        schema_editor.execute(
+            f"DROP INDEX IF EXISTS {schema_editor.quote_name(name)}"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("cash_flow", "0006_partition_cashflowrecord"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:34
+
+from django.db import migrations, models
+
+# Типы, которые до появления is_expense означали списание.
+EXPENSE_TYPE_NAMES = ("Списание",)
+
+
+def mark_expense_types(apps, schema_editor):
+    Type = apps.get_model("cash_flow", "Type")
+    Type.objects.using(schema_editor.connection.alias).filter(
+        name__in=EXPENSE_TYPE_NAMES
+    ).update(is_expense=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cash_flow', '0007_cashflowrecord_comment_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(unique=True, verbose_name='Месяц (первое число)')),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=18, verbose_name='Остаток на конец месяца')),
+            ],
+            options={
+                'verbose_name': 'остаток на конец месяца',
+                'verbose_name_plural': 'остатки на конец месяца',
+                'ordering': ('month',),
+            },
+        ),
+        migrations.AddField(
+            model_name='type',
+            name='is_expense',
+            field=models.BooleanField(default=False, verbose_name='Списание (уменьшает остаток)'),
+        ),
+        migrations.RunPython(mark_expense_types, migrations.RunPython.noop),
+    ]
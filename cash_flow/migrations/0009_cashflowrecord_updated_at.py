@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:41
+
+import django.db.models.functions.datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cash_flow', '0008_type_is_expense_balancecheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cashflowrecord',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_default=django.db.models.functions.datetime.Now(), verbose_name='Дата изменения'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:44
+
+from django.db import migrations, models
+from django.db.models import Max
+from django.db.models.functions import TruncMonth
+
+
+def create_markers(apps, schema_editor):
+    """ Метки для месяцев, в которых уже есть записи """
+    CashFlowRecord = apps.get_model("cash_flow", "CashFlowRecord")
+    RecordChangeMarker = apps.get_model("cash_flow", "RecordChangeMarker")
+    using = schema_editor.connection.alias
+    months = (
+        CashFlowRecord.objects.using(using)
+        .annotate(month=TruncMonth("effective_date"))
+        .values("month")
+        .annotate(changed_at=Max("updated_at"))
+        .order_by("month")
+    )
+    RecordChangeMarker.objects.using(using).bulk_create(
+        RecordChangeMarker(
+            month=row["month"], version=1, changed_at=row["changed_at"]
+        )
+        for row in months
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cash_flow', '0009_cashflowrecord_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecordChangeMarker',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(unique=True, verbose_name='Месяц (первое число)')),
+                ('version', models.PositiveBigIntegerField(default=0, verbose_name='Версия')),
+                ('changed_at', models.DateTimeField(verbose_name='Время изменения')),
+            ],
+            options={
+                'verbose_name': 'метка изменений записей',
+                'verbose_name_plural': 'метки изменений записей',
+                'ordering': ('month',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='cashflowrecord',
+            index=models.Index(fields=['updated_at'], name='cfr_updated_at_idx'),
+        ),
+        migrations.RunPython(create_markers, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,55 @@
-from django.db import models
+import datetime
+from decimal import Decimal
+
+from django.contrib.postgres.search import (
+    SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity,
+)
+from django.db import (
+    DEFAULT_DB_ALIAS, connections, models, router, transaction,
+)
+from django.db.models import (
+    Case, Count, DecimalField, Exists, F, Max, Q, Sum, Value, When,
+)
+from django.db.models.functions import Cast, Coalesce, Now, TruncMonth
+from django.utils import timezone
 from utils import NULLABLE
 
+from cash_flow.months import add_months
+
+# Поля записи, по которым ведутся дневные итоги (CashFlowDailyRollup).
+ROLLUP_RECORD_FIELDS = (
+    "effective_date", "type_id", "category_id", "subcategory_id", "status_id"
+)
+ROLLUP_FIELDS = ("date", "type_id", "category_id", "subcategory_id", "status_id")
+# Цель ON CONFLICT для дневных итогов - выражения индекса
+# cfr_rollup_unique_key. Записи без статуса сводятся к ключу 0:
+# NULLS NOT DISTINCT есть только с PostgreSQL 15.
+ROLLUP_CONFLICT_TARGET = (
+    "(date, type_id, category_id, subcategory_id, (COALESCE(status_id, 0)))"
+)
+
+# Аннотация с рангом результата поиска (CashFlowRecordQuerySet.search).
+SEARCH_RANK = "search_rank"
+SEARCH_CONFIG = "russian"
+
+
+def add_rollup_deltas(deltas, rows, sign=1):
+    """
+    Накапливает изменения дневных итогов по строкам записей ДДС.
+
+    Args:
+        deltas: словарь {ключ итогов: [сумма, количество]}, дополняется на месте.
+        rows: словари с полями ROLLUP_RECORD_FIELDS и amount,
+            при необходимости с count для уже сгруппированных строк.
+        sign: 1 для добавленных записей, -1 для удалённых.
+    """
+    for row in rows:
+        key = tuple(row[field_name] for field_name in ROLLUP_RECORD_FIELDS)
+        delta = deltas.setdefault(key, [Decimal("0"), 0])
+        delta[0] += sign * row["amount"]
+        delta[1] += sign * row.get("count", 1)
+    return deltas
+
 
 class Status(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -13,8 +62,22 @@ class Status(models.Model):
         return self.name
 
 
+def signed_amount(field_name="amount", type_path="type"):
+    """
+    Сумма со знаком для баланса: списания (Type.is_expense)
+    уменьшают остаток, остальные типы увеличивают.
+    """
+    return Case(
+        When(**{f"{type_path}__is_expense": True}, then=-F(field_name)),
+        default=F(field_name),
+    )
+
+
 class Type(models.Model):
     name = models.CharField(max_length=100, unique=True)
+    is_expense = models.BooleanField(
+        default=False, verbose_name="Списание (уменьшает остаток)"
+    )
 
     class Meta:
         verbose_name = "тип"
@@ -56,6 +119,99 @@ class SubCategory(models.Model):
         return f"{self.name} ({self.category.name})"
 
 
+class CashFlowRecordQuerySet(models.QuerySet):
+
+    def with_related(self):
+        """ Подгружает справочники записи одним запросом """
+        return self.select_related("status", "type", "category", "subcategory")
+
+    def filter_by(self, cleaned_data):
+        """
+        Применяет фильтры из очищенных данных CashFlowFilterForm.
+        """
+        queryset = self
+        if cleaned_data.get("date_from"):
+            queryset = queryset.filter(
+                effective_date__gte=cleaned_data["date_from"]
+            )
+        if cleaned_data.get("date_to"):
+            queryset = queryset.filter(
+                effective_date__lte=cleaned_data["date_to"]
+            )
+        for field_name in ("status", "type", "category", "subcategory"):
+            if cleaned_data.get(field_name):
+                queryset = queryset.filter(
+                    **{field_name: cleaned_data[field_name]}
+                )
+        if cleaned_data.get("amount_min") is not None:
+            queryset = queryset.filter(amount__gte=cleaned_data["amount_min"])
+        if cleaned_data.get("amount_max") is not None:
+            queryset = queryset.filter(amount__lte=cleaned_data["amount_max"])
+        if cleaned_data.get("search"):
+            queryset = queryset.search(cleaned_data["search"])
+        return queryset
+
+    def search(self, text):
+        """
+        Поиск по комментарию.
+
+        На PostgreSQL запись подходит, если комментарий содержит слова
+        запроса с учётом русской морфологии (GIN-индекс по tsvector),
+        похожее слово (опечатка, часть слова - триграммный индекс)
+        или подстроку. Записи аннотируются рангом SEARCH_RANK:
+        ts_rank плюс триграммное сходство. На других СУБД - только
+        поиск подстроки без ранга.
+        """
+        text = text.strip()
+        if not text:
+            return self
+        # Реплики - копии основной БД, поэтому СУБД определяется без
+        # маршрутизации: её решение может потребовать обращения к БД,
+        # а search вызывается и из асинхронных представлений.
+        if connections[self._db or DEFAULT_DB_ALIAS].vendor != "postgresql":
+            return self.filter(comment__icontains=text)
+
+        query = SearchQuery(
+            text, config=SEARCH_CONFIG, search_type="websearch"
+        )
+        rank = (
+            SearchRank(SearchVector("comment", config=SEARCH_CONFIG), query)
+            + TrigramWordSimilarity(text, "comment")
+        )
+        return self.filter(
+            Q(comment__search=query)
+            | Q(comment__trigram_word_similar=text)
+            | Q(comment__icontains=text)
+        ).annotate(**{
+            # Ранг округляется до numeric, чтобы значение из курсора
+            # пагинации точно совпадало со значением в БД.
+            SEARCH_RANK: Cast(
+                rank, DecimalField(max_digits=9, decimal_places=6)
+            ),
+        })
+
+    def delete(self):
+        """
+        Удаление с вычитанием удалённых записей из дневных итогов.
+        Итоги удаляемых строк считаются одним запросом с GROUP BY.
+        """
+        using = router.db_for_write(self.model)
+        with transaction.atomic(using=using):
+            groups = (
+                self.using(using)
+                .order_by()
+                .values(*ROLLUP_RECORD_FIELDS)
+                .annotate(amount=Sum("amount"), count=Count("id"))
+            )
+            deltas = add_rollup_deltas({}, groups, sign=-1)
+            result = super().delete()
+            CashFlowDailyRollup.objects.apply_deltas(deltas, using=using)
+        return result
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+
 class CashFlowRecord(models.Model):
     created_at = models.DateField(
         auto_now_add=True, verbose_name="Дата создания(автоматически)"
@@ -73,14 +229,458 @@ class CashFlowRecord(models.Model):
         verbose_name="Количество средств в рублях"
     )
     comment = models.TextField(verbose_name="Комментарий", **NULLABLE)
+    effective_date = models.DateField(
+        verbose_name="Дата операции", editable=False
+    )
+    # Заполняется и при загрузке через COPY, минуя ORM (db_default).
+    updated_at = models.DateTimeField(
+        auto_now=True, db_default=Now(), verbose_name="Дата изменения"
+    )
+
+    objects = CashFlowRecordQuerySet.as_manager()
 
     class Meta:
         verbose_name = "запись ДДС"
         verbose_name_plural = "записи ДДС"
+        indexes = [
+            models.Index(
+                fields=["effective_date", "id"], name="cfr_effective_date_idx"
+            ),
+            models.Index(
+                fields=["status", "effective_date"], name="cfr_status_date_idx"
+            ),
+            models.Index(
+                fields=["type", "effective_date"], name="cfr_type_date_idx"
+            ),
+            models.Index(
+                fields=["category", "effective_date"],
+                name="cfr_category_date_idx"
+            ),
+            models.Index(
+                fields=["subcategory", "effective_date"],
+                name="cfr_subcategory_date_idx"
+            ),
+            models.Index(fields=["updated_at"], name="cfr_updated_at_idx"),
+        ]
+
+    def compute_effective_date(self):
+        """
+        Дата, по которой запись фильтруется и сортируется:
+        дата, указанная вручную, иначе дата создания.
+        """
+        return (
+            self.custom_date or self.created_at or datetime.date.today()
+        )
+
+    def _locked_rollup_values(self, using):
+        """
+        Значения записи в БД, влияющие на дневные итоги.
+        Строка блокируется до конца транзакции.
+        """
+        if self._state.adding or self.pk is None:
+            return None
+        return (
+            type(self).objects.using(using)
+            .select_for_update()
+            .filter(pk=self.pk)
+            .values(*ROLLUP_RECORD_FIELDS, "amount")
+            .first()
+        )
+
+    def _rollup_values(self):
+        values = {
+            field_name: getattr(self, field_name)
+            for field_name in ROLLUP_RECORD_FIELDS
+        }
+        values["amount"] = Decimal(self.amount)
+        return values
+
+    def save(self, *args, **kwargs):
+        """
+        Сохранение с пересчётом effective_date и дневных итогов
+        в одной транзакции.
+        """
+        self.effective_date = self.compute_effective_date()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {
+                *update_fields, "effective_date", "updated_at"
+            }
+
+        using = kwargs.get("using") or router.db_for_write(
+            type(self), instance=self
+        )
+        with transaction.atomic(using=using):
+            old_values = self._locked_rollup_values(using)
+            super().save(*args, **kwargs)
+            deltas = add_rollup_deltas({}, [self._rollup_values()])
+            if old_values:
+                add_rollup_deltas(deltas, [old_values], sign=-1)
+            CashFlowDailyRollup.objects.apply_deltas(deltas, using=using)
+
+    def delete(self, *args, **kwargs):
+        using = kwargs.get("using") or router.db_for_write(
+            type(self), instance=self
+        )
+        with transaction.atomic(using=using):
+            old_values = self._locked_rollup_values(using)
+            result = super().delete(*args, **kwargs)
+            if old_values:
+                CashFlowDailyRollup.objects.apply_deltas(
+                    add_rollup_deltas({}, [old_values], sign=-1), using=using
+                )
+        return result
 
     def get_effective_date(self):
-        return self.custom_date if self.custom_date else self.created_at
+        return self.effective_date or self.compute_effective_date()
 
     def __str__(self):
         return (f"{self.get_effective_date()} "
                 f"| {self.type.name} | {self.amount} руб.")
+
+
+class CashFlowDailyRollupQuerySet(models.QuerySet):
+
+    def filter_by(self, cleaned_data):
+        """
+        Применяет фильтры из очищенных данных CashFlowFilterForm.
+        """
+        queryset = self
+        if cleaned_data.get("date_from"):
+            queryset = queryset.filter(date__gte=cleaned_data["date_from"])
+        if cleaned_data.get("date_to"):
+            queryset = queryset.filter(date__lte=cleaned_data["date_to"])
+        for field_name in ("status", "type", "category", "subcategory"):
+            if cleaned_data.get(field_name):
+                queryset = queryset.filter(
+                    **{field_name: cleaned_data[field_name]}
+                )
+        return queryset
+
+    def apply_deltas(self, deltas, using=None):
+        """
+        Прибавляет изменения к дневным итогам.
+        Должен вызываться в той же транзакции, что и изменение записей.
+
+        Args:
+            deltas: словарь {ключ итогов: (сумма, количество)},
+                см. add_rollup_deltas.
+            using: алиас БД, по умолчанию БД для записи.
+        """
+        using = using or router.db_for_write(self.model)
+        if deltas:
+            # Нулевое изменение итогов - тоже изменение записей
+            # (например, комментария): метки месяцев меняются.
+            RecordChangeMarker.objects.touch(
+                {key[0] for key in deltas}, using=using
+            )
+        deltas = {
+            key: delta for key, delta in deltas.items() if any(delta)
+        }
+        if not deltas:
+            return
+
+        # Сортировка ключей - единый порядок блокировок для параллельных
+        # транзакций, иначе возможны взаимоблокировки.
+        keys = sorted(deltas, key=lambda k: tuple((v is None, v) for v in k))
+        if connections[using].vendor == "postgresql":
+            self._upsert_deltas(keys, deltas, using)
+        else:
+            for key in keys:
+                amount, count = deltas[key]
+                lookup = dict(zip(ROLLUP_FIELDS, key))
+                updated = self.using(using).filter(**lookup).update(
+                    amount_total=F("amount_total") + amount,
+                    record_count=F("record_count") + count,
+                )
+                if not updated:
+                    self.using(using).create(
+                        amount_total=amount, record_count=count, **lookup
+                    )
+
+        self.using(using).filter(
+            date__in={key[0] for key in keys}, record_count__lte=0
+        ).delete()
+        BalanceCheckpoint.objects.apply_deltas(deltas, using=using)
+
+    def _upsert_deltas(self, keys, deltas, using):
+        table = connections[using].ops.quote_name(self.model._meta.db_table)
+        columns = ", ".join(
+            field_name for field_name in ROLLUP_FIELDS
+        )
+        placeholders = ", ".join(["(%s, %s, %s, %s, %s, %s, %s)"] * len(keys))
+        params = []
+        for key in keys:
+            params += [*key, *deltas[key]]
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}, amount_total, record_count) "
+                f"VALUES {placeholders} "
+                f"ON CONFLICT {ROLLUP_CONFLICT_TARGET} DO UPDATE SET "
+                f"amount_total = {table}.amount_total "
+                f"+ EXCLUDED.amount_total, "
+                f"record_count = {table}.record_count "
+                f"+ EXCLUDED.record_count",
+                params,
+            )
+
+    def rebuild(self, using=None):
+        """
+        Полностью пересчитывает дневные итоги по таблице записей
+        одним запросом INSERT ... SELECT ... GROUP BY.
+        """
+        using = using or router.db_for_write(self.model)
+        connection = connections[using]
+        qn = connection.ops.quote_name
+        table = qn(self.model._meta.db_table)
+        records_table = qn(CashFlowRecord._meta.db_table)
+        columns = ", ".join(ROLLUP_FIELDS)
+        source_columns = ", ".join(ROLLUP_RECORD_FIELDS)
+        with transaction.atomic(using=using):
+            self.using(using).delete()
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {table} "
+                    f"({columns}, amount_total, record_count) "
+                    f"SELECT {source_columns}, SUM(amount), COUNT(*) "
+                    f"FROM {records_table} "
+                    f"GROUP BY {source_columns}"
+                )
+                return cursor.rowcount
+
+
+class CashFlowDailyRollup(models.Model):
+    """
+    Дневные итоги записей ДДС в разрезе справочников.
+    Обновляются вместе с записями, отчёты читают только эту таблицу.
+    """
+    date = models.DateField(verbose_name="Дата")
+    type = models.ForeignKey(
+        Type, on_delete=models.CASCADE, related_name="+"
+    )
+    category = models.ForeignKey(
+        Category, on_delete=models.CASCADE, related_name="+"
+    )
+    subcategory = models.ForeignKey(
+        SubCategory, on_delete=models.CASCADE, related_name="+"
+    )
+    status = models.ForeignKey(
+        Status, on_delete=models.CASCADE, related_name="+", **NULLABLE
+    )
+    amount_total = models.DecimalField(
+        max_digits=18, decimal_places=2, verbose_name="Сумма"
+    )
+    record_count = models.BigIntegerField(verbose_name="Количество записей")
+
+    objects = CashFlowDailyRollupQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "дневной итог ДДС"
+        verbose_name_plural = "дневные итоги ДДС"
+        constraints = [
+            models.UniqueConstraint(
+                "date", "type", "category", "subcategory",
+                Coalesce("status", Value(0)),
+                name="cfr_rollup_unique_key",
+            ),
+        ]
+
+
+class BalanceCheckpointQuerySet(models.QuerySet):
+
+    def apply_deltas(self, deltas, using=None):
+        """
+        Исправляет остатки на конец месяцев, затронутых изменением
+        записей: изменение за месяц прибавляется к остаткам этого
+        и всех последующих месяцев. Знак суммы определяется типом
+        в самом UPDATE, поэтому на месяц - один запрос.
+
+        Args:
+            deltas: изменения дневных итогов, см. add_rollup_deltas.
+            using: алиас БД, по умолчанию БД для записи.
+        """
+        using = using or router.db_for_write(self.model)
+        by_month = {}
+        for (date, type_id, *_), (amount, _) in deltas.items():
+            month = by_month.setdefault(date.replace(day=1), {})
+            month[type_id] = month.get(type_id, Decimal("0")) + amount
+
+        for month in sorted(by_month):
+            change = [
+                Case(
+                    When(
+                        Exists(Type.objects.filter(
+                            pk=type_id, is_expense=True
+                        )),
+                        then=Value(-amount),
+                    ),
+                    default=Value(amount),
+                    output_field=DecimalField(
+                        max_digits=18, decimal_places=2
+                    ),
+                )
+                for type_id, amount in by_month[month].items() if amount
+            ]
+            if change:
+                self.using(using).filter(month__gte=month).update(
+                    balance=sum(change, F("balance"))
+                )
+
+    def refresh(self, full=False, today=None, using=None):
+        """
+        Добавляет остатки на конец завершённых месяцев, которых ещё
+        нет, считая от последнего сохранённого остатка по дневным
+        итогам. full=True пересчитывает все остатки с начала учёта
+        (нужно после изменения типа или пересчёта дневных итогов).
+        Остатки раньше первых дневных итогов пересчитать не из чего:
+        их записи отключены вместе с секциями (см. detach_partitions),
+        поэтому последний из них остаётся начальным остатком.
+        Возвращает число добавленных остатков.
+        """
+        using = using or router.db_for_write(self.model)
+        current = (today or datetime.date.today()).replace(day=1)
+        with transaction.atomic(using=using):
+            checkpoints = self.using(using)
+            if full:
+                first_day = (
+                    CashFlowDailyRollup.objects.using(using)
+                    .order_by("date").values_list("date", flat=True).first()
+                )
+                opening = checkpoints
+                if first_day is not None:
+                    opening = opening.filter(
+                        month__lt=first_day.replace(day=1)
+                    )
+                last = opening.order_by("-month").first()
+                if last is not None:
+                    checkpoints = checkpoints.exclude(pk=last.pk)
+                checkpoints.delete()
+            else:
+                last = checkpoints.order_by("-month").first()
+
+            rollups = CashFlowDailyRollup.objects.using(using).filter(
+                date__lt=current
+            )
+            balance = Decimal("0")
+            month = None
+            if last is not None:
+                balance = last.balance
+                month = add_months(last.month, 1)
+                rollups = rollups.filter(date__gte=month)
+            totals = {
+                row["month"]: row["total"]
+                for row in rollups.order_by()
+                .annotate(month=TruncMonth("date"))
+                .values("month")
+                .annotate(total=Sum(signed_amount("amount_total")))
+            }
+            if month is None:
+                if not totals:
+                    return 0
+                month = min(totals)
+
+            created = []
+            # Месяцы без записей тоже получают остаток, чтобы ближайший
+            # остаток всегда был на конец предыдущего месяца.
+            while month < current:
+                balance += totals.get(month, 0)
+                created.append(self.model(month=month, balance=balance))
+                month = add_months(month, 1)
+            self.using(using).bulk_create(created)
+        return len(created)
+
+    def before(self, date: datetime.date, using=None):
+        """ Ближайший остаток на конец месяца раньше месяца date """
+        return (
+            self.using(using).filter(month__lt=date.replace(day=1))
+            .order_by("-month").first()
+        )
+
+
+class BalanceCheckpoint(models.Model):
+    """
+    Остаток (поступления минус списания нарастающим итогом) на конец
+    месяца. Расчёт баланса на любую дату начинается от ближайшего
+    остатка и просматривает только более поздние итоги и записи.
+    Исправляется вместе с дневными итогами, в том числе при записях
+    задним числом (custom_date).
+    """
+    month = models.DateField(
+        unique=True, verbose_name="Месяц (первое число)"
+    )
+    balance = models.DecimalField(
+        max_digits=18, decimal_places=2, verbose_name="Остаток на конец месяца"
+    )
+
+    objects = BalanceCheckpointQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "остаток на конец месяца"
+        verbose_name_plural = "остатки на конец месяца"
+        ordering = ("month",)
+
+    def __str__(self):
+        return f"{self.month:%Y-%m}: {self.balance}"
+
+
+class RecordChangeMarkerQuerySet(models.QuerySet):
+
+    def touch(self, dates, using=None):
+        """
+        Увеличивает версии месяцев, к которым относятся dates.
+        Должен вызываться в той же транзакции, что и изменение записей.
+        """
+        using = using or router.db_for_write(self.model)
+        months = sorted({date.replace(day=1) for date in dates})
+        if not months:
+            return
+        now = timezone.now()
+        self.using(using).bulk_create(
+            [self.model(month=month, changed_at=now) for month in months],
+            ignore_conflicts=True,
+        )
+        self.using(using).filter(month__in=months).update(
+            version=F("version") + 1, changed_at=now
+        )
+
+    def state(self, date_from=None, date_to=None):
+        """
+        Сумма версий и время последнего изменения месяцев периода
+        (без границ - всех). Версии только растут, поэтому сумма
+        меняется при любом изменении записей периода.
+        """
+        queryset = self
+        if date_from:
+            queryset = queryset.filter(month__gte=date_from.replace(day=1))
+        if date_to:
+            queryset = queryset.filter(month__lte=date_to)
+        state = queryset.aggregate(
+            version=Sum("version"), changed_at=Max("changed_at")
+        )
+        return state["version"] or 0, state["changed_at"]
+
+
+class RecordChangeMarker(models.Model):
+    """
+    Метка изменений записей ДДС за месяц (по effective_date): версия
+    растёт при каждом создании, изменении и удалении записей месяца,
+    в том числе при удалении секций. По меткам строятся ETag
+    и Last-Modified списка записей без запроса к самим записям.
+    """
+    month = models.DateField(
+        unique=True, verbose_name="Месяц (первое число)"
+    )
+    version = models.PositiveBigIntegerField(
+        default=0, verbose_name="Версия"
+    )
+    changed_at = models.DateTimeField(verbose_name="Время изменения")
+
+    objects = RecordChangeMarkerQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "метка изменений записей"
+        verbose_name_plural = "метки изменений записей"
+        ordering = ("month",)
+
+    def __str__(self):
+        return f"{self.month:%Y-%m}: {self.version}"
@@ -0,0 +1,27 @@
+"""
+Арифметика месяцев. Месяц представлен датой своего первого числа -
+так хранятся секции записей, остатки на конец месяца и метки изменений.
+"""
+import datetime
+from typing import List
+
+
+def month_start(date: datetime.date) -> datetime.date:
+    return date.replace(day=1)
+
+
+def add_months(month: datetime.date, count: int) -> datetime.date:
+    """ Первое число месяца через count месяцев (count < 0 - назад) """
+    index = month.year * 12 + month.month - 1 + count
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def months_between(
+        start: datetime.date, end: datetime.date
+) -> List[datetime.date]:
+    """ Первые числа месяцев от месяца start до месяца end включительно """
+    months, month = [], month_start(start)
+    while month <= end:
+        months.append(month)
+        month = add_months(month, 1)
+    return months
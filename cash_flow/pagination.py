@@ -0,0 +1,313 @@
+import base64
+import datetime
+import json
+from dataclasses import dataclass, field
+from functools import cached_property
+from decimal import Decimal
+from typing import Any, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.db.models.query import QuerySet
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from cash_flow.conditional import change_state
+from cash_flow.counting import count_rows, estimated_count
+from cash_flow.models import SEARCH_RANK
+from cash_flow.result_cache import record_cache
+
+
+class InvalidCursor(ValueError):
+    """ Курсор не удалось разобрать """
+
+
+@dataclass
+class KeysetPage:
+    """
+    Страница, полученная курсорной пагинацией.
+    Курсоры - непрозрачные строки для подстановки в GET-параметр.
+    """
+    object_list: List[Any] = field(default_factory=list)
+    next_cursor: Optional[str] = None
+    previous_cursor: Optional[str] = None
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self) -> bool:
+        return self.previous_cursor is not None
+
+    def has_other_pages(self) -> bool:
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self) -> int:
+        return len(self.object_list)
+
+
+def encode_cursor(
+        date: datetime.date, pk: int, reverse: bool,
+        rank: Optional[Decimal] = None,
+) -> str:
+    payload = {"d": date.isoformat(), "i": pk, "r": int(reverse)}
+    if rank is not None:
+        payload["s"] = str(rank)
+    payload = json.dumps(payload, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """
+    Возвращает кортеж (дата, id, reverse, ранг) из строки курсора,
+    ранг - None, если курсор получен не из результатов поиска.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return (
+            datetime.date.fromisoformat(payload["d"]),
+            int(payload["i"]),
+            bool(payload.get("r", 0)),
+            Decimal(payload["s"]) if "s" in payload else None,
+        )
+    except (
+            ValueError, TypeError, KeyError, AttributeError, ArithmeticError
+    ):
+        raise InvalidCursor("Неверный курсор пагинации")
+
+
+def rank_field(queryset: QuerySet) -> Optional[str]:
+    """ Поле ранга, если записи отобраны поиском (см. models.SEARCH_RANK) """
+    if SEARCH_RANK in queryset.query.annotations:
+        return SEARCH_RANK
+    return None
+
+
+class KeysetPaginator:
+    """
+    Курсорная (keyset) пагинация по паре (effective_date, id),
+    по умолчанию в порядке убывания: от новых записей к старым.
+    С rank_field ключом служит тройка (ранг, effective_date, id) -
+    для результатов поиска, упорядоченных по релевантности.
+
+    В отличие от OFFSET стоимость запроса не зависит от номера страницы -
+    каждая страница выбирается условием по ключу последней показанной записи.
+    """
+    date_field = "effective_date"
+
+    def __init__(
+            self, queryset: QuerySet, page_size: int, descending: bool = True,
+            rank_field: Optional[str] = None,
+    ):
+        self.queryset = queryset
+        self.page_size = page_size
+        self.descending = descending
+        self.rank_field = rank_field
+
+    @property
+    def key_fields(self):
+        fields = (self.date_field, "pk")
+        return (self.rank_field, *fields) if self.rank_field else fields
+
+    def _cursor(self, obj, reverse: bool) -> str:
+        rank = getattr(obj, self.rank_field) if self.rank_field else None
+        return encode_cursor(
+            getattr(obj, self.date_field), obj.pk, reverse, rank
+        )
+
+    def _after(self, values, lookup) -> Q:
+        """ Условие "ключ строки дальше values" в смысле lookup (lt/gt) """
+        condition, equal = Q(), {}
+        for name, value in zip(self.key_fields, values):
+            condition |= Q(**equal, **{f"{name}__{lookup}": value})
+            equal[name] = value
+        return condition
+
+    def _window(self, cursor: Optional[str]):
+        """ Запрос страницы на page_size + 1 строк и направление """
+        reverse = False
+        queryset = self.queryset
+
+        if cursor:
+            date, pk, reverse, rank = decode_cursor(cursor)
+            if (rank is None) != (self.rank_field is None):
+                raise InvalidCursor("Неверный курсор пагинации")
+            values = (date, pk) if rank is None else (rank, date, pk)
+            # Назад по убыванию - то же, что вперёд по возрастанию.
+            lookup = "gt" if reverse == self.descending else "lt"
+            queryset = queryset.filter(self._after(values, lookup))
+
+        if reverse == self.descending:
+            queryset = queryset.order_by(*self.key_fields)
+        else:
+            queryset = queryset.order_by(
+                *(f"-{name}" for name in self.key_fields)
+            )
+        return queryset[:self.page_size + 1], reverse
+
+    def _make_page(self, rows, cursor, reverse) -> KeysetPage:
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        page = KeysetPage(object_list=rows)
+        if not rows:
+            return page
+
+        # При движении назад "ещё есть" означает наличие предыдущих страниц,
+        # а следующая страница есть всегда - мы с неё пришли.
+        has_next = True if reverse else has_more
+        has_previous = has_more if reverse else bool(cursor)
+
+        if has_next:
+            page.next_cursor = self._cursor(rows[-1], False)
+        if has_previous:
+            page.previous_cursor = self._cursor(rows[0], True)
+        return page
+
+    def get_page(self, cursor: Optional[str] = None) -> KeysetPage:
+        queryset, reverse = self._window(cursor)
+        return self._make_page(list(queryset), cursor, reverse)
+
+    async def aget_page(self, cursor: Optional[str] = None) -> KeysetPage:
+        """ То же, что get_page, через асинхронный ORM """
+        queryset, reverse = self._window(cursor)
+        rows = [obj async for obj in queryset]
+        return self._make_page(rows, cursor, reverse)
+
+
+class CashFlowRecordCursorPagination(BasePagination):
+    """
+    Курсорная пагинация API записей ДДС поверх KeysetPaginator.
+    Порядок задаётся параметром ordering: effective_date, -effective_date
+    или -rank (по релевантности, только при поиске и по умолчанию при нём).
+    count - число отобранных записей, на больших выборках - оценка
+    (count_exact = false, см. counting.py).
+    """
+    page_size = settings.CASHFLOW_API_PAGE_SIZE
+    max_page_size = settings.CASHFLOW_API_MAX_PAGE_SIZE
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    ordering_query_param = "ordering"
+    ordering_choices = ("-effective_date", "effective_date", "-rank")
+
+    def get_page_size(self, request) -> int:
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    @classmethod
+    def get_ordering_choices(cls, searched: bool) -> Tuple[str, ...]:
+        """ Порядок по релевантности (-rank) допустим только при поиске """
+        if searched:
+            return cls.ordering_choices
+        return tuple(
+            choice for choice in cls.ordering_choices if choice != "-rank"
+        )
+
+    def get_ordering(self, request, searched: bool = False) -> str:
+        ordering = request.query_params.get(
+            self.ordering_query_param,
+            "-rank" if searched else self.ordering_choices[0],
+        )
+        choices = self.get_ordering_choices(searched)
+        if ordering not in choices:
+            raise ValidationError({
+                self.ordering_query_param: [
+                    f"Допустимые значения: {', '.join(choices)}"
+                ]
+            })
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        filters = getattr(request, "record_filters", None) or {}
+        ordering = self.get_ordering(request, bool(filters.get("search")))
+        # Без ранга (поиск не на PostgreSQL) -rank - то же,
+        # что -effective_date.
+        ranked = rank_field(queryset)
+        page_size = self.get_page_size(request)
+        paginator = KeysetPaginator(
+            queryset,
+            page_size,
+            descending=ordering.startswith("-"),
+            rank_field=ranked if ordering == "-rank" else None,
+        )
+        cursor = request.query_params.get(self.cursor_query_param)
+
+        def compute():
+            try:
+                page = paginator.get_page(cursor)
+            except InvalidCursor as e:
+                raise NotFound(str(e))
+            return page, count_rows(queryset)
+
+        self.page, self.count = record_cache.get_or_compute(
+            "api", getattr(request, "record_filters", None), compute,
+            state=lambda: change_state(request),
+            cursor=cursor, page_size=page_size, ordering=ordering,
+        )
+        return self.page.object_list
+
+    def get_link(self, cursor: Optional[str]) -> Optional[str]:
+        if cursor is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            cursor
+        )
+
+    def get_paginated_response(self, data):
+        return Response({
+            "count": self.count.value,
+            "count_exact": self.count.exact,
+            "next": self.get_link(self.page.next_cursor),
+            "previous": self.get_link(self.page.previous_cursor),
+            "results": data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "count": {"type": "integer"},
+                "count_exact": {"type": "boolean"},
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {
+                    "type": "string", "nullable": True, "format": "uri"
+                },
+                "results": schema,
+            },
+        }
+
+
+class DirectoryCursorPagination(CursorPagination):
+    """ Курсорная пагинация справочников по id """
+    ordering = "id"
+    page_size = settings.CASHFLOW_API_PAGE_SIZE
+    max_page_size = settings.CASHFLOW_API_MAX_PAGE_SIZE
+    page_size_query_param = "page_size"
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Постраничный вывод с оценкой количества строк вместо COUNT(*)
+    по всей таблице (см. counting.py).
+    """
+
+    @cached_property
+    def count(self) -> int:
+        return estimated_count(self.object_list)
@@ -0,0 +1,207 @@
+"""
+Помесячные секции таблицы записей ДДС (PostgreSQL).
+
+Таблица записей секционирована по диапазону effective_date
+(миграция 0006): одна секция на месяц плюс секция по умолчанию для дат
+вне созданных секций. Индексы объявлены на родительской таблице
+и создаются в каждой секции автоматически. Запросы с условием по дате
+(список, выгрузка, API) читают только нужные секции.
+
+Новые секции создаются заранее на CASHFLOW_PARTITION_MONTHS_AHEAD
+месяцев: после migrate и командой manage_partitions (её стоит запускать
+по расписанию). Старые секции отключаются или удаляются целиком -
+без перезаписи таблицы, вместе с дневными итогами за эти месяцы.
+"""
+import datetime
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from cash_flow.models import (
+    BalanceCheckpoint, CashFlowDailyRollup, CashFlowRecord, RecordChangeMarker,
+)
+from cash_flow.months import add_months, month_start
+
+_BOUND_RE = re.compile(r"FROM \('([\d-]+)'\) TO \('([\d-]+)'\)")
+
+
+@dataclass(frozen=True)
+class Partition:
+    name: str
+    start: Optional[datetime.date] = None
+    end: Optional[datetime.date] = None
+
+    @property
+    def is_default(self) -> bool:
+        return self.start is None
+
+
+def table_name() -> str:
+    return CashFlowRecord._meta.db_table
+
+
+def partition_name(month: datetime.date) -> str:
+    return f"{table_name()}_p{month:%Y%m}"
+
+
+def default_partition_name() -> str:
+    return f"{table_name()}_default"
+
+
+def is_partitioned(using: str) -> bool:
+    connection = connections[using]
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)",
+            [table_name()],
+        )
+        row = cursor.fetchone()
+    return bool(row and row[0] == "p")
+
+
+def list_partitions(using: str) -> List[Partition]:
+    """ Секции таблицы записей по возрастанию дат, по умолчанию - последней """
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+            "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(%s)",
+            [table_name()],
+        )
+        rows = cursor.fetchall()
+    partitions = []
+    for name, bound in rows:
+        match = _BOUND_RE.search(bound or "")
+        if match:
+            partitions.append(Partition(
+                name,
+                datetime.date.fromisoformat(match.group(1)),
+                datetime.date.fromisoformat(match.group(2)),
+            ))
+        else:
+            partitions.append(Partition(name))
+    return sorted(
+        partitions, key=lambda p: (p.is_default, p.start or datetime.date.min)
+    )
+
+
+def create_partition(month: datetime.date, using: str) -> bool:
+    """
+    Создаёт секцию месяца, если её нет. Строки этого месяца, уже
+    попавшие в секцию по умолчанию, переносятся в новую секцию.
+    Возвращает True, если секция создана.
+    """
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    start, end = month_start(month), add_months(month_start(month), 1)
+    name = partition_name(start)
+    if any(p.name == name for p in list_partitions(using)):
+        return False
+
+    parent, default = qn(table_name()), qn(default_partition_name())
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT EXISTS (SELECT 1 FROM {default} "
+            "WHERE effective_date >= %s AND effective_date < %s)",
+            [start, end],
+        )
+        if not cursor.fetchone()[0]:
+            cursor.execute(
+                f"CREATE TABLE {qn(name)} PARTITION OF {parent} "
+                "FOR VALUES FROM (%s) TO (%s)",
+                [start, end],
+            )
+            return True
+        # Секция по умолчанию не даст создать пересекающуюся секцию,
+        # пока в ней есть строки этого месяца: переносим их в отдельную
+        # таблицу и подключаем её как секцию.
+        cursor.execute(
+            f"CREATE TABLE {qn(name)} "
+            f"(LIKE {parent} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+        )
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {default} "
+            "WHERE effective_date >= %s AND effective_date < %s "
+            f"RETURNING *) INSERT INTO {qn(name)} SELECT * FROM moved",
+            [start, end],
+        )
+        cursor.execute(
+            f"ALTER TABLE {parent} ATTACH PARTITION {qn(name)} "
+            "FOR VALUES FROM (%s) TO (%s)",
+            [start, end],
+        )
+    return True
+
+
+def ensure_partitions(
+        using: str,
+        months_ahead: Optional[int] = None,
+        today: Optional[datetime.date] = None,
+) -> List[str]:
+    """
+    Создаёт недостающие секции от текущего месяца на months_ahead
+    месяцев вперёд. Ничего не делает, если таблица не секционирована.
+    """
+    if not is_partitioned(using):
+        return []
+    if months_ahead is None:
+        months_ahead = settings.CASHFLOW_PARTITION_MONTHS_AHEAD
+    current = month_start(today or datetime.date.today())
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if create_partition(month, using):
+            created.append(partition_name(month))
+    return created
+
+
+def detach_partitions(
+        before: datetime.date, using: str, drop: bool = False
+) -> List[Partition]:
+    """
+    Отключает (drop=True - удаляет) секции, целиком лежащие раньше
+    месяца before. Данные не перезаписываются: секция становится
+    отдельной таблицей или удаляется целиком. Дневные итоги за эти
+    месяцы удаляются в той же транзакции. Остаток на конец последнего
+    месяца перед before остаётся начальным остатком, последующие
+    остатки не меняются: остаток на любую дату после границы тот же,
+    что до отключения. Остатки более ранних отключённых месяцев
+    удаляются.
+    """
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    boundary = month_start(before)
+    removed = [
+        partition for partition in list_partitions(using)
+        if not partition.is_default and partition.end <= boundary
+    ]
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        # Начальный остаток должен быть сохранён до удаления итогов.
+        BalanceCheckpoint.objects.refresh(using=using)
+        for partition in removed:
+            cursor.execute(
+                f"ALTER TABLE {qn(table_name())} "
+                f"DETACH PARTITION {qn(partition.name)}"
+            )
+            if drop:
+                cursor.execute(f"DROP TABLE {qn(partition.name)}")
+            CashFlowDailyRollup.objects.using(using).filter(
+                date__gte=partition.start, date__lt=partition.end
+            ).delete()
+        opening = BalanceCheckpoint.objects.before(boundary, using)
+        for partition in removed:
+            checkpoints = BalanceCheckpoint.objects.using(using).filter(
+                month__gte=partition.start, month__lt=partition.end
+            )
+            if opening is not None:
+                checkpoints = checkpoints.exclude(pk=opening.pk)
+            checkpoints.delete()
+        RecordChangeMarker.objects.touch(
+            [partition.start for partition in removed], using=using
+        )
+    return removed
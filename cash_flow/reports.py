@@ -0,0 +1,59 @@
+from decimal import Decimal
+from typing import Any, Dict, List, Sequence
+
+from django.db.models import Sum
+from django.db.models.functions import Trunc
+from django.db.models.query import QuerySet
+
+
+def build_report(
+        queryset: QuerySet, period: str, group_by: Sequence[str]
+) -> Dict[str, Any]:
+    """
+    Суммы и количество записей ДДС по периодам и выбранным справочникам.
+
+    Отчёт строится по дневным итогам (CashFlowDailyRollup), а не по самим
+    записям. Вся агрегация выполняется одним запросом с GROUP BY,
+    в Python только собираются итоги по уже сгруппированным строкам.
+    Суммы возвращаются строками, как DecimalField в API записей.
+
+    Args:
+        queryset: отфильтрованные дневные итоги.
+        period: day, week, month, quarter или year.
+        group_by: справочники для группировки
+                (type, category, subcategory, status).
+    """
+    dimensions: List[str] = []
+    for field_name in group_by:
+        dimensions += [field_name, f"{field_name}__name"]
+
+    rows = (
+        queryset
+        .order_by()
+        .annotate(period=Trunc("date", period))
+        .values("period", *dimensions)
+        .annotate(total=Sum("amount_total"), count=Sum("record_count"))
+        .order_by("period", *dimensions)
+    )
+
+    results = []
+    grand_total = Decimal("0")
+    grand_count = 0
+    for row in rows:
+        item = {"period": row["period"]}
+        for field_name in group_by:
+            item[field_name] = row[field_name]
+            item[f"{field_name}_name"] = row[f"{field_name}__name"]
+        item["total"] = str(row["total"])
+        item["count"] = row["count"]
+        results.append(item)
+        grand_total += row["total"]
+        grand_count += row["count"]
+
+    return {
+        "period": period,
+        "group_by": list(group_by),
+        "total": str(grand_total),
+        "count": grand_count,
+        "results": results,
+    }
@@ -0,0 +1,117 @@
+"""
+Кэш результатов списка записей ДДС (страница и количество).
+
+Ключ - нормализованные параметры фильтра, курсор, размер страницы,
+порядок и версия данных периода. Версия - сумма версий и время
+последнего изменения меток месяцев (RecordChangeMarker), попадающих
+в период фильтра: метки меняются в той же транзакции, что и записи,
+и хранятся в БД, поэтому изменение, сделанное в любом процессе, сразу
+меняет ключ во всех остальных. Старые результаты просто перестают
+запрашиваться и вытесняются сами - ключи не перебираются. Та же версия
+входит в ETag списка (см. conditional.py), поэтому ответ с новым ETag
+не может быть собран из результата под старой версией.
+
+Объём ограничивается самим бэкендом кэша
+(CASHFLOW_RESULT_CACHE_ALIAS): LocMemCache вытесняет давно
+не читавшиеся записи сверх MAX_ENTRIES, для Redis/Memcached нужна
+политика вытеснения LRU. Попадания и промахи считаются в метрике
+cashflow_cache_requests_total{cache="records"}.
+"""
+import datetime
+import hashlib
+import json
+from decimal import Decimal
+from typing import Callable, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections, router
+
+from cash_flow.metrics import cache_hit
+from cash_flow.models import RecordChangeMarker
+
+RESULT_KEY = "cash_flow:records:result"
+# Значение, которое нельзя спутать с закэшированным результатом.
+_MISSING = object()
+
+
+def filter_params(cleaned_data: dict) -> dict:
+    """
+    Параметры фильтра в виде, пригодном для ключа: только заданные
+    значения, справочники - id, даты и суммы - строки.
+    """
+    params = {}
+    for name, value in cleaned_data.items():
+        if value in (None, "", [], ()):
+            continue
+        if hasattr(value, "pk"):
+            value = value.pk
+        elif isinstance(value, (datetime.date, Decimal)):
+            value = str(value)
+        elif isinstance(value, str):
+            value = value.strip()
+        params[name] = value
+    return params
+
+
+class RecordResultCache:
+
+    @property
+    def cache(self):
+        return caches[settings.CASHFLOW_RESULT_CACHE_ALIAS]
+
+    @property
+    def timeout(self) -> int:
+        return settings.CASHFLOW_RESULT_CACHE_TIMEOUT
+
+    def state(
+            self, cleaned_data: dict
+    ) -> Tuple[int, Optional[datetime.datetime]]:
+        """ Версия данных периода фильтра, см. RecordChangeMarker.state """
+        return RecordChangeMarker.objects.using(
+            router.db_for_read(RecordChangeMarker)
+        ).state(cleaned_data.get("date_from"), cleaned_data.get("date_to"))
+
+    def key(self, kind: str, cleaned_data: dict, version, **extra) -> str:
+        payload = json.dumps(
+            [kind, filter_params(cleaned_data), extra, version],
+            sort_keys=True, ensure_ascii=False, default=str,
+        )
+        return f"{RESULT_KEY}:{hashlib.sha1(payload.encode()).hexdigest()}"
+
+    def get_or_compute(
+            self,
+            kind: str,
+            cleaned_data: Optional[dict],
+            compute: Callable[[], object],
+            state: Optional[Callable[[], tuple]] = None,
+            **extra,
+    ):
+        """
+        Результат compute() из кэша или вычисленный и сохранённый.
+        kind - вид результата (список, API), extra - параметры,
+        кроме фильтра, от которых он зависит (курсор, размер страницы).
+        state - функция, возвращающая версию данных, уже полученную
+        для ETag этого запроса (conditional.change_state); без неё
+        версия читается заново.
+        Кэш не используется без cleaned_data, с нулевым таймаутом
+        и внутри транзакции на основной БД: она может видеть ещё
+        не зафиксированные (или потом откаченные) изменения.
+        """
+        if (
+                cleaned_data is None
+                or self.timeout <= 0
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return compute()
+        version = state() if state else self.state(cleaned_data)
+        key = self.key(kind, cleaned_data, version, **extra)
+        result = self.cache.get(key, _MISSING)
+        cache_hit("records", result is not _MISSING)
+        if result is _MISSING:
+            result = compute()
+            self.cache.set(key, result, self.timeout)
+        return result
+
+
+record_cache = RecordResultCache()
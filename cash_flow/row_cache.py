@@ -0,0 +1,113 @@
+"""
+Кэш HTML строк таблицы записей ДДС.
+
+Строка зависит только от самой записи, названий справочников и языка
+(формат дат и сумм), поэтому ключ - id записи, её updated_at, etag
+снимка справочников и язык. Изменение записи или переименование
+статуса, типа, категории меняют ключ, и старые фрагменты вытесняются
+сами. Страница собирается
+из фрагментов, полученных одним get_many; шаблон рендерится только
+для отсутствующих строк.
+
+Остаток после записи меняется вместе с другими записями, поэтому
+в фрагмент не входит: строка хранится двумя частями - до ячейки
+остатка и после неё.
+"""
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import render_to_string
+from django.utils.safestring import SafeString, mark_safe
+from django.utils.translation import get_language
+
+from cash_flow.directory_cache import get_directory
+from cash_flow.metrics import cache_hit
+from cash_flow.models import CashFlowRecord
+
+ROW_KEY = "cash_flow:records:row"
+ROW_TEMPLATE = "cash_flow/_record_row.html"
+# Место ячейки остатка в отрендеренной строке.
+BALANCE_SLOT = "<!--balance-->"
+
+
+@dataclass
+class RecordRow:
+    """ Строка таблицы: части до и после ячейки остатка """
+    record: CashFlowRecord
+    head: SafeString
+    tail: SafeString
+    balance: Optional[Decimal] = None
+
+
+class RecordRowCache:
+
+    @property
+    def cache(self):
+        return caches[settings.CASHFLOW_ROW_CACHE_ALIAS]
+
+    @property
+    def timeout(self) -> int:
+        return settings.CASHFLOW_ROW_CACHE_TIMEOUT
+
+    def key(self, record: CashFlowRecord, directory_etag: str) -> str:
+        return (
+            f"{ROW_KEY}:{record.pk}:{record.updated_at.isoformat()}"
+            f":{directory_etag}:{get_language()}"
+        )
+
+    def render_row(self, record: CashFlowRecord) -> Tuple[str, str]:
+        html = render_to_string(
+            ROW_TEMPLATE,
+            {"record": record, "balance_slot": mark_safe(BALANCE_SLOT)},
+        )
+        head, _, tail = html.partition(BALANCE_SLOT)
+        return head, tail
+
+    def rows(
+            self,
+            records: Iterable[CashFlowRecord],
+            balances: Optional[Dict[int, Decimal]] = None,
+    ) -> List[RecordRow]:
+        """
+        Строки для records в том же порядке. Записи без updated_at
+        (не сохранённые) и все записи при нулевом таймауте рендерятся
+        без кэша.
+        """
+        records = list(records)
+        balances = balances or {}
+        keys = {}
+        if self.timeout > 0:
+            etag = get_directory().etag
+            keys = {
+                record.pk: self.key(record, etag)
+                for record in records if record.updated_at is not None
+            }
+        cached = self.cache.get_many(list(keys.values())) if keys else {}
+        cache_hit("rows", True, len(cached))
+        cache_hit("rows", False, len(keys) - len(cached))
+
+        rendered, rows = {}, []
+        for record in records:
+            key = keys.get(record.pk)
+            parts = cached.get(key) if key else None
+            if parts is None:
+                parts = self.render_row(record)
+                if key:
+                    rendered[key] = parts
+            head, tail = parts
+            rows.append(RecordRow(
+                record, mark_safe(head), mark_safe(tail),
+                balances.get(record.pk),
+            ))
+        if rendered:
+            self.cache.set_many(rendered, self.timeout)
+        return rows
+
+    def clear(self):
+        self.cache.clear()
+
+
+row_cache = RecordRowCache()
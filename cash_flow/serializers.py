@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from cash_flow.models import Status, Type, Category, SubCategory, CashFlowRecord
+from cash_flow.validation import REFERENCE_FIELDS, validate_records
 
 
 class StatusSerializer(serializers.ModelSerializer):
@@ -30,3 +31,19 @@ class CashFlowRecordSerializer(serializers.ModelSerializer):
     class Meta:
         model = CashFlowRecord
         fields = '__all__'
+
+    def validate(self, attrs):
+        """
+        Проверки validation.py для записи с учётом текущих значений
+        при частичном изменении.
+        """
+        payload = dict(attrs)
+        if self.instance is not None:
+            for name in REFERENCE_FIELDS:
+                payload.setdefault(name, getattr(self.instance, f"{name}_id"))
+            for name in ("custom_date", "amount"):
+                payload.setdefault(name, getattr(self.instance, name))
+        errors = validate_records([payload])[0]
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
@@ -0,0 +1,56 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from cash_flow.directory_cache import directory_cache
+from cash_flow.models import (
+    BalanceCheckpoint, Category, Status, SubCategory, Type,
+)
+from cash_flow.partitions import ensure_partitions
+
+
+@receiver(post_save, sender=Status)
+@receiver(post_save, sender=Type)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=SubCategory)
+@receiver(post_delete, sender=Status)
+@receiver(post_delete, sender=Type)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=SubCategory)
+def invalidate_directory_cache(sender, using=None, **kwargs):
+    """ Любое изменение справочника сбрасывает кэш справочников """
+    directory_cache.invalidate(using=using)
+
+
+@receiver(pre_save, sender=Type)
+def detect_expense_change(
+        sender, instance, using=None, update_fields=None, **kwargs
+):
+    """ Отмечает, меняет ли сохранение признак списания у типа """
+    instance._expense_changed = (
+        instance.pk is not None
+        and (update_fields is None or "is_expense" in update_fields)
+        and sender.objects.using(using).filter(pk=instance.pk)
+        .exclude(is_expense=instance.is_expense).exists()
+    )
+
+
+@receiver(post_save, sender=Type)
+def refresh_balance_checkpoints(
+        sender, instance, created=False, using=None, **kwargs
+):
+    """
+    Остатки на конец месяцев зависят от того, какие типы - списания,
+    поэтому изменение is_expense пересчитывает их заново. Переименование
+    типа остатки не меняет.
+    """
+    if not created and getattr(instance, "_expense_changed", False):
+        transaction.on_commit(
+            lambda: BalanceCheckpoint.objects.refresh(full=True, using=using),
+            using=using,
+        )
+
+
+def ensure_record_partitions(sender, using=None, **kwargs):
+    """ После migrate создаёт недостающие будущие секции записей """
+    ensure_partitions(using)
@@ -1,3 +1,1936 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import re
+import zipfile
+from decimal import Decimal
+from unittest import skipIf, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import (
+    DEFAULT_DB_ALIAS,
+    IntegrityError,
+    connection,
+    connections,
+    router,
+    transaction,
+)
+from django.db.models import Count, DecimalField, Sum
+from django.db.models.functions import Cast
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse, reverse_lazy
+
+from cash_flow.balance import balance_before, record_balances
+from cash_flow.counting import RowCount, count_rows
+from cash_flow.datagen import (
+    directory_template, generate_records, generate_rows,
+)
+from cash_flow.db_routing import (
+    STICKY_SESSION_KEY, begin_request, end_request, replica_health,
+)
+from cash_flow.directory_cache import (
+    DirectorySnapshot, directory_cache, pin_directory,
+)
+from cash_flow.export import EXPORT_HEADERS, export_rows, iter_xlsx
+from cash_flow.forms import (
+    CashFlowFilterForm,
+    CashFlowRecordForm,
+    SubCategoryForm,
+)
+from cash_flow.importer import RecordImporter, read_rows
+from cash_flow.instrumentation import normalize_sql, profile_queries
+from cash_flow.metrics import registry
+from cash_flow.middleware import ReplicaRoutingMiddleware
+from cash_flow.result_cache import record_cache
+from cash_flow.row_cache import row_cache
+from cash_flow.models import (
+    ROLLUP_FIELDS,
+    ROLLUP_RECORD_FIELDS,
+    SEARCH_RANK,
+    BalanceCheckpoint,
+    CashFlowDailyRollup,
+    CashFlowRecord,
+    Category,
+    RecordChangeMarker,
+    Status,
+    SubCategory,
+    Type,
+)
+from cash_flow.pagination import InvalidCursor, KeysetPaginator, rank_field
+from cash_flow.partitions import (
+    Partition,
+    create_partition,
+    default_partition_name,
+    detach_partitions,
+    ensure_partitions,
+    is_partitioned,
+    list_partitions,
+    partition_name,
+)
+from cash_flow.validation import (
+    CATEGORY_TYPE_MISMATCH,
+    SUBCATEGORY_CATEGORY_MISMATCH,
+    HierarchyIndex,
+    validate_category_type_match,
+    validate_records,
+)
+
+# Загрузка снимка справочников: статусы, типы, категории, подкатегории.
+DIRECTORY_LOAD_QUERIES = 4
+
+# Вторая БД без второго сервера: зеркало основной, как replica_N
+# из POSTGRES_REPLICA_HOSTS. Данные в ней видны только после фиксации,
+# поэтому тесты с ней - TransactionTestCase.
+REPLICA = "replica_test"
+connections.settings.setdefault(REPLICA, {
+    **connections.settings[DEFAULT_DB_ALIAS],
+    "TEST": {
+        **connections.settings[DEFAULT_DB_ALIAS]["TEST"],
+        "MIRROR": DEFAULT_DB_ALIAS,
+    },
+})
+
+
+class KeysetPaginationTests(TestCase):
+    """
+    Курсоры по (effective_date, id) без поиска: страницы не теряют
+    и не повторяют записи с одинаковой датой, назад - те же страницы.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        record_type = Type.objects.create(name="Пополнение")
+        category = Category.objects.create(name="Продажи", type=record_type)
+        subcategory = SubCategory.objects.create(
+            name="Avito", category=category
+        )
+        cls.records = [
+            CashFlowRecord.objects.create(
+                type=record_type, category=category, subcategory=subcategory,
+                amount=10 + i, custom_date=datetime.date(2024, 1, 1 + i // 3),
+            )
+            for i in range(7)
+        ]
+
+    def walk(self, paginator):
+        pages, cursor = [], None
+        while True:
+            page = paginator.get_page(cursor)
+            pages.append(page)
+            if not page.has_next:
+                return pages
+            cursor = page.next_cursor
+
+    def test_descending_pages(self):
+        paginator = KeysetPaginator(CashFlowRecord.objects.all(), 2)
+        pages = self.walk(paginator)
+        expected = sorted(
+            self.records, key=lambda r: (r.effective_date, r.pk),
+            reverse=True,
+        )
+        self.assertEqual([r for page in pages for r in page], expected)
+        self.assertFalse(pages[0].has_previous)
+        self.assertEqual(len(pages), 4)
+
+        for number in range(len(pages) - 1, 0, -1):
+            previous = paginator.get_page(pages[number].previous_cursor)
+            self.assertEqual(list(previous), list(pages[number - 1]))
+
+    def test_ascending_pages(self):
+        paginator = KeysetPaginator(
+            CashFlowRecord.objects.all(), 3, descending=False
+        )
+        pages = self.walk(paginator)
+        expected = sorted(
+            self.records, key=lambda r: (r.effective_date, r.pk)
+        )
+        self.assertEqual([r for page in pages for r in page], expected)
+
+    def test_invalid_cursor(self):
+        paginator = KeysetPaginator(CashFlowRecord.objects.all(), 2)
+        with self.assertRaises(InvalidCursor):
+            paginator.get_page("не-курсор")
+        response = self.client.get(
+            reverse("cashflow:cashflow_list"), {"cursor": "не-курсор"}
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_list_queries_do_not_depend_on_page_size(self):
+        url = reverse("cashflow:cashflow_list")
+        self.client.get(url, {"page_size": 1})
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(url, {"page_size": 1})
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(url, {"page_size": 7})
+        self.assertEqual(len(response.context["records"]), 7)
+        self.assertEqual(len(small), len(large))
+
+
+class RollupTestCase(TestCase):
+    """ Справочники для записей и сверка дневных итогов с записями """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.status = Status.objects.create(name="Бизнес")
+        cls.type = Type.objects.create(name="Пополнение")
+        cls.category = Category.objects.create(name="Продажи", type=cls.type)
+        cls.subcategory = SubCategory.objects.create(
+            name="Avito", category=cls.category
+        )
+
+    def add(self, amount, day, status=None):
+        return CashFlowRecord.objects.create(
+            status=status, type=self.type, category=self.category,
+            subcategory=self.subcategory, amount=amount, custom_date=day,
+        )
+
+    def assertRollupMatchesRecords(self):
+        expected = {
+            tuple(row[f] for f in ROLLUP_RECORD_FIELDS): (
+                row["total"], row["count"]
+            )
+            for row in CashFlowRecord.objects.order_by()
+            .values(*ROLLUP_RECORD_FIELDS)
+            .annotate(total=Sum("amount"), count=Count("id"))
+        }
+        actual = {
+            tuple(row[:-2]): tuple(row[-2:])
+            for row in CashFlowDailyRollup.objects.values_list(
+                *ROLLUP_FIELDS, "amount_total", "record_count"
+            )
+        }
+        self.assertEqual(actual, expected)
+
+
+class RollupMaintenanceTests(RollupTestCase):
+    """
+    Дневные итоги совпадают с записями после каждого пути изменения:
+    сохранение, перенос на другую дату, удаление записи и queryset,
+    изменения через админку.
+    """
+
+    def test_save_and_move_between_dates(self):
+        day, next_day = datetime.date(2024, 3, 5), datetime.date(2024, 3, 6)
+        record = self.add(100, day)
+        self.add(50, day)
+        self.add(30, day, self.status)
+        self.assertRollupMatchesRecords()
+        # Записи без статуса - одна строка итогов.
+        self.assertEqual(
+            CashFlowDailyRollup.objects.get(date=day, status=None)
+            .record_count, 2
+        )
+
+        record.amount = 70
+        record.save()
+        self.assertRollupMatchesRecords()
+
+        record.custom_date = next_day
+        record.save()
+        self.assertRollupMatchesRecords()
+        self.assertEqual(
+            CashFlowDailyRollup.objects.get(date=next_day).amount_total, 70
+        )
+
+    def test_delete(self):
+        day = datetime.date(2024, 3, 5)
+        first, second = self.add(100, day), self.add(50, day)
+        first.delete()
+        self.assertRollupMatchesRecords()
+        second.delete()
+        self.assertFalse(CashFlowDailyRollup.objects.exists())
+
+    def test_queryset_delete(self):
+        for i in range(4):
+            self.add(10 * (i + 1), datetime.date(2024, 3, 1 + i % 2))
+        CashFlowRecord.objects.filter(amount__gte=30).delete()
+        self.assertRollupMatchesRecords()
+        CashFlowRecord.objects.all().delete()
+        self.assertFalse(CashFlowDailyRollup.objects.exists())
+
+    def test_admin_change_and_delete(self):
+        user = User.objects.create_superuser("admin", "", "password")
+        self.client.force_login(user)
+        record = self.add(100, datetime.date(2024, 3, 5))
+        other = self.add(40, datetime.date(2024, 3, 5))
+
+        response = self.client.post(
+            reverse("admin:cash_flow_cashflowrecord_change", args=[record.pk]),
+            {
+                "custom_date": "2024-04-01", "status": self.status.pk,
+                "type": self.type.pk, "category": self.category.pk,
+                "subcategory": self.subcategory.pk, "amount": "120.00",
+                "comment": "",
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertRollupMatchesRecords()
+
+        response = self.client.post(
+            reverse("admin:cash_flow_cashflowrecord_changelist"),
+            {
+                "action": "delete_selected", "post": "yes",
+                "_selected_action": [record.pk, other.pk],
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(CashFlowDailyRollup.objects.exists())
+
+    def test_unique_key_treats_missing_status_as_equal(self):
+        values = {
+            "date": datetime.date(2024, 3, 5), "type": self.type,
+            "category": self.category, "subcategory": self.subcategory,
+            "amount_total": 1, "record_count": 1,
+        }
+        CashFlowDailyRollup.objects.create(**values)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            CashFlowDailyRollup.objects.create(**values)
+
+
+class BulkEndpointTests(RollupTestCase):
+    url = reverse_lazy("cashflow_api:cashflowrecord-bulk")
+
+    def item(self, **overrides):
+        return {
+            "type": self.type.pk, "category": self.category.pk,
+            "subcategory": self.subcategory.pk, "amount": "100.00",
+            "custom_date": "2024-03-05", **overrides,
+        }
+
+    def send(self, method, items, mode=None):
+        url = f"{self.url}?mode={mode}" if mode else self.url
+        return getattr(self.client, method)(
+            url, items, content_type="application/json"
+        )
+
+    def test_atomic_create_rejects_everything(self):
+        response = self.send("post", [self.item(), self.item(amount="x")])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.data["applied"])
+        self.assertEqual(response.data["ids"], [])
+        self.assertEqual(
+            [error["index"] for error in response.data["errors"]], [1]
+        )
+        self.assertFalse(CashFlowRecord.objects.exists())
+        self.assertFalse(CashFlowDailyRollup.objects.exists())
+
+    def test_partial_create_saves_valid_items(self):
+        other = Category.objects.create(
+            name="Чужая", type=Type.objects.create(name="Списание")
+        )
+        response = self.send(
+            "post",
+            [self.item(), self.item(category=other.pk), self.item()],
+            mode="partial",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["ids"]), 2)
+        self.assertEqual(
+            [error["index"] for error in response.data["errors"]], [1]
+        )
+        self.assertEqual(
+            response.data["errors"][0]["errors"]["category"],
+            [CATEGORY_TYPE_MISMATCH],
+        )
+        self.assertCountEqual(
+            CashFlowRecord.objects.values_list("id", flat=True),
+            response.data["ids"],
+        )
+        self.assertRollupMatchesRecords()
+
+    def test_patch_moves_record_to_another_date(self):
+        record = self.add(100, datetime.date(2024, 3, 5))
+        self.add(40, datetime.date(2024, 3, 5))
+        response = self.send(
+            "patch",
+            [{"id": record.pk, "custom_date": "2024-04-10", "amount": "70"}],
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertRollupMatchesRecords()
+        old_day = CashFlowDailyRollup.objects.get(
+            date=datetime.date(2024, 3, 5)
+        )
+        self.assertEqual(
+            (old_day.amount_total, old_day.record_count), (40, 1)
+        )
+        self.assertEqual(CashFlowDailyRollup.objects.get(
+            date=datetime.date(2024, 4, 10)
+        ).amount_total, 70)
+
+    def test_delete_reports_missing_ids(self):
+        record = self.add(100, datetime.date(2024, 3, 5))
+        missing = record.pk + 1000
+
+        response = self.send("delete", [record.pk, missing])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["errors"], [{"index": 1, "errors": {
+            "id": [f"Запись с id={missing} не существует"]
+        }}])
+        self.assertTrue(CashFlowRecord.objects.filter(pk=record.pk).exists())
+
+        response = self.send("delete", [record.pk, missing], mode="partial")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["ids"], [record.pk])
+        self.assertEqual(len(response.data["errors"]), 1)
+        self.assertFalse(CashFlowRecord.objects.exists())
+        self.assertFalse(CashFlowDailyRollup.objects.exists())
+
+
+class ImportEndpointTests(RollupTestCase):
+    url = reverse_lazy("cashflow_api:cashflowrecord-import-records")
+    csv_content = (
+        "date,status,type,category,subcategory,amount,comment\n"
+        "2024-03-05,Бизнес,Пополнение,Продажи,Avito,100,Аванс\n"
+        "2024-03-06,,Пополнение,Нет такой,Avito,50,\n"
+    ).encode()
+
+    def upload(self, name, content, query="", **data):
+        return self.client.post(
+            f"{self.url}{query}",
+            {"file": SimpleUploadedFile(name, content), **data},
+        )
+
+    def test_csv_by_extension(self):
+        response = self.upload("records.csv", self.csv_content)
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            (response.data["imported"], response.data["rejected"]), (1, 1)
+        )
+        self.assertEqual(response.data["errors"][0]["line"], 3)
+        record = CashFlowRecord.objects.get()
+        self.assertEqual(
+            (record.amount, record.comment, record.status), (
+                100, "Аванс", self.status
+            )
+        )
+        self.assertRollupMatchesRecords()
+
+    def test_file_format_overrides_extension(self):
+        jsonl = (
+            '{"date": "2024-03-05", "type": "Пополнение", '
+            '"category": "Продажи", "subcategory": "Avito", "amount": 70}\n'
+        ).encode()
+        response = self.upload("blob", jsonl, file_format="jsonl")
+        self.assertEqual(response.status_code, 200, response.data)
+        response = self.upload(
+            "export.txt", self.csv_content, "?file_format=csv"
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            sorted(CashFlowRecord.objects.values_list("amount", flat=True)),
+            [70, 100],
+        )
+
+    def test_unknown_format(self):
+        response = self.upload("export.txt", self.csv_content)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("file_format", response.data)
+        self.assertFalse(CashFlowRecord.objects.exists())
+
+    def test_missing_file(self):
+        response = self.client.post(self.url, {})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("file", response.data)
+
+
+class ReportTests(RollupTestCase):
+    url = reverse_lazy("cashflow_api:reports")
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.expense_type = Type.objects.create(name="Списание")
+        cls.marketing = Category.objects.create(
+            name="Маркетинг", type=cls.expense_type
+        )
+        cls.ads = SubCategory.objects.create(
+            name="Реклама", category=cls.marketing
+        )
+
+    def setUp(self):
+        self.add(100, datetime.date(2024, 1, 10), self.status)
+        self.add(50, datetime.date(2024, 1, 20))
+        CashFlowRecord.objects.create(
+            status=self.status, type=self.expense_type,
+            category=self.marketing, subcategory=self.ads, amount=30,
+            custom_date=datetime.date(2024, 3, 5),
+        )
+
+    def report(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200, response.data)
+        # Масштаб суммы зависит от СУБД - сравниваем значения, а не строки
+        report = response.json()
+        report["total"] = Decimal(report["total"])
+        for row in report["results"]:
+            row["total"] = Decimal(row["total"])
+        return report
+
+    def test_months_without_records_are_omitted(self):
+        report = self.report()
+        self.assertEqual(report["period"], "month")
+        self.assertEqual(report["results"], [
+            {"period": "2024-01-01", "total": Decimal(150), "count": 2},
+            {"period": "2024-03-01", "total": Decimal(30), "count": 1},
+        ])
+        self.assertEqual((report["total"], report["count"]), (180, 3))
+
+    def test_periods(self):
+        expected = {
+            "day": ["2024-01-10", "2024-01-20", "2024-03-05"],
+            "week": ["2024-01-08", "2024-01-15", "2024-03-04"],
+            "quarter": ["2024-01-01"],
+            "year": ["2024-01-01"],
+        }
+        for period, starts in expected.items():
+            with self.subTest(period=period):
+                report = self.report(period=period)
+                self.assertEqual(
+                    [row["period"] for row in report["results"]], starts
+                )
+                self.assertEqual(report["count"], 3)
+
+    def test_group_by_status_includes_records_without_status(self):
+        report = self.report(period="year", group_by="status")
+        self.assertCountEqual(report["results"], [
+            {
+                "period": "2024-01-01", "status": self.status.pk,
+                "status_name": "Бизнес", "total": Decimal(130), "count": 2,
+            },
+            {
+                "period": "2024-01-01", "status": None,
+                "status_name": None, "total": Decimal(50), "count": 1,
+            },
+        ])
+
+    def test_group_by_several_directories_with_filter(self):
+        report = self.report(
+            group_by=["type", "category"], date_from="2024-01-15",
+        )
+        self.assertEqual(report["group_by"], ["type", "category"])
+        self.assertEqual(report["results"], [
+            {
+                "period": "2024-01-01",
+                "type": self.type.pk, "type_name": "Пополнение",
+                "category": self.category.pk, "category_name": "Продажи",
+                "total": Decimal(50), "count": 1,
+            },
+            {
+                "period": "2024-03-01",
+                "type": self.expense_type.pk, "type_name": "Списание",
+                "category": self.marketing.pk, "category_name": "Маркетинг",
+                "total": Decimal(30), "count": 1,
+            },
+        ])
+
+        report = self.report(
+            period="year", group_by="subcategory",
+            type=self.expense_type.pk,
+        )
+        self.assertEqual(
+            [(row["subcategory_name"], row["total"])
+             for row in report["results"]],
+            [("Реклама", 30)],
+        )
+
+    def test_empty_period(self):
+        report = self.report(date_from="2025-01-01", group_by="type")
+        self.assertEqual(report["results"], [])
+        self.assertEqual((report["total"], report["count"]), (0, 0))
+
+    def test_invalid_parameters(self):
+        response = self.client.get(self.url, {"period": "decade"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("period", response.data)
+        response = self.client.get(self.url, {"group_by": "comment"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("group_by", response.data)
+
+
+class ExportTests(RollupTestCase):
+    url = reverse_lazy("cashflow:cashflow_export")
+
+    def setUp(self):
+        self.march = self.add(100, datetime.date(2024, 3, 5), self.status)
+        self.march.comment = "=HYPERLINK(\"http://example.com\")"
+        self.march.save()
+        self.april = self.add(Decimal("-7.50"), datetime.date(2024, 4, 1))
+
+    def export(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content)
+
+    def csv_rows(self, **params):
+        content = self.export(**params).decode("utf-8-sig")
+        return list(csv.reader(io.StringIO(content)))
+
+    def xlsx_sheets(self, content):
+        archive = zipfile.ZipFile(io.BytesIO(content))
+        self.assertIsNone(archive.testzip())
+        names = re.findall(
+            r'<sheet name="([^"]+)"',
+            archive.read("xl/workbook.xml").decode(),
+        )
+        return names, [
+            re.findall(
+                r"<row>(.*?)</row>",
+                archive.read(f"xl/worksheets/sheet{number}.xml").decode(),
+            )
+            for number in range(1, len(names) + 1)
+        ]
+
+    def test_csv_content(self):
+        rows = self.csv_rows()
+        self.assertEqual(tuple(rows[0]), EXPORT_HEADERS)
+        self.assertEqual(rows[1], [
+            str(self.april.pk), "2024-04-01", "", "Пополнение", "Продажи",
+            "Avito", "-7.50", "",
+        ])
+        # Комментарий не превращается в формулу, отрицательная сумма
+        # (не строка) остаётся числом.
+        self.assertEqual(rows[2][2], "Бизнес")
+        self.assertEqual(
+            rows[2][-1], "'=HYPERLINK(\"http://example.com\")"
+        )
+        self.assertEqual(len(rows), 3)
+
+    def test_filters_applied(self):
+        rows = self.csv_rows(date_from="2024-03-01", date_to="2024-03-31")
+        self.assertEqual([row[0] for row in rows[1:]], [str(self.march.pk)])
+        rows = self.csv_rows(status=self.status.pk, format="csv")
+        self.assertEqual([row[0] for row in rows[1:]], [str(self.march.pk)])
+        names, sheets = self.xlsx_sheets(
+            self.export(format="xlsx", date_from="2024-04-01")
+        )
+        self.assertEqual(len(sheets[0]), 2)
+        self.assertIn(f"<v>{self.april.pk}</v>", sheets[0][1])
+
+    def test_xlsx_content(self):
+        names, sheets = self.xlsx_sheets(self.export(format="xlsx"))
+        self.assertEqual(names, ["ДДС"])
+        header, april, march = sheets[0]
+        self.assertIn("Подкатегория", header)
+        # Дата - число дней от эпохи Excel со стилем даты.
+        self.assertIn('<c s="1"><v>45383</v></c>', april)
+        self.assertIn("<c><v>-7.50</v></c>", april)
+        # В XLSX текст хранится строкой и формулой не бывает.
+        self.assertIn('=HYPERLINK("http://example.com")', march)
+
+    def test_xlsx_rolls_over_to_new_sheet(self):
+        for day in range(1, 4):
+            self.add(1, datetime.date(2024, 5, day))
+        rows = export_rows(CashFlowRecord.objects.all())
+        names, sheets = self.xlsx_sheets(
+            b"".join(iter_xlsx(rows, max_rows=3))
+        )
+        self.assertEqual(names, ["ДДС", "ДДС 2", "ДДС 3"])
+        # Заголовок на каждом листе, всего пять записей.
+        self.assertEqual([len(sheet) for sheet in sheets], [3, 3, 2])
+
+    def test_unknown_format(self):
+        response = self.client.get(self.url, {"format": "pdf"})
+        self.assertEqual(response.status_code, 400)
+
+
+postgresql_only = skipUnless(
+    connection.vendor == "postgresql", "Секции есть только в PostgreSQL"
+)
+
+
+class PartitionTests(RollupTestCase):
+    """ Создание и отключение помесячных секций таблицы записей """
+
+    def rows_in(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT COUNT(*) FROM {connection.ops.quote_name(table)}"
+            )
+            return cursor.fetchone()[0]
+
+    @skipIf(connection.vendor == "postgresql", "Таблица секционирована")
+    def test_unpartitioned_table_is_left_alone(self):
+        self.assertFalse(is_partitioned(DEFAULT_DB_ALIAS))
+        self.assertEqual(ensure_partitions(DEFAULT_DB_ALIAS), [])
+
+    @postgresql_only
+    def test_ensure_partitions_ahead(self):
+        created = ensure_partitions(
+            DEFAULT_DB_ALIAS, months_ahead=2,
+            today=datetime.date(2091, 11, 20),
+        )
+        self.assertEqual(created, [
+            partition_name(datetime.date(2091, 11, 1)),
+            partition_name(datetime.date(2091, 12, 1)),
+            partition_name(datetime.date(2092, 1, 1)),
+        ])
+        self.assertEqual(
+            ensure_partitions(
+                DEFAULT_DB_ALIAS, months_ahead=2,
+                today=datetime.date(2091, 11, 1),
+            ),
+            [],
+        )
+
+    @postgresql_only
+    def test_create_partition_moves_rows_out_of_default(self):
+        month = datetime.date(2090, 1, 1)
+        record = self.add(100, datetime.date(2090, 1, 15))
+        self.add(50, datetime.date(2090, 2, 1))
+        self.assertEqual(self.rows_in(default_partition_name()), 2)
+
+        self.assertTrue(create_partition(month, DEFAULT_DB_ALIAS))
+        self.assertFalse(create_partition(month, DEFAULT_DB_ALIAS))
+        self.assertIn(
+            Partition(
+                partition_name(month), month, datetime.date(2090, 2, 1)
+            ),
+            list_partitions(DEFAULT_DB_ALIAS),
+        )
+        self.assertEqual(self.rows_in(partition_name(month)), 1)
+        self.assertEqual(self.rows_in(default_partition_name()), 1)
+        self.assertEqual(CashFlowRecord.objects.get(pk=record.pk).amount, 100)
+        self.assertEqual(CashFlowRecord.objects.count(), 2)
+
+    @postgresql_only
+    def test_detach_partitions(self):
+        december = datetime.date(2000, 12, 1)
+        january = datetime.date(2001, 1, 1)
+        for month in (december, january):
+            create_partition(month, DEFAULT_DB_ALIAS)
+        self.add(100, datetime.date(2000, 12, 20))
+        self.add(30, datetime.date(2001, 1, 10))
+        kept = self.add(50, datetime.date(2001, 2, 10))
+        BalanceCheckpoint.objects.refresh()
+        days = [
+            datetime.date(2001, 2, 1), datetime.date(2001, 2, 11),
+            datetime.date(2001, 3, 1), datetime.date.today(),
+        ]
+        balances = [balance_before(day) for day in days]
+        version, _ = RecordChangeMarker.objects.state(
+            december, datetime.date(2001, 1, 31)
+        )
+
+        removed = detach_partitions(
+            datetime.date(2001, 2, 15), DEFAULT_DB_ALIAS
+        )
+        self.assertEqual(
+            [partition.name for partition in removed],
+            [partition_name(december), partition_name(january)],
+        )
+        self.assertNotIn(
+            partition_name(january),
+            [p.name for p in list_partitions(DEFAULT_DB_ALIAS)],
+        )
+        # Отключённая секция остаётся отдельной таблицей со строками.
+        self.assertEqual(self.rows_in(partition_name(january)), 1)
+        self.assertEqual(
+            list(CashFlowRecord.objects.values_list("pk", flat=True)),
+            [kept.pk],
+        )
+        self.assertRollupMatchesRecords()
+        # Остаток на конец января - начальный, остатки после границы
+        # не меняются.
+        self.assertEqual(
+            BalanceCheckpoint.objects.filter(month__lt=days[0]).get().month,
+            january,
+        )
+        self.assertEqual([balance_before(day) for day in days], balances)
+        self.assertEqual(balances[2], Decimal("180.00"))
+        self.assertGreater(
+            RecordChangeMarker.objects.state(
+                december, datetime.date(2001, 1, 31)
+            )[0],
+            version,
+        )
+
+
+class ImporterDatabaseTests(TransactionTestCase):
+    databases = {DEFAULT_DB_ALIAS, REPLICA}
+
+    def test_directories_read_from_target_database(self):
+        record_type = Type.objects.create(name="Пополнение")
+        category = Category.objects.create(name="Продажи", type=record_type)
+        SubCategory.objects.create(name="Avito", category=category)
+        rows = read_rows(io.StringIO(
+            "date,type,category,subcategory,amount\n"
+            "2024-03-05,Пополнение,Продажи,Avito,100\n"
+        ), "csv")
+
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as default:
+            stats = RecordImporter(using=REPLICA).run(rows)
+        self.assertEqual((stats.imported, stats.rejected), (1, 0))
+        self.assertEqual(len(default), 0)
+        self.assertEqual(CashFlowRecord.objects.get().amount, 100)
+
+
+@override_settings(CASHFLOW_REPLICA_DATABASES=[REPLICA])
+class ReplicaRoutingTests(TransactionTestCase):
+    databases = {DEFAULT_DB_ALIAS, REPLICA}
+    statuses_url = reverse_lazy("cashflow_api:status-list")
+
+    def setUp(self):
+        replica_health.reset()
+        self.addCleanup(replica_health.reset)
+        Status.objects.create(name="Личное")
+
+    def assertReadsFrom(self, alias):
+        """
+        Запрос к API статусов; таблицу статусов читает только alias
+        (проверка реплики и сессии в счёт не идут).
+        """
+        table = Status._meta.db_table
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as default, \
+                CaptureQueriesContext(connections[REPLICA]) as replica:
+            response = self.client.get(self.statuses_url)
+        reads = {
+            DEFAULT_DB_ALIAS: [q for q in default if table in q["sql"]],
+            REPLICA: [q for q in replica if table in q["sql"]],
+        }
+        self.assertTrue(reads.pop(alias))
+        self.assertEqual(list(reads.values()), [[]])
+        return response
+
+    def test_safe_request_reads_from_replica(self):
+        response = self.assertReadsFrom(REPLICA)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"][0]["name"], "Личное")
+
+    def test_session_sticks_to_primary_after_write(self):
+        response = self.client.post(
+            self.statuses_url, {"name": "Бизнес"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(STICKY_SESSION_KEY, self.client.session)
+        response = self.assertReadsFrom(DEFAULT_DB_ALIAS)
+        self.assertEqual(len(response.data["results"]), 2)
+
+        session = self.client.session
+        session[STICKY_SESSION_KEY] = 0
+        session.save()
+        self.assertReadsFrom(REPLICA)
+
+    def test_session_sticks_after_form_redirect(self):
+        response = self.client.post(
+            reverse("cashflow:status_create"), {"name": "Бизнес"}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(STICKY_SESSION_KEY, self.client.session)
+
+    def test_requests_without_write_do_not_stick(self):
+        response = self.client.post(
+            self.statuses_url, {"name": ""}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn(STICKY_SESSION_KEY, self.client.session)
+        self.assertReadsFrom(REPLICA)
+
+    def sticks(self, status, asynchronous=False):
+        """ Закрепляет ли middleware сессию после записи с ответом status """
+        def view(request):
+            router.db_for_write(Status)
+            return HttpResponse(status=status)
+
+        async def async_view(request):
+            return view(request)
+
+        request = RequestFactory().post(self.statuses_url)
+        request.session = self.client.session
+        if asynchronous:
+            async_to_sync(ReplicaRoutingMiddleware(async_view))(request)
+        else:
+            ReplicaRoutingMiddleware(view)(request)
+        return STICKY_SESSION_KEY in request.session
+
+    def test_only_successful_writes_stick(self):
+        for asynchronous in (False, True):
+            with self.subTest(asynchronous=asynchronous):
+                self.assertFalse(self.sticks(500, asynchronous))
+                self.assertFalse(self.sticks(409, asynchronous))
+                self.assertTrue(self.sticks(201, asynchronous))
+
+    @override_settings(CASHFLOW_REPLICA_MAX_LAG_SECONDS=-1)
+    def test_lagging_replica_falls_back_to_primary(self):
+        with self.assertLogs("cash_flow.db_routing", "WARNING"):
+            self.assertReadsFrom(DEFAULT_DB_ALIAS)
+        self.assertFalse(replica_health.is_healthy(REPLICA))
+
+    def test_reads_inside_atomic_block_use_primary(self):
+        request = RequestFactory().get(self.statuses_url)
+        request.resolver_match = resolve(str(self.statuses_url))
+        token = begin_request(request)
+        try:
+            with transaction.atomic():
+                self.assertEqual(
+                    router.db_for_read(Status), DEFAULT_DB_ALIAS
+                )
+            self.assertEqual(router.db_for_read(Status), REPLICA)
+        finally:
+            end_request(token)
+
+
+@override_settings(CASHFLOW_REPLICA_DATABASES=[REPLICA])
+class AsyncReplicaRoutingTests(TransactionTestCase):
+    """
+    Асинхронное представление выбирает реплику (проверка реплики
+    и чтение сессии - синхронный ввод-вывод) вне цикла событий.
+    """
+    databases = {DEFAULT_DB_ALIAS, REPLICA}
+
+    def setUp(self):
+        replica_health.reset()
+        self.addCleanup(replica_health.reset)
+        directory_cache.invalidate()
+        self.type = Type.objects.create(name="Пополнение")
+        category = Category.objects.create(name="Продажи", type=self.type)
+        subcategory = SubCategory.objects.create(
+            name="Avito", category=category
+        )
+        self.record = CashFlowRecord.objects.create(
+            type=self.type, category=category, subcategory=subcategory,
+            amount=100,
+        )
+
+    def test_filtered_list_reads_from_replica(self):
+        # Синхронный тест: запросы ORM из sync_to_async выполняются
+        # в этом потоке и попадают в CaptureQueriesContext.
+        url = reverse("cashflow_api:records_async")
+        with CaptureQueriesContext(connections[REPLICA]) as replica:
+            response = async_to_sync(self.async_client.get)(
+                url, {"type": self.type.pk}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [item["id"] for item in response.json()["results"]],
+            [self.record.pk],
+        )
+        table = CashFlowRecord._meta.db_table
+        self.assertTrue([q for q in replica if table in q["sql"]])
+
+    async def test_invalid_filter_with_replica(self):
+        response = await self.async_client.get(
+            reverse("cashflow_api:records_async"), {"type": 0}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("type", response.json())
+
+
+class AsyncRecordListTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        record_type = Type.objects.create(name="Пополнение")
+        category = Category.objects.create(name="Продажи", type=record_type)
+        subcategory = SubCategory.objects.create(
+            name="Avito", category=category
+        )
+        for amount, comment in ((100, "Аванс"), (Decimal("50.5"), "")):
+            CashFlowRecord.objects.create(
+                status=Status.objects.create(name=f"Статус {amount}"),
+                type=record_type, category=category,
+                subcategory=subcategory, amount=amount, comment=comment,
+                custom_date=datetime.date(2024, 3, 5),
+            )
+        CashFlowRecord.objects.create(
+            type=record_type, category=category, subcategory=subcategory,
+            amount=1,
+        )
+
+    def test_payload_matches_api(self):
+        for params in ({}, {"page_size": 2}, {"amount_min": 50}):
+            with self.subTest(params=params):
+                payload = self.client.get(
+                    reverse("cashflow_api:records_async"), params
+                ).json()
+                expected = self.client.get(
+                    reverse("cashflow_api:cashflowrecord-list"), params
+                ).json()
+                self.assertEqual(
+                    (payload["count"], payload["count_exact"]),
+                    (expected["count"], expected["count_exact"]),
+                )
+                self.assertEqual(payload["results"], expected["results"])
+                self.assertEqual(list(payload), list(expected))
+                self.assertIn("updated_at", payload["results"][0])
+        self.assertEqual(payload["count"], 2)
+
+
+class ChoiceFieldQueryCountTests(TestCase):
+    """
+    Отрисовка форм со справочниками стоит фиксированное число запросов
+    и не зависит от количества категорий и подкатегорий.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        Status.objects.bulk_create(
+            [Status(name=f"Статус {i}") for i in range(5)]
+        )
+        types = Type.objects.bulk_create(
+            [Type(name=f"Тип {i}") for i in range(3)]
+        )
+        categories = Category.objects.bulk_create([
+            Category(name=f"Категория {i}", type=types[i % len(types)])
+            for i in range(60)
+        ])
+        subcategories = SubCategory.objects.bulk_create([
+            SubCategory(
+                name=f"Подкатегория {i}",
+                category=categories[i % len(categories)]
+            )
+            for i in range(300)
+        ])
+        cls.record = CashFlowRecord.objects.create(
+            type=types[0],
+            category=categories[0],
+            subcategory=subcategories[0],
+            amount=100,
+        )
+
+    def setUp(self):
+        directory_cache.invalidate()
+
+    def test_create_form(self):
+        with self.assertNumQueries(DIRECTORY_LOAD_QUERIES):
+            html = CashFlowRecordForm().as_p()
+        self.assertIn("Категория 59 (Тип 2)", html)
+
+    def test_update_form(self):
+        with self.assertNumQueries(DIRECTORY_LOAD_QUERIES):
+            html = CashFlowRecordForm(instance=self.record).as_p()
+        self.assertIn("Подкатегория 0 (Категория 0)", html)
+
+    def test_bound_form_validation(self):
+        data = {
+            "type": self.record.type_id,
+            "category": self.record.category_id,
+            "subcategory": self.record.subcategory_id,
+            "amount": "10.00",
+        }
+        # Плюс чтение выбранных справочников из БД и проверка
+        # существования внешних ключей при full_clean модели.
+        with self.assertNumQueries(DIRECTORY_LOAD_QUERIES + 6):
+            form = CashFlowRecordForm(data=data)
+            self.assertTrue(form.is_valid(), form.errors)
+            form.as_p()
+
+    def test_filter_form(self):
+        with self.assertNumQueries(DIRECTORY_LOAD_QUERIES):
+            CashFlowFilterForm({"type": self.record.type_id}).as_p()
+
+    def test_subcategory_form(self):
+        with self.assertNumQueries(DIRECTORY_LOAD_QUERIES):
+            SubCategoryForm().as_p()
+
+    def test_filter_by_directory_is_not_a_write(self):
+        """ Иначе GET списка с фильтром закрепляет сессию за основной БД """
+        token = begin_request()
+        form = CashFlowFilterForm(
+            {"subcategory": self.record.subcategory_id}
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertFalse(end_request(token))
+
+    def test_warm_cache_costs_no_queries(self):
+        CashFlowRecordForm().as_p()
+        with self.assertNumQueries(0):
+            CashFlowRecordForm().as_p()
+            CashFlowFilterForm().as_p()
+
+    def test_choices_follow_directory_changes(self):
+        """
+        Варианты полей берутся из снимка при отрисовке, а не при
+        объявлении класса формы.
+        """
+        CashFlowRecordForm().as_p()
+        Status.objects.create(name="Новый статус")
+        self.assertIn("Новый статус", CashFlowRecordForm().as_p())
+
+    def test_snapshot_expires_after_ttl(self):
+        """
+        Изменение из другого процесса (без сигналов в этом) видно
+        после истечения CASHFLOW_DIRECTORY_TTL.
+        """
+        CashFlowRecordForm().as_p()
+        Status.objects.filter(name="Статус 0").update(name="Переименован")
+        self.assertNotIn("Переименован", CashFlowRecordForm().as_p())
+
+        directory_cache._snapshot.loaded_at -= directory_cache.ttl
+        with self.assertNumQueries(DIRECTORY_LOAD_QUERIES):
+            html = CashFlowRecordForm().as_p()
+        self.assertIn("Переименован", html)
+
+    @override_settings(CASHFLOW_DIRECTORY_TTL=0)
+    def test_zero_ttl_disables_expiry(self):
+        CashFlowRecordForm().as_p()
+        directory_cache._snapshot.loaded_at -= 3600
+        with self.assertNumQueries(0):
+            CashFlowRecordForm().as_p()
+
+
+class StaleDirectoryFormTests(RollupTestCase):
+    """
+    Формы, которые сохраняют данные, проверяют справочники по БД:
+    снимок кэша, загруженный до изменения в другом процессе, не даёт
+    сохранить запись с удалённым или перенесённым справочником.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.expense = Type.objects.create(name="Списание")
+
+    def form(self, **overrides):
+        data = {
+            "status": self.status.pk,
+            "type": self.type.pk,
+            "category": self.category.pk,
+            "subcategory": self.subcategory.pk,
+            "amount": "10.00",
+        }
+        data.update(overrides)
+        return CashFlowRecordForm(data=data)
+
+    def test_category_moved_to_another_type(self):
+        with pin_directory(DirectorySnapshot.load()):
+            # update() не отправляет сигналы - кэш об изменении не знает.
+            Category.objects.filter(pk=self.category.pk).update(
+                type=self.expense
+            )
+            form = self.form()
+            self.assertFalse(form.is_valid())
+            self.assertEqual(
+                form.errors["category"], [CATEGORY_TYPE_MISMATCH]
+            )
+            self.assertTrue(self.form(type=self.expense.pk).is_valid())
+
+    def test_deleted_directory(self):
+        status_id = Status.objects.create(name="Личное").pk
+        with pin_directory(DirectorySnapshot.load()):
+            Status.objects.filter(pk=status_id).delete()
+            form = self.form(status=status_id)
+            self.assertFalse(form.is_valid())
+            self.assertIn("status", form.errors)
+
+            subcategory = SubCategory.objects.create(
+                name="Ozon", category=self.category
+            )
+            # Новой подкатегории нет в снимке, но в БД она есть.
+            form = self.form(subcategory=subcategory.pk)
+            self.assertTrue(form.is_valid(), form.errors)
+            self.assertEqual(form.save().subcategory, subcategory)
+
+    def test_subcategory_form(self):
+        with pin_directory(DirectorySnapshot.load()):
+            Category.objects.filter(pk=self.category.pk).delete()
+            form = SubCategoryForm(
+                data={"name": "Ozon", "category": self.category.pk}
+            )
+            self.assertFalse(form.is_valid())
+            self.assertIn("category", form.errors)
+
+    def test_filter_form_uses_cache(self):
+        snapshot = DirectorySnapshot.load()
+        with pin_directory(snapshot), self.assertNumQueries(0):
+            form = CashFlowFilterForm({"category": self.category.pk})
+            self.assertTrue(form.is_valid(), form.errors)
+
+
+class DirectoryTreeTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        record_type = Type.objects.create(name="Списание")
+        Category.objects.create(name="Маркетинг", type=record_type)
+
+    def setUp(self):
+        directory_cache.invalidate()
+
+    def test_not_modified_until_directories_change(self):
+        url = reverse("cashflow:directory_tree")
+        response = self.client.get(url)
+        etag = response["ETag"]
+        self.assertEqual(etag, f'"{directory_cache.get().etag}"')
+        self.assertEqual(
+            response.json()["types"][0]["categories"][0]["name"],
+            "Маркетинг",
+        )
+
+        # Снимок уже в памяти: 304 без запросов к БД.
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Category.objects.update(name="Реклама")
+        Status.objects.create(name="Бизнес")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+
+class BatchValidationTests(TestCase):
+    """
+    Пакетная проверка загружает справочники один раз на весь набор
+    и возвращает ошибки по каждой записи.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.income, cls.expense = Type.objects.bulk_create(
+            [Type(name="Пополнение"), Type(name="Списание")]
+        )
+        cls.sales = Category.objects.create(name="Продажи", type=cls.income)
+        cls.infra = Category.objects.create(name="Инфра", type=cls.expense)
+        cls.avito = SubCategory.objects.create(name="Avito", category=cls.sales)
+        cls.vps = SubCategory.objects.create(name="VPS", category=cls.infra)
+
+    def payload(self, **overrides):
+        return {
+            "type": self.income.pk,
+            "category": self.sales.pk,
+            "subcategory": self.avito.pk,
+            "amount": 10,
+            **overrides,
+        }
+
+    def test_queries_do_not_depend_on_batch_size(self):
+        payloads = [self.payload() for _ in range(500)]
+        payloads.append(self.payload(type=self.expense.pk))
+        payloads.append(self.payload(subcategory=self.vps.pk, amount=-1))
+        payloads.append(self.payload(type=999999))
+
+        with self.assertNumQueries(3):
+            errors = validate_records(payloads)
+
+        self.assertEqual(errors[:500], [{}] * 500)
+        self.assertEqual(errors[500], {"category": [CATEGORY_TYPE_MISMATCH]})
+        self.assertEqual(errors[501], {
+            "subcategory": [SUBCATEGORY_CATEGORY_MISMATCH],
+            "amount": ["Количество средств не может быть меньше нуля"],
+        })
+        self.assertEqual(errors[502], {
+            "type": ["Объект с id=999999 не существует"],
+            "category": [CATEGORY_TYPE_MISMATCH],
+        })
+
+    def test_instances_need_no_queries(self):
+        category = Category.objects.get(pk=self.infra.pk)
+        with self.assertNumQueries(0):
+            with self.assertRaisesMessage(ValueError, CATEGORY_TYPE_MISMATCH):
+                validate_category_type_match(category, self.income)
+
+    def test_preloaded_index(self):
+        directory_cache.invalidate()
+        index = HierarchyIndex.from_directory(directory_cache.get())
+        with self.assertNumQueries(0):
+            errors = validate_records(
+                [self.payload(), self.payload(type=self.expense.pk)], index
+            )
+        self.assertEqual(errors, [{}, {"category": [CATEGORY_TYPE_MISMATCH]}])
+
+
+class RecordSearchTests(TestCase):
+    """
+    Поиск по комментарию сочетается с фильтрами списка, а результаты
+    с рангом листаются курсором по (ранг, дата, id).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.income, cls.expense = Type.objects.bulk_create(
+            [Type(name="Пополнение"), Type(name="Списание")]
+        )
+        sales = Category.objects.create(name="Продажи", type=cls.income)
+        infra = Category.objects.create(name="Инфра", type=cls.expense)
+        avito = SubCategory.objects.create(name="Avito", category=sales)
+        vps = SubCategory.objects.create(name="VPS", category=infra)
+        cls.records = [
+            CashFlowRecord.objects.create(
+                type=record_type, category=category, subcategory=subcategory,
+                amount=amount, comment=comment,
+                custom_date=datetime.date(2024, 1, 1 + i % 3),
+            )
+            for i, (record_type, category, subcategory, amount, comment) in
+            enumerate([
+                (cls.income, sales, avito, 10, "Оплата аренды офиса"),
+                (cls.expense, infra, vps, 20, "Продление аренды сервера"),
+                (cls.expense, infra, vps, 30, "Налоги"),
+                (cls.income, sales, avito, 40, "аренда склада"),
+                (cls.expense, infra, vps, 10, None),
+            ])
+        ]
+
+    def test_search_with_filters(self):
+        form = CashFlowFilterForm(
+            {"search": " аренд ", "type": self.expense.pk}
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+        found = CashFlowRecord.objects.filter_by(form.cleaned_data)
+        self.assertEqual(list(found), [self.records[1]])
+
+        form = CashFlowFilterForm({"search": "аренд"})
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertCountEqual(
+            CashFlowRecord.objects.filter_by(form.cleaned_data),
+            [self.records[0], self.records[1], self.records[3]],
+        )
+
+    def test_ranked_keyset_pages(self):
+        queryset = CashFlowRecord.objects.annotate(**{
+            SEARCH_RANK: Cast("amount", DecimalField(
+                max_digits=9, decimal_places=6
+            )),
+        })
+        self.assertEqual(rank_field(queryset), SEARCH_RANK)
+        expected = sorted(
+            self.records,
+            key=lambda r: (r.amount, r.effective_date, r.pk),
+            reverse=True,
+        )
+
+        paginator = KeysetPaginator(queryset, 2, rank_field=SEARCH_RANK)
+        pages, cursor = [], None
+        while True:
+            page = paginator.get_page(cursor)
+            pages.append(page)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual([r for page in pages for r in page], expected)
+
+        previous = paginator.get_page(pages[-1].previous_cursor)
+        self.assertEqual(list(previous), list(pages[-2]))
+        with self.assertRaises(InvalidCursor):
+            KeysetPaginator(queryset, 2).get_page(pages[0].next_cursor)
+
+
+class DataGeneratorTests(TestCase):
+    """ Синтетические записи воспроизводимы и проходят импорт """
+
+    def test_same_seed_same_rows(self):
+        template = directory_template(extra_categories=2)
+        args = (
+            datetime.date(2024, 1, 1), datetime.date(2024, 12, 31), template
+        )
+        rows = list(generate_rows(300, 7, *args))
+        self.assertEqual(rows, list(generate_rows(300, 7, *args)))
+        self.assertNotEqual(rows, list(generate_rows(300, 8, *args)))
+
+    def test_generated_records_are_valid(self):
+        stats = generate_records(
+            200, seed=1,
+            start=datetime.date(2024, 1, 1), end=datetime.date(2024, 3, 31),
+        )
+        self.assertEqual((stats.imported, stats.rejected), (200, 0))
+        self.assertEqual(CashFlowRecord.objects.count(), 200)
+
+
+class SqlInstrumentationTests(TestCase):
+    def test_normalize_sql(self):
+        self.assertEqual(
+            normalize_sql(
+                "SELECT \"t1\".\"id\" FROM \"t1\"  WHERE \"name\" = 'a''b' "
+                "AND \"id\" IN (%s, %s, %s) LIMIT 21"
+            ),
+            "SELECT \"t1\".\"id\" FROM \"t1\" WHERE \"name\" = ? "
+            "AND \"id\" IN (...) LIMIT ?",
+        )
+
+    def test_duplicates(self):
+        record_type = Type.objects.create(name="Тип")
+        for number in range(3):
+            Category.objects.create(
+                name=f"Категория {number}", type=record_type
+            )
+        with profile_queries(slowest=2) as profile:
+            for category in Category.objects.all():
+                category.type.name
+        self.assertEqual(profile.count, 4)
+        self.assertEqual(len(profile.slowest()), 2)
+        [duplicate] = profile.duplicates(threshold=3)
+        self.assertEqual(duplicate["count"], 3)
+
+    @override_settings(CASHFLOW_SQL_SAMPLE_RATE=1.0)
+    def test_server_timing_header(self):
+        with self.assertLogs("cash_flow.sql", "INFO") as logs:
+            response = self.client.get(reverse("cashflow:cashflow_list"))
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(
+            response["Server-Timing"],
+            r'^db;dur=[\d.]+;desc="\d+ queries", app;dur=[\d.]+$',
+        )
+        self.assertIn('"status": 200', logs.output[0])
+
+    def test_disabled_by_default(self):
+        response = self.client.get(reverse("cashflow:cashflow_list"))
+        self.assertFalse(response.has_header("Server-Timing"))
+
+
+class MetricsTests(TestCase):
+    def sample(self, name, **labels):
+        return registry().get_sample_value(name, labels) or 0
+
+    def test_request_metrics(self):
+        labels = {
+            "view": "cashflow:cashflow_list", "method": "GET", "status": "200"
+        }
+        before = self.sample("cashflow_http_requests_total", **labels)
+        self.client.get(reverse("cashflow:cashflow_list"))
+        self.assertEqual(
+            self.sample("cashflow_http_requests_total", **labels), before + 1
+        )
+        self.assertGreater(self.sample(
+            "cashflow_db_queries_per_request_sum",
+            view="cashflow:cashflow_list",
+        ), 0)
+
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            b"# TYPE cashflow_http_request_duration_seconds histogram",
+            response.content,
+        )
+
+    @override_settings(CASHFLOW_METRICS_ALLOWED_IPS=["10.0.0.0/8", "::1"])
+    def test_metrics_access(self):
+        url = reverse("metrics")
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(
+            self.client.get(url, REMOTE_ADDR="10.1.2.3").status_code, 200
+        )
+        self.assertEqual(
+            self.client.get(url, HTTP_X_FORWARDED_FOR="10.1.2.3").status_code,
+            403,
+        )
+
+        user = User.objects.create_user("analyst", password="secret")
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        user.is_staff = True
+        user.save()
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class IncomeExpenseTestCase(TestCase):
+    """ Тип поступлений и тип списаний со справочниками """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.income = Type.objects.create(name="Пополнение")
+        cls.expense = Type.objects.create(name="Списание", is_expense=True)
+        cls.directories = {}
+        for record_type in (cls.income, cls.expense):
+            category = Category.objects.create(
+                name="Категория", type=record_type
+            )
+            cls.directories[record_type] = (
+                category,
+                SubCategory.objects.create(name="Прочее", category=category),
+            )
+
+    def add(self, record_type, amount, day):
+        category, subcategory = self.directories[record_type]
+        return CashFlowRecord.objects.create(
+            type=record_type, category=category, subcategory=subcategory,
+            amount=amount, custom_date=day,
+        )
+
+
+class BalanceTests(IncomeExpenseTestCase):
+    def test_checkpoints_follow_backdated_records(self):
+        self.add(self.income, 1000, datetime.date(2024, 1, 10))
+        self.add(self.expense, 300, datetime.date(2024, 2, 5))
+        BalanceCheckpoint.objects.refresh(today=datetime.date(2024, 4, 1))
+        self.assertEqual(
+            list(BalanceCheckpoint.objects.values_list("month", "balance")),
+            [
+                (datetime.date(2024, 1, 1), 1000),
+                (datetime.date(2024, 2, 1), 700),
+                (datetime.date(2024, 3, 1), 700),
+            ],
+        )
+
+        record = self.add(self.expense, 50, datetime.date(2024, 1, 20))
+        record.custom_date = datetime.date(2024, 2, 20)
+        record.save()
+        self.assertEqual(
+            list(BalanceCheckpoint.objects.values_list("balance", flat=True)),
+            [1000, 650, 650],
+        )
+        self.assertEqual(
+            balance_before(datetime.date(2024, 2, 20)), Decimal("700.00")
+        )
+        self.assertEqual(
+            balance_before(datetime.date(2024, 4, 2)), Decimal("650.00")
+        )
+
+    def test_only_expense_flag_change_refreshes_checkpoints(self):
+        self.add(self.income, 1000, datetime.date(2024, 1, 10))
+        BalanceCheckpoint.objects.refresh(today=datetime.date(2024, 3, 1))
+
+        # Полный пересчёт добавил бы остатки по текущий месяц.
+        self.income.name = "Продажи"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.income.save()
+        self.assertEqual(
+            list(BalanceCheckpoint.objects.values_list("balance", flat=True)),
+            [1000, 1000],
+        )
+
+        self.income.is_expense = True
+        with self.captureOnCommitCallbacks(execute=True):
+            self.income.save()
+        self.assertEqual(
+            list(
+                BalanceCheckpoint.objects.values_list("balance", flat=True)
+            )[:2],
+            [-1000, -1000],
+        )
+
+    def test_full_refresh_keeps_opening_balance(self):
+        """
+        Остаток перед первыми дневными итогами (их записи отключены
+        вместе с секцией) не пересчитывается, а служит начальным.
+        """
+        self.add(self.income, 1000, datetime.date(2024, 1, 10))
+        self.add(self.expense, 300, datetime.date(2024, 2, 5))
+        today = datetime.date(2024, 4, 1)
+        BalanceCheckpoint.objects.refresh(today=today)
+        CashFlowDailyRollup.objects.filter(
+            date__lt=datetime.date(2024, 2, 1)
+        ).delete()
+
+        BalanceCheckpoint.objects.refresh(full=True, today=today)
+        self.assertEqual(
+            list(BalanceCheckpoint.objects.values_list("balance", flat=True)),
+            [1000, 700, 700],
+        )
+        self.assertEqual(
+            balance_before(datetime.date(2024, 3, 15)), Decimal("700.00")
+        )
+
+    def test_record_balances(self):
+        day = datetime.date(2024, 3, 1)
+        first = self.add(self.income, 100, day)
+        second = self.add(self.expense, 30, day)
+        third = self.add(self.income, 5, day + datetime.timedelta(days=1))
+        self.assertEqual(
+            record_balances([third, second, first]),
+            {first.pk: 100, second.pk: 70, third.pk: 75},
+        )
+
+    def test_balance_api(self):
+        self.add(self.income, 100, datetime.date(2024, 3, 1))
+        self.add(self.expense, 40, datetime.date(2024, 3, 2))
+        response = self.client.get(reverse("cashflow_api:balance"), {
+            "date_from": "2024-03-02", "date_to": "2024-03-31",
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["opening_balance"], "100.00")
+        self.assertEqual(response.data["closing_balance"], "60.00")
+        self.assertEqual(response.data["results"], [{
+            "date": datetime.date(2024, 3, 2),
+            "income": "0.00",
+            "expense": "40.00",
+            "balance": "60.00",
+        }])
+
+
+class RecordApiListTests(TestCase):
+    """
+    Фильтры CashFlowRecordFilterBackend, порядок и курсоры /api/records/,
+    курсорная пагинация справочников.
+    """
+    url = reverse_lazy("cashflow_api:cashflowrecord-list")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.status = Status.objects.create(name="Бизнес")
+        cls.income, cls.expense = Type.objects.bulk_create(
+            [Type(name="Пополнение"), Type(name="Списание")]
+        )
+        cls.sales = Category.objects.create(name="Продажи", type=cls.income)
+        cls.infra = Category.objects.create(name="Инфра", type=cls.expense)
+        cls.avito = SubCategory.objects.create(
+            name="Avito", category=cls.sales
+        )
+        cls.vps = SubCategory.objects.create(name="VPS", category=cls.infra)
+        cls.records = [
+            CashFlowRecord.objects.create(
+                status=status, type=category.type, category=category,
+                subcategory=subcategory, amount=amount, comment=comment,
+                custom_date=day,
+            )
+            for status, category, subcategory, amount, comment, day in [
+                (cls.status, cls.sales, cls.avito, 100, "Аренда",
+                 datetime.date(2024, 1, 10)),
+                (None, cls.infra, cls.vps, 20, "Сервер",
+                 datetime.date(2024, 2, 1)),
+                (cls.status, cls.infra, cls.vps, 35, "",
+                 datetime.date(2024, 2, 1)),
+                (None, cls.sales, cls.avito, 70, "Аренда склада",
+                 datetime.date(2024, 3, 15)),
+                (None, cls.sales, cls.avito, 5, None,
+                 datetime.date(2024, 4, 1)),
+            ]
+        ]
+
+    def ids(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return [item["id"] for item in response.data["results"]]
+
+    def pks(self, *indexes):
+        return [self.records[i].pk for i in indexes]
+
+    def test_filters(self):
+        cases = [
+            ({"date_from": "2024-02-01"}, [1, 2, 3, 4]),
+            ({"date_to": "2024-02-01"}, [0, 1, 2]),
+            ({"status": self.status.pk}, [0, 2]),
+            ({"type": self.expense.pk}, [1, 2]),
+            ({"category": self.sales.pk}, [0, 3, 4]),
+            ({"subcategory": self.vps.pk}, [1, 2]),
+            ({"amount_min": "35"}, [0, 2, 3]),
+            ({"amount_max": "20.00"}, [1, 4]),
+            ({"search": "Аренда"}, [0, 3]),
+            ({"type": self.income.pk, "amount_min": 50,
+              "date_to": "2024-02-29"}, [0]),
+        ]
+        for params, indexes in cases:
+            with self.subTest(params=params):
+                self.assertCountEqual(self.ids(**params), self.pks(*indexes))
+
+    def test_invalid_filters(self):
+        for params in (
+                {"date_from": "вчера"}, {"type": 0}, {"amount_min": "x"},
+        ):
+            with self.subTest(params=params):
+                response = self.client.get(self.url, params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(next(iter(params)), response.data)
+
+    def test_ordering(self):
+        by_date = sorted(
+            self.records, key=lambda r: (r.effective_date, r.pk)
+        )
+        ascending = [record.pk for record in by_date]
+        self.assertEqual(self.ids(), ascending[::-1])
+        self.assertEqual(
+            self.ids(ordering="-effective_date"), ascending[::-1]
+        )
+        self.assertEqual(self.ids(ordering="effective_date"), ascending)
+
+    def test_invalid_ordering(self):
+        for ordering in ("amount", "-rank"):
+            with self.subTest(ordering=ordering):
+                response = self.client.get(self.url, {"ordering": ordering})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data["ordering"], [
+                    "Допустимые значения: -effective_date, effective_date"
+                ])
+                response = self.client.get(
+                    reverse("cashflow_api:records_async"),
+                    {"ordering": ordering},
+                )
+                self.assertEqual(response.status_code, 400)
+
+        response = self.client.get(
+            self.url, {"search": "аренда", "ordering": "-rank"}
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def walk(self, url, params):
+        """ Страницы по ссылкам next, затем обратно по previous """
+        pages, link = [], None
+        while True:
+            response = (
+                self.client.get(link) if link
+                else self.client.get(url, params)
+            )
+            self.assertEqual(response.status_code, 200)
+            pages.append([item["id"] for item in response.data["results"]])
+            link = response.data["next"]
+            if link is None:
+                break
+        backwards = [pages[-1]]
+        while True:
+            link = response.data["previous"]
+            if link is None:
+                break
+            response = self.client.get(link)
+            backwards.append(
+                [item["id"] for item in response.data["results"]]
+            )
+        return pages, backwards[::-1]
+
+    def test_record_cursor_round_trip(self):
+        for ordering in ("-effective_date", "effective_date"):
+            with self.subTest(ordering=ordering):
+                pages, backwards = self.walk(
+                    self.url, {"page_size": 2, "ordering": ordering}
+                )
+                self.assertEqual(
+                    [len(page) for page in pages], [2, 2, 1]
+                )
+                self.assertEqual(
+                    [pk for page in pages for pk in page],
+                    self.ids(ordering=ordering),
+                )
+                self.assertEqual(backwards, pages)
+
+        pages, backwards = self.walk(
+            self.url, {"page_size": 1, "type": self.expense.pk}
+        )
+        self.assertEqual(pages, [[self.records[2].pk], [self.records[1].pk]])
+        self.assertEqual(backwards, pages)
+
+    def test_directory_cursor_pagination(self):
+        url = reverse("cashflow_api:subcategory-list")
+        extra = SubCategory.objects.bulk_create([
+            SubCategory(name=f"Прочее {i}", category=self.sales)
+            for i in range(3)
+        ])
+        pages, backwards = self.walk(url, {"page_size": 2})
+        self.assertEqual(
+            [pk for page in pages for pk in page],
+            sorted([self.avito.pk, self.vps.pk, *(s.pk for s in extra)]),
+        )
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual(backwards, pages)
+
+        pages, _ = self.walk(
+            url, {"page_size": 2, "category": self.infra.pk}
+        )
+        self.assertEqual(pages, [[self.vps.pk]])
+        response = self.client.get(url, {"category": "x"})
+        self.assertEqual(response.status_code, 400)
+
+
+class CountingTests(IncomeExpenseTestCase):
+    def test_row_count_display(self):
+        self.assertEqual(str(RowCount(123456, exact=False)), "около 123000")
+        self.assertEqual(str(RowCount(123456)), "123456")
+
+    def test_exact_count_below_threshold(self):
+        self.add(self.income, 100, datetime.date(2024, 3, 1))
+        self.assertEqual(
+            count_rows(CashFlowRecord.objects.filter(amount__gte=50)),
+            RowCount(1),
+        )
+
+    def test_api_count_and_totals(self):
+        self.add(self.income, 100, datetime.date(2024, 3, 1))
+        self.add(self.expense, 40, datetime.date(2024, 3, 2))
+        self.add(self.expense, 10, datetime.date(2024, 4, 2))
+        params = {"date_from": "2024-03-01", "date_to": "2024-03-31"}
+        response = self.client.get(
+            reverse("cashflow_api:cashflowrecord-list"), params
+        )
+        self.assertEqual(response.data["count"], 2)
+        self.assertTrue(response.data["count_exact"])
+
+        response = self.client.get(
+            reverse("cashflow_api:cashflowrecord-totals"), params
+        )
+        self.assertEqual(response.data, {
+            "count": 2,
+            "amount_total": "140.00",
+            "income": "100.00",
+            "expense": "40.00",
+        })
+
+
+class RecordResultCacheTests(TransactionTestCase):
+    """
+    Кэш не используется внутри транзакции, поэтому здесь
+    TransactionTestCase, а не TestCase.
+    """
+
+    def setUp(self):
+        record_cache.cache.clear()
+        record_type = Type.objects.create(name="Пополнение")
+        self.category = Category.objects.create(
+            name="Продажи", type=record_type
+        )
+        self.subcategory = SubCategory.objects.create(
+            name="Avito", category=self.category
+        )
+        self.record = self.add(datetime.date(2024, 3, 5))
+
+    def add(self, day):
+        return CashFlowRecord.objects.create(
+            type=self.category.type, category=self.category,
+            subcategory=self.subcategory, amount=100, custom_date=day,
+        )
+
+    def hits(self):
+        return registry().get_sample_value(
+            "cashflow_cache_requests_total",
+            {"cache": "records", "result": "hit"},
+        ) or 0
+
+    def test_month_versions(self):
+        url = reverse("cashflow_api:cashflowrecord-list")
+        march = {"date_from": "2024-03-01", "date_to": "2024-03-31"}
+        self.assertEqual(self.client.get(url, march).data["count"], 1)
+
+        # Единственный запрос - метки изменений, общие для ETag
+        # и ключа кэша.
+        hits = self.hits()
+        with self.assertNumQueries(1):
+            response = self.client.get(url, march)
+        self.assertEqual(response.data["count"], 1)
+        self.assertEqual(self.hits(), hits + 1)
+
+        # Запись в другом месяце не сбрасывает результат за март.
+        self.add(datetime.date(2024, 5, 1))
+        with self.assertNumQueries(1):
+            self.client.get(url, march)
+
+        self.record.comment = "Изменён"
+        self.record.save()
+        response = self.client.get(url, march)
+        self.assertEqual(response.data["results"][0]["comment"], "Изменён")
+
+    def test_unbounded_filter_depends_on_all_months(self):
+        url = reverse("cashflow_api:cashflowrecord-list")
+        self.assertEqual(self.client.get(url).data["count"], 1)
+        self.add(datetime.date(2020, 1, 1))
+        self.assertEqual(self.client.get(url).data["count"], 2)
+
+    def test_change_from_another_process(self):
+        """
+        Версии хранятся в БД: изменение, о котором кэш этого процесса
+        не знает, всё равно меняет ключ.
+        """
+        url = reverse("cashflow_api:cashflowrecord-list")
+        march = {"date_from": "2024-03-01", "date_to": "2024-03-31"}
+        self.client.get(url, march)
+
+        # Так выглядит сохранение в другом процессе: запись и метка
+        # месяца меняются в БД, локальный кэш не затрагивается.
+        CashFlowRecord.objects.filter(pk=self.record.pk).update(
+            comment="Из другого процесса"
+        )
+        RecordChangeMarker.objects.touch([self.record.effective_date])
+        response = self.client.get(url, march)
+        self.assertEqual(
+            response.data["results"][0]["comment"], "Из другого процесса"
+        )
+
+
+class RecordRowCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        record_type = Type.objects.create(name="Пополнение")
+        cls.category = Category.objects.create(
+            name="Продажи", type=record_type
+        )
+        subcategory = SubCategory.objects.create(
+            name="Avito", category=cls.category
+        )
+        cls.record = CashFlowRecord.objects.create(
+            type=record_type, category=cls.category,
+            subcategory=subcategory, amount=100, comment="Аванс",
+        )
+
+    def setUp(self):
+        row_cache.clear()
+
+    def rows(self, balances=None):
+        records = CashFlowRecord.objects.with_related()
+        return row_cache.rows(records, balances)
+
+    def hits(self):
+        return registry().get_sample_value(
+            "cashflow_cache_requests_total",
+            {"cache": "rows", "result": "hit"},
+        ) or 0
+
+    def test_rows_cached_until_record_or_directory_changes(self):
+        first = self.rows({self.record.pk: Decimal("100.00")})[0]
+        self.assertIn("Продажи", first.head)
+        self.assertIn("Аванс", first.tail)
+        self.assertEqual(first.balance, Decimal("100.00"))
+
+        hits = self.hits()
+        second = self.rows()[0]
+        self.assertEqual(self.hits(), hits + 1)
+        self.assertEqual((second.head, second.tail), (first.head, first.tail))
+        self.assertIsNone(second.balance)
+
+        self.record.comment = "Оплата"
+        self.record.save(update_fields=["comment"])
+        self.assertIn("Оплата", self.rows()[0].tail)
+
+        self.category.name = "Услуги"
+        self.category.save()
+        self.assertIn("Услуги", self.rows()[0].head)
+
+    def test_list_page_assembled_from_rows(self):
+        response = self.client.get(reverse("cashflow:cashflow_list"))
+        # Сумма, остаток из представления и комментарий из фрагмента.
+        self.assertContains(
+            response, "<td>100,00</td>\n<td>100,00</td>\n<td>Аванс</td>"
+        )
+
+
+class ConditionalRequestTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        record_type = Type.objects.create(name="Пополнение")
+        category = Category.objects.create(name="Продажи", type=record_type)
+        subcategory = SubCategory.objects.create(
+            name="Avito", category=category
+        )
+        cls.march = CashFlowRecord.objects.create(
+            type=record_type, category=category, subcategory=subcategory,
+            amount=100, custom_date=datetime.date(2024, 3, 5),
+        )
+        cls.may = CashFlowRecord.objects.create(
+            type=record_type, category=category, subcategory=subcategory,
+            amount=50, custom_date=datetime.date(2024, 5, 1),
+        )
+
+    def test_api_not_modified_until_period_changes(self):
+        url = reverse("cashflow_api:cashflowrecord-list")
+        march = {"date_from": "2024-03-01", "date_to": "2024-03-31"}
+        response = self.client.get(url, march)
+        etag = response["ETag"]
+        self.assertTrue(response.has_header("Last-Modified"))
+
+        # Только агрегат по меткам, без запросов к записям.
+        with self.assertNumQueries(1):
+            response = self.client.get(url, march, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Изменение в другом месяце не меняет ETag периода.
+        self.may.comment = "Изменён"
+        self.may.save()
+        response = self.client.get(url, march, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.march.delete()
+        response = self.client.get(url, march, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["results"], [])
+
+    def test_list_etag_depends_on_directories(self):
+        url = reverse("cashflow:cashflow_list")
+        etag = self.client.get(url)["ETag"]
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Status.objects.create(name="Бизнес")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
@@ -1,4 +1,5 @@
 from django.urls import path
+from cash_flow import async_views
 from cash_flow.views import (
     CashFlowRecordListView,
     CashFlowRecordUpdateView,
@@ -19,6 +20,8 @@ from cash_flow.views import (
     SubCategoryDeleteView,
     load_subcategories,
     load_categories,
+    export_records,
+    directory_tree,
 )
 from cash_flow.apps import CashFlowConfig
 
@@ -41,6 +44,11 @@ urlpatterns = [
         CashFlowRecordCreateView.as_view(),
         name="cashflow_create"
     ),
+    path(
+        "record/export/",
+        export_records,
+        name="cashflow_export"
+    ),
     path(
         "directories/",
         DirectoryView.as_view(),
@@ -116,4 +124,24 @@ urlpatterns = [
         load_categories,
         name="load_categories"
     ),
+    path(
+        "ajax/directory-tree/",
+        directory_tree,
+        name="directory_tree"
+    ),
+    path(
+        "ajax/async/load-subcategories/",
+        async_views.load_subcategories,
+        name="ajax_load_subcategories_async"
+    ),
+    path(
+        "ajax/async/load-categories/",
+        async_views.load_categories,
+        name="load_categories_async"
+    ),
+    path(
+        "ajax/async/directory-tree/",
+        async_views.directory_tree,
+        name="directory_tree_async"
+    ),
 ]
@@ -1,30 +1,254 @@
 import datetime
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from cash_flow.models import Category, Status, SubCategory, Type
+
+CATEGORY_TYPE_MISMATCH = "Категория не относится к типу"
+SUBCATEGORY_CATEGORY_MISMATCH = "Подкатегория не относится к категории"
+
+REFERENCE_FIELDS = ("status", "type", "category", "subcategory")
+
+
+def _pk(value):
+    """ id справочника: из экземпляра модели или как есть """
+    return getattr(value, "pk", value)
+
+
+@dataclass
+class HierarchyIndex:
+    """
+    Справочники, на которые ссылаются проверяемые записи: id типов
+    и статусов, тип каждой категории и категория каждой подкатегории.
+
+    Записи передаются словарями с ключами status, type, category,
+    subcategory, custom_date, amount. Справочники - id или экземпляры
+    моделей; у экземпляров родитель берётся из type_id/category_id
+    без обращения к БД.
+    """
+    statuses: set = field(default_factory=set)
+    types: set = field(default_factory=set)
+    category_types: Dict[int, int] = field(default_factory=dict)
+    subcategory_categories: Dict[int, int] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, payloads: Iterable[dict]) -> "HierarchyIndex":
+        """
+        Индекс по всем справочникам из payloads: не больше одного запроса
+        на каждую модель и ни одного, если переданы только экземпляры.
+        """
+        index = cls()
+        ids = {name: set() for name in REFERENCE_FIELDS}
+        for payload in payloads:
+            for name in REFERENCE_FIELDS:
+                value = payload.get(name)
+                if value is None:
+                    continue
+                if hasattr(value, "pk"):
+                    index._add_instance(name, value)
+                else:
+                    ids[name].add(value)
+
+        if ids["status"] - index.statuses:
+            index.statuses.update(Status.objects.filter(
+                id__in=ids["status"] - index.statuses
+            ).values_list("id", flat=True))
+        if ids["type"] - index.types:
+            index.types.update(Type.objects.filter(
+                id__in=ids["type"] - index.types
+            ).values_list("id", flat=True))
+        if ids["category"] - index.category_types.keys():
+            index.category_types.update(Category.objects.filter(
+                id__in=ids["category"] - index.category_types.keys()
+            ).values_list("id", "type_id"))
+        if ids["subcategory"] - index.subcategory_categories.keys():
+            index.subcategory_categories.update(SubCategory.objects.filter(
+                id__in=ids["subcategory"]
+                - index.subcategory_categories.keys()
+            ).values_list("id", "category_id"))
+        return index
+
+    @classmethod
+    def from_directory(cls, snapshot) -> "HierarchyIndex":
+        """ Индекс по снимку справочников (см. directory_cache.py) """
+        return cls(
+            statuses={entry.id for entry in snapshot.statuses},
+            types={entry.id for entry in snapshot.types},
+            category_types={
+                entry.id: entry.parent_id for entry in snapshot.categories
+            },
+            subcategory_categories={
+                entry.id: entry.parent_id for entry in snapshot.subcategories
+            },
+        )
+
+    def _add_instance(self, name, instance):
+        if name == "status":
+            self.statuses.add(instance.pk)
+        elif name == "type":
+            self.types.add(instance.pk)
+        elif name == "category":
+            self.category_types[instance.pk] = instance.type_id
+        else:
+            self.subcategory_categories[instance.pk] = instance.category_id
+
+    def _known(self, name) -> bool:
+        return {
+            "status": self.statuses,
+            "type": self.types,
+            "category": self.category_types,
+            "subcategory": self.subcategory_categories,
+        }[name]
+
+    def reference_errors(self, payload: dict) -> Dict[str, List[str]]:
+        """ Ссылки на несуществующие справочники """
+        errors = {}
+        for name in REFERENCE_FIELDS:
+            value = _pk(payload.get(name))
+            if value is not None and value not in self._known(name):
+                errors[name] = [f"Объект с id={value} не существует"]
+        return errors
+
+    def category_type_errors(self, payload: dict) -> List[str]:
+        category = _pk(payload.get("category"))
+        record_type = _pk(payload.get("type"))
+        if (
+                category is not None
+                and record_type is not None
+                and category in self.category_types
+                and self.category_types[category] != record_type
+        ):
+            return [CATEGORY_TYPE_MISMATCH]
+        return []
+
+    def subcategory_category_errors(self, payload: dict) -> List[str]:
+        subcategory = _pk(payload.get("subcategory"))
+        category = _pk(payload.get("category"))
+        if (
+                subcategory is not None
+                and category is not None
+                and subcategory in self.subcategory_categories
+                and self.subcategory_categories[subcategory] != category
+        ):
+            return [SUBCATEGORY_CATEGORY_MISMATCH]
+        return []
+
+
+def _resolve(payloads, index):
+    payloads = list(payloads)
+    if index is None:
+        index = HierarchyIndex.load(payloads)
+    return payloads, index
+
+
+def validate_category_type_matches(
+        payloads: Iterable[dict], index: Optional[HierarchyIndex] = None
+) -> List[List[str]]:
+    """
+    Соответствие категорий выбранным типам для набора записей.
+    Возвращает список ошибок для каждой записи в исходном порядке.
+    """
+    payloads, index = _resolve(payloads, index)
+    return [index.category_type_errors(payload) for payload in payloads]
+
+
+def validate_subcategory_category_matches(
+        payloads: Iterable[dict], index: Optional[HierarchyIndex] = None
+) -> List[List[str]]:
+    """
+    Соответствие подкатегорий выбранным категориям для набора записей
+    """
+    payloads, index = _resolve(payloads, index)
+    return [index.subcategory_category_errors(payload) for payload in payloads]
+
+
+def validate_custom_dates(payloads: Iterable[dict]) -> List[List[str]]:
+    """
+    Проверка, что даты записей - не даты будущего
+    """
+    date_now = datetime.datetime.now().date()
+    return [
+        ["Дата создания не может быть в будущем"]
+        if payload.get("custom_date") and payload["custom_date"] > date_now
+        else []
+        for payload in payloads
+    ]
+
+
+def validate_amounts(payloads: Iterable[dict]) -> List[List[str]]:
+    """
+    Проверка, что суммы записей не меньше нуля
+    """
+    return [
+        ["Количество средств не может быть меньше нуля"]
+        if payload.get("amount") is not None and payload["amount"] < 0
+        else []
+        for payload in payloads
+    ]
+
+
+def validate_records(
+        payloads: Iterable[dict], index: Optional[HierarchyIndex] = None
+) -> List[Dict[str, List[str]]]:
+    """
+    Все проверки записи ДДС для набора записей.
+
+    Args:
+        payloads: словари записей (см. HierarchyIndex).
+        index: готовый индекс справочников; если не передан,
+            загружается по payloads.
+
+    Returns:
+        Для каждой записи - словарь ошибок по полям,
+        пустой словарь - ошибок нет.
+    """
+    payloads, index = _resolve(payloads, index)
+    results = []
+    for payload, date_errors, amount_errors in zip(
+            payloads, validate_custom_dates(payloads),
+            validate_amounts(payloads),
+    ):
+        errors = index.reference_errors(payload)
+        for name, messages in (
+                ("category", index.category_type_errors(payload)),
+                ("subcategory", index.subcategory_category_errors(payload)),
+                ("custom_date", date_errors),
+                ("amount", amount_errors),
+        ):
+            if messages and name not in errors:
+                errors[name] = messages
+        results.append(errors)
+    return results
+
+
+def _raise_first(errors: List[str]):
+    if errors:
+        raise ValueError(errors[0])
 
 
 def validate_category_type_match(category, record_type):
     """
     Валидация на соответствие категории выбранному типу
     """
-    if category and record_type and category.type != record_type:
-        raise ValueError("Категория не относится к типу")
+    _raise_first(validate_category_type_matches(
+        [{"category": category, "type": record_type}]
+    )[0])
 
 
 def validate_subcategory_category_match(subcategory, category):
     """
     Валидация на соответствие подкатегории выбранной категории
     """
-    if subcategory and category and subcategory.category != category:
-        raise ValueError("Подкатегория не относится к категории")
+    _raise_first(validate_subcategory_category_matches(
+        [{"subcategory": subcategory, "category": category}]
+    )[0])
 
 
 def validate_custom_date(custom_date):
     """
     Проверка, что дата создания записи - не дата будущего
     """
-    date_now = datetime.datetime.now().date()
-    if custom_date:
-        if custom_date > date_now:
-            raise ValueError("Дата создания не может быть в будущем")
+    _raise_first(validate_custom_dates([{"custom_date": custom_date}])[0])
 
 
 def validate_cash_flow_record_amount(amount):
@@ -32,5 +256,4 @@ def validate_cash_flow_record_amount(amount):
     Валидация суммы из записи.
     Количество денежных средств(amount) не должно быть меньше нуля
     """
-    if amount < 0:
-        raise ValueError("Количество средств не может быть меньше нуля")
\ No newline at end of file
+    _raise_first(validate_amounts([{"amount": amount}])[0])
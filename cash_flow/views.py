@@ -1,26 +1,72 @@
+import datetime
+import io
+from decimal import Decimal
 from typing import Any, Dict
-from django.http import HttpRequest, HttpResponse
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse, Http404
 from django.views.generic.edit import FormMixin
 from django.db.models.query import QuerySet
 
-from django.db.models.functions import Coalesce
 from django.shortcuts import render, redirect
 from django.urls import reverse_lazy
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
 from django.views import View
+from django.views.decorators.http import condition
 from django.views.generic import ListView, UpdateView, DeleteView, CreateView
-from rest_framework import viewsets
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from django.contrib import messages
-from django.db.models import ProtectedError
-from django.http import JsonResponse
-
-from .models import CashFlowRecord, Status, Type, Category, SubCategory
+from django.db.models import Count, ProtectedError, Q, Sum
+from django.http import JsonResponse, StreamingHttpResponse
+
+from .models import (
+    CashFlowRecord,
+    CashFlowDailyRollup,
+    Status,
+    Type,
+    Category,
+    SubCategory
+)
+from .bulk import (
+    bulk_create_records,
+    bulk_delete_records,
+    bulk_update_records
+)
+from .filters import CashFlowRecordFilterBackend, ExactFieldFilterBackend
+from .pagination import (
+    CashFlowRecordCursorPagination,
+    DirectoryCursorPagination,
+    InvalidCursor,
+    KeysetPaginator,
+    rank_field
+)
 from cash_flow.forms import (
     CashFlowRecordForm,
     TypeForm,
     StatusForm,
     CategoryForm,
-    SubCategoryForm, CashFlowFilterForm
+    SubCategoryForm, CashFlowFilterForm, CashFlowReportForm,
+    CashFlowBalanceForm
 )
+from cash_flow.balance import CENTS, daily_balance, record_balances
+from cash_flow.conditional import (
+    api_records_etag,
+    api_records_last_modified,
+    change_state,
+    record_list_etag
+)
+from cash_flow.counting import count_rows
+from cash_flow.result_cache import record_cache
+from cash_flow.row_cache import row_cache
+from cash_flow.directory_cache import get_directory
+from cash_flow.export import export_rows, iter_csv, iter_xlsx
+from cash_flow.importer import RecordImporter, read_rows
+from cash_flow.db_routing import replica_view
+from cash_flow.reports import build_report
 from cash_flow.serializers import (
     StatusSerializer,
     TypeSerializer,
@@ -33,75 +79,338 @@ from cash_flow.serializers import (
 class StatusViewSet(viewsets.ModelViewSet):
     """ CRUD для статусов """
     queryset = Status.objects.all()
+    read_replica = True
     serializer_class = StatusSerializer
+    pagination_class = DirectoryCursorPagination
 
 
 class TypeViewSet(viewsets.ModelViewSet):
     """ CRUD для типов """
     queryset = Type.objects.all()
+    read_replica = True
     serializer_class = TypeSerializer
+    pagination_class = DirectoryCursorPagination
 
 
 class CategoryViewSet(viewsets.ModelViewSet):
-    """ CRUD для категорий """
+    """ CRUD для категорий, фильтр по типу: ?type=<id> """
     queryset = Category.objects.all()
+    read_replica = True
     serializer_class = CategorySerializer
+    pagination_class = DirectoryCursorPagination
+    filter_backends = [ExactFieldFilterBackend]
+    filter_fields = ("type",)
 
 
 class SubcategoryViewSet(viewsets.ModelViewSet):
-    """ CRUD для подкатегорий """
+    """ CRUD для подкатегорий, фильтр по категории: ?category=<id> """
     queryset = SubCategory.objects.all()
+    read_replica = True
     serializer_class = SubCategorySerializer
+    pagination_class = DirectoryCursorPagination
+    filter_backends = [ExactFieldFilterBackend]
+    filter_fields = ("category",)
 
 
 class CashFlowRecordViewSet(viewsets.ModelViewSet):
-    """ CRUD для записей ДДС """
+    """
+    CRUD для записей ДДС.
+    Список постраничный (cursor, page_size, ordering=[-]effective_date
+    или -rank) и фильтруется параметрами date_from, date_to, status, type,
+    category, subcategory, amount_min, amount_max; search - поиск
+    по комментарию, результаты по умолчанию упорядочены по релевантности.
+    Точные количество и суммы по тем же фильтрам - totals/.
+    """
     queryset = CashFlowRecord.objects.all()
+    read_replica = True
     serializer_class = CashFlowRecordSerializer
+    pagination_class = CashFlowRecordCursorPagination
+    filter_backends = [CashFlowRecordFilterBackend]
+    bulk_handlers = {
+        "post": bulk_create_records,
+        "patch": bulk_update_records,
+        "delete": bulk_delete_records,
+    }
+
+    @method_decorator(condition(
+        etag_func=api_records_etag,
+        last_modified_func=api_records_last_modified,
+    ))
+    def list(self, request: HttpRequest, *args, **kwargs) -> Response:
+        """
+        Список с ETag и Last-Modified по меткам изменений месяцев
+        фильтра: при совпадении - 304 без запроса к записям.
+        """
+        response = super().list(request, *args, **kwargs)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="import",
+        parser_classes=[MultiPartParser],
+    )
+    def import_records(self, request: HttpRequest) -> Response:
+        """
+        Импорт записей из загруженного файла (поле file) в формате
+        CSV или JSONL; справочники указываются названиями. Формат
+        берётся из расширения файла или параметра file_format (в теле
+        или в строке запроса): имя format занято выбором формата ответа
+        DRF.
+        Возвращает статистику и первые отклонённые строки.
+        """
+        upload = request.FILES.get("file")
+        if upload is None:
+            return Response(
+                {"file": ["Файл не передан"]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        file_format = (
+            request.data.get("file_format")
+            or request.query_params.get("file_format")
+            or upload.name.rsplit(".", 1)[-1]
+        ).lower()
+        if file_format not in ("csv", "jsonl"):
+            return Response(
+                {"file_format": ["Допустимые значения: csv, jsonl"]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        stream = io.TextIOWrapper(upload, encoding="utf-8-sig", newline="")
+        try:
+            stats = RecordImporter().run(read_rows(stream, file_format))
+        except UnicodeDecodeError:
+            return Response(
+                {"file": ["Файл должен быть в кодировке UTF-8"]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response({**stats.as_dict(), "errors": stats.errors})
+
+    @action(detail=False, methods=["get"])
+    def totals(self, request: HttpRequest) -> Response:
+        """
+        Точное количество и суммы записей, отобранных теми же фильтрами,
+        что и список: всего, поступления и списания. Считается отдельно
+        от списка, где количество может быть оценкой.
+        """
+        queryset = self.filter_queryset(self.get_queryset()).order_by()
+        totals = queryset.aggregate(
+            count=Count("id"),
+            amount_total=Sum("amount"),
+            income=Sum("amount", filter=Q(type__is_expense=False)),
+            expense=Sum("amount", filter=Q(type__is_expense=True)),
+        )
+        return Response({
+            "count": totals.pop("count"),
+            **{
+                name: str((value or Decimal("0")).quantize(CENTS))
+                for name, value in totals.items()
+            },
+        })
+
+    @action(detail=False, methods=["post", "patch", "delete"])
+    def bulk(self, request: HttpRequest) -> Response:
+        """
+        Массовые операции: POST - создание, PATCH - изменение (с id),
+        DELETE - удаление (тело - список id).
+        ?mode=atomic (по умолчанию) - всё или ничего,
+        ?mode=partial - сохраняются корректные элементы.
+        """
+        items = request.data
+        mode = request.query_params.get("mode", "atomic")
+        if mode not in ("atomic", "partial"):
+            return Response(
+                {"mode": ["Допустимые значения: atomic, partial"]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not isinstance(items, list):
+            return Response(
+                {"non_field_errors": ["Ожидается список элементов"]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > settings.CASHFLOW_BULK_MAX_ITEMS:
+            return Response(
+                {"non_field_errors": [
+                    f"Не более {settings.CASHFLOW_BULK_MAX_ITEMS} "
+                    f"элементов за запрос"
+                ]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        handler = self.bulk_handlers[request.method.lower()]
+        result = handler(items, atomic=mode == "atomic")
+        return Response(
+            {
+                "applied": result.applied,
+                "ids": result.ids,
+                "errors": result.errors,
+            },
+            status=(
+                status.HTTP_200_OK if result.applied
+                else status.HTTP_400_BAD_REQUEST
+            )
+        )
+
+
+class CashFlowReportView(APIView):
+    """
+    Отчёт по записям ДДС: суммы и количество по периодам и справочникам.
+    Принимает те же фильтры, что и список записей, а также
+    period (day/week/month/quarter/year) и group_by
+    (type/category/subcategory/status, можно несколько).
+    """
+    read_replica = True
+
+    def get(self, request: HttpRequest) -> Response:
+        form = CashFlowReportForm(request.query_params)
+        if not form.is_valid():
+            return Response(form.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        cd = form.cleaned_data
+        queryset = CashFlowDailyRollup.objects.filter_by(cd)
+        return Response(build_report(queryset, cd["period"], cd["group_by"]))
+
+
+class CashFlowBalanceView(APIView):
+    """
+    Остаток денежных средств по дням: остаток на начало периода,
+    поступления, списания и остаток на конец каждого дня с операциями
+    (см. balance.py). Принимает date_from и date_to.
+    """
+    read_replica = True
+
+    def get(self, request: HttpRequest) -> Response:
+        form = CashFlowBalanceForm(request.query_params)
+        if not form.is_valid():
+            return Response(form.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        cd = form.cleaned_data
+        opening, rows = daily_balance(cd["date_from"], cd["date_to"])
+        return Response({
+            "date_from": cd["date_from"],
+            "date_to": cd["date_to"],
+            "opening_balance": str(opening),
+            "closing_balance": str(rows[-1]["balance"] if rows else opening),
+            "results": [
+                {
+                    "date": row["date"],
+                    "income": str(row["income"]),
+                    "expense": str(row["expense"]),
+                    "balance": str(row["balance"]),
+                }
+                for row in rows
+            ],
+        })
 
 
 class CashFlowRecordListView(ListView):
     """
-    Список записей ДДС отсортированный по дате добавления в обратном порядке.
-    Записи выводятся в зависимости от примененных фильтров.
+    Список записей ДДС отсортированный по дате в обратном порядке,
+    при поиске по комментарию - по релевантности.
+    Записи выводятся в зависимости от примененных фильтров
+    и разбиваются на страницы курсорной пагинацией по (дата, id).
     """
     model = CashFlowRecord
     template_name = 'cash_flow/cashflow_list.html'
-    ordering = ['-created_at']
     context_object_name = "records"
+    paginate_by = settings.CASHFLOW_LIST_PAGE_SIZE
+    read_replica = True
+    cursor_kwarg = "cursor"
+    page_size_kwarg = "page_size"
+
+    @method_decorator(condition(etag_func=record_list_etag))
+    def get(self, request: HttpRequest, *args, **kwargs) -> HttpResponse:
+        """
+        Страница с ETag по меткам изменений и справочникам:
+        при совпадении If-None-Match - 304 без запросов к записям.
+        """
+        response = super().get(request, *args, **kwargs)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
 
     def get_queryset(self) -> QuerySet:
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().with_related()
         form = CashFlowFilterForm(self.request.GET)
-
-        queryset = queryset.annotate(
-            effective_date=Coalesce('custom_date', 'created_at')
-        )
+        # Очищенные фильтры - часть ключа кэша результатов.
+        self.filters = {}
 
         if form.is_valid():
-            cd = form.cleaned_data
-            if cd["date_from"]:
-                queryset = queryset.filter(effective_date__gte=cd["date_from"])
-            if cd["date_to"]:
-                queryset = queryset.filter(effective_date__lte=cd["date_to"])
-            if cd["status"]:
-                queryset = queryset.filter(status=cd["status"])
-            if cd["type"]:
-                queryset = queryset.filter(type=cd["type"])
-            if cd["category"]:
-                queryset = queryset.filter(category=cd["category"])
-            if cd["subcategory"]:
-                queryset = queryset.filter(subcategory=cd["subcategory"])
+            queryset = queryset.filter_by(form.cleaned_data)
+            self.filters = form.cleaned_data
 
         return queryset
 
+    def get_paginate_by(self, queryset: QuerySet) -> int:
+        try:
+            page_size = int(self.request.GET.get(self.page_size_kwarg))
+        except (TypeError, ValueError):
+            return self.paginate_by
+        return max(1, min(page_size, settings.CASHFLOW_LIST_MAX_PAGE_SIZE))
+
+    def paginate_queryset(self, queryset: QuerySet, page_size: int):
+        paginator = KeysetPaginator(
+            queryset, page_size, rank_field=rank_field(queryset)
+        )
+        cursor = self.request.GET.get(self.cursor_kwarg)
+
+        def compute():
+            try:
+                page = paginator.get_page(cursor)
+            except InvalidCursor as e:
+                raise Http404(str(e))
+            return page, count_rows(queryset)
+
+        page, self.total = record_cache.get_or_compute(
+            "list", self.filters, compute,
+            state=lambda: change_state(self.request),
+            cursor=cursor, page_size=page_size,
+        )
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    def get_page_url(self, cursor: str) -> str:
+        """
+        Ссылка на соседнюю страницу с сохранением параметров фильтрации.
+        """
+        params = self.request.GET.copy()
+        params[self.cursor_kwarg] = cursor
+        return f"?{params.urlencode()}"
+
     def get_context_data(self, **kwargs: Any) -> Dict[str, Any]:
         context = super().get_context_data(**kwargs)
         context["filter_form"] = CashFlowFilterForm(self.request.GET)
+        context["total"] = self.total
+        export_params = self.request.GET.copy()
+        for param in (self.cursor_kwarg, self.page_size_kwarg):
+            export_params.pop(param, None)
+        context["export_query"] = export_params.urlencode()
+        page = context["page_obj"]
+        # Остаток после записи - по всем записям, а не по отобранным.
+        context["record_rows"] = row_cache.rows(
+            page.object_list, record_balances(page.object_list)
+        )
+        if page.has_next:
+            context["next_page_url"] = self.get_page_url(page.next_cursor)
+        if page.has_previous:
+            context["previous_page_url"] = self.get_page_url(
+                page.previous_cursor
+            )
+        return context
+
+
+class DirectoryTreeMixin:
+    """
+    Добавляет в контекст дерево справочников, чтобы зависимые списки
+    формы строились на клиенте без запросов к серверу.
+    """
+
+    def get_context_data(self, **kwargs: Any) -> Dict[str, Any]:
+        context = super().get_context_data(**kwargs)
+        context["directory_tree"] = get_directory().tree
         return context
 
 
-class CashFlowRecordUpdateView(UpdateView):
+class CashFlowRecordUpdateView(DirectoryTreeMixin, UpdateView):
     """
     Обновление записи ДДС.
     """
@@ -120,7 +429,7 @@ class CashFlowRecordDeleteView(DeleteView):
     success_url = reverse_lazy("cashflow:cashflow_list")
 
 
-class CashFlowRecordCreateView(CreateView):
+class CashFlowRecordCreateView(DirectoryTreeMixin, CreateView):
     """
     Создание записи ДДС.
     """
@@ -135,11 +444,12 @@ class DirectoryView(View):
     Вьюха для сбора типов, статусов, категорий и подкатегорий.
     """
     def get(self, request):
+        directory = get_directory()
         context = {
-            'statuses': Status.objects.all(),
-            'types': Type.objects.all(),
-            'categories': Category.objects.all(),
-            'subcategories': SubCategory.objects.all(),
+            'statuses': directory.statuses,
+            'types': directory.types,
+            'categories': directory.categories,
+            'subcategories': directory.subcategories,
         }
 
         return render(
@@ -310,12 +620,40 @@ class SubCategoryDeleteView(DeleteView):
             return redirect(self.success_url)
 
 
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _directory_etag(request: HttpRequest) -> str:
+    return get_directory().etag
+
+
+@condition(etag_func=_directory_etag)
+def directory_tree(request: HttpRequest) -> JsonResponse:
+    """
+    Все справочники одним JSON-документом: дерево
+    Тип -> Категория -> Подкатегория и список статусов.
+
+    Ответ содержит ETag, вычисленный по содержимому справочников;
+    при совпадении If-None-Match возвращается 304 Not Modified.
+    """
+    response = JsonResponse(
+        get_directory().tree,
+        json_dumps_params={"separators": (",", ":"), "ensure_ascii": False}
+    )
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
 def load_subcategories(request: HttpRequest) -> JsonResponse:
     """
     Возвращает список подкатегорий, относящихся к заданной категории.
 
     Получает параметр `category_id` из GET-запроса
-    и фильтрует подкатегории по этому идентификатору.
+    и выбирает подкатегории из кэша справочников.
     Результат возвращается в формате JSON,
     содержащем список подкатегорий с их идентификаторами и названиями.
 
@@ -326,11 +664,12 @@ def load_subcategories(request: HttpRequest) -> JsonResponse:
         JsonResponse: JSON-ответ с подкатегориями, например:
                 {"subcategories": [{"id": 1, "name": "Подкатегория 1"}, ...]}
     """
-    category_id = request.GET.get("category_id")
-    subcategories = SubCategory.objects.filter(
-        category_id=category_id
-    ).values("id", "name")
-    return JsonResponse({"subcategories": list(subcategories)})
+    category_id = _int_or_none(request.GET.get("category_id"))
+    subcategories = [
+        {"id": entry.id, "name": entry.name}
+        for entry in get_directory().subcategories_for(category_id)
+    ]
+    return JsonResponse({"subcategories": subcategories})
 
 
 def load_categories(request: HttpRequest) -> JsonResponse:
@@ -338,7 +677,7 @@ def load_categories(request: HttpRequest) -> JsonResponse:
     Возвращает список категорий, относящихся к заданному типу.
 
     Получает параметр `type_id` из GET-запроса
-    и фильтрует категории по этому идентификатору.
+    и выбирает категории из кэша справочников.
     Результат возвращается в формате JSON,
     содержащем список категорий с их идентификаторами и названиями.
 
@@ -349,8 +688,46 @@ def load_categories(request: HttpRequest) -> JsonResponse:
         JsonResponse: JSON-ответ с категориями, например:
                 {"categories": [{"id": 1, "name": "Категория 1"}, ...]}
     """
-    type_id = request.GET.get("type_id")
-    categories = Category.objects.filter(
-        type_id=type_id
-    ).values("id", "name")
-    return JsonResponse({"categories": list(categories)})
+    type_id = _int_or_none(request.GET.get("type_id"))
+    categories = [
+        {"id": entry.id, "name": entry.name}
+        for entry in get_directory().categories_for(type_id)
+    ]
+    return JsonResponse({"categories": categories})
+
+
+EXPORT_FORMATS = {
+    "csv": (iter_csv, "text/csv; charset=utf-8"),
+    "xlsx": (
+        iter_xlsx,
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    ),
+}
+
+
+@replica_view
+def export_records(request: HttpRequest) -> HttpResponse:
+    """
+    Потоковая выгрузка записей ДДС с фильтрами CashFlowFilterForm.
+
+    Формат задаётся параметром `format`: csv (по умолчанию) или xlsx.
+    Строки читаются из БД порциями и отдаются по мере чтения,
+    поэтому выгрузка не загружает все записи в память.
+    """
+    export_format = request.GET.get("format", "csv")
+    if export_format not in EXPORT_FORMATS:
+        return HttpResponse("Неизвестный формат выгрузки", status=400)
+
+    form = CashFlowFilterForm(request.GET)
+    if not form.is_valid():
+        return HttpResponse("Неверные параметры фильтрации", status=400)
+
+    renderer, content_type = EXPORT_FORMATS[export_format]
+    queryset = CashFlowRecord.objects.filter_by(form.cleaned_data)
+    # Строки читаются уже после выхода из представления, поэтому БД
+    # (реплика) фиксируется сейчас, пока действует маршрутизация запроса.
+    rows = export_rows(queryset.using(queryset.db))
+    response = StreamingHttpResponse(renderer(rows), content_type=content_type)
+    filename = f"cashflow_{datetime.date.today():%Y%m%d}.{export_format}"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
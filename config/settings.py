@@ -20,6 +20,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
 
     "cash_flow",
     "rest_framework",
@@ -30,11 +31,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "cash_flow.middleware.MetricsMiddleware",
+    "cash_flow.middleware.SqlInstrumentationMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "cash_flow.middleware.ReplicaRoutingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -70,6 +74,24 @@ DATABASES = {
     }
 }
 
+# Реплики только для чтения: "host[:port],host[:port]", остальные
+# параметры подключения - как у основной БД.
+CASHFLOW_REPLICA_DATABASES = []
+for _number, _address in enumerate(
+        filter(None, os.getenv("POSTGRES_REPLICA_HOSTS", "").split(",")),
+        start=1,
+):
+    _host, _, _port = _address.strip().partition(":")
+    DATABASES[f"replica_{_number}"] = {
+        **DATABASES["default"],
+        "HOST": _host,
+        "PORT": _port or DATABASES["default"]["PORT"],
+        "TEST": {"MIRROR": "default"},
+    }
+    CASHFLOW_REPLICA_DATABASES.append(f"replica_{_number}")
+
+DATABASE_ROUTERS = ["cash_flow.db_routing.ReplicaRouter"]
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
@@ -104,3 +126,127 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap4"
 
 CRISPY_TEMPLATE_PACK = "bootstrap4"
+
+CASHFLOW_LIST_PAGE_SIZE = int(os.getenv("CASHFLOW_LIST_PAGE_SIZE", 50))
+
+CASHFLOW_LIST_MAX_PAGE_SIZE = int(os.getenv("CASHFLOW_LIST_MAX_PAGE_SIZE", 500))
+
+CASHFLOW_API_PAGE_SIZE = int(os.getenv("CASHFLOW_API_PAGE_SIZE", 100))
+
+CASHFLOW_API_MAX_PAGE_SIZE = int(os.getenv("CASHFLOW_API_MAX_PAGE_SIZE", 1000))
+
+CASHFLOW_BULK_MAX_ITEMS = int(os.getenv("CASHFLOW_BULK_MAX_ITEMS", 5000))
+
+CASHFLOW_EXPORT_CHUNK_SIZE = int(os.getenv("CASHFLOW_EXPORT_CHUNK_SIZE", 2000))
+
+CASHFLOW_IMPORT_BATCH_SIZE = int(os.getenv("CASHFLOW_IMPORT_BATCH_SIZE", 50000))
+
+CASHFLOW_DIRECTORY_TTL = int(os.getenv("CASHFLOW_DIRECTORY_TTL", 30))
+
+CASHFLOW_DIRECTORY_SHARED_VERSION = (
+    os.getenv("CASHFLOW_DIRECTORY_SHARED_VERSION") == "True"
+)
+
+CASHFLOW_DIRECTORY_CACHE_ALIAS = os.getenv(
+    "CASHFLOW_DIRECTORY_CACHE_ALIAS", "default"
+)
+
+CASHFLOW_ESTIMATED_COUNT_THRESHOLD = int(
+    os.getenv("CASHFLOW_ESTIMATED_COUNT_THRESHOLD", 100000)
+)
+
+CASHFLOW_STICKY_PRIMARY_SECONDS = int(
+    os.getenv("CASHFLOW_STICKY_PRIMARY_SECONDS", 15)
+)
+
+CASHFLOW_REPLICA_MAX_LAG_SECONDS = int(
+    os.getenv("CASHFLOW_REPLICA_MAX_LAG_SECONDS", 30)
+)
+
+CASHFLOW_REPLICA_CHECK_INTERVAL = int(
+    os.getenv("CASHFLOW_REPLICA_CHECK_INTERVAL", 10)
+)
+
+CASHFLOW_PARTITION_MONTHS_AHEAD = int(
+    os.getenv("CASHFLOW_PARTITION_MONTHS_AHEAD", 3)
+)
+
+CASHFLOW_SQL_SAMPLE_RATE = float(os.getenv("CASHFLOW_SQL_SAMPLE_RATE", 0))
+
+CASHFLOW_SQL_SLOWEST = int(os.getenv("CASHFLOW_SQL_SLOWEST", 5))
+
+CASHFLOW_SQL_DUPLICATE_THRESHOLD = int(
+    os.getenv("CASHFLOW_SQL_DUPLICATE_THRESHOLD", 3)
+)
+
+CASHFLOW_METRICS_ENABLED = (
+    os.getenv("CASHFLOW_METRICS_ENABLED", "True") == "True"
+)
+
+# Адреса и сети (CIDR), с которых доступен /metrics, через запятую;
+# staff-пользователям метрики доступны с любого адреса.
+CASHFLOW_METRICS_ALLOWED_IPS = [
+    _network.strip()
+    for _network in os.getenv(
+        "CASHFLOW_METRICS_ALLOWED_IPS", "127.0.0.1,::1"
+    ).split(",")
+    if _network.strip()
+]
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "cash_flow": {
+            "handlers": ["console"],
+            "level": os.getenv("CASHFLOW_LOG_LEVEL", "INFO"),
+        },
+    },
+}
+
+CASHFLOW_RESULT_CACHE_ALIAS = os.getenv(
+    "CASHFLOW_RESULT_CACHE_ALIAS", "cashflow_results"
+)
+
+CASHFLOW_RESULT_CACHE_TIMEOUT = int(
+    os.getenv("CASHFLOW_RESULT_CACHE_TIMEOUT", 60)
+)
+
+CASHFLOW_ROW_CACHE_ALIAS = os.getenv(
+    "CASHFLOW_ROW_CACHE_ALIAS", "cashflow_rows"
+)
+
+CASHFLOW_ROW_CACHE_TIMEOUT = int(
+    os.getenv("CASHFLOW_ROW_CACHE_TIMEOUT", 3600)
+)
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # Результаты списка записей: LocMemCache вытесняет давно
+    # не читавшиеся записи сверх MAX_ENTRIES. При нескольких процессах
+    # лучше общий кэш (например, Redis с allkeys-lru).
+    "cashflow_results": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "cashflow_results",
+        "OPTIONS": {
+            "MAX_ENTRIES": int(
+                os.getenv("CASHFLOW_RESULT_CACHE_MAX_ENTRIES", 2000)
+            ),
+        },
+    },
+    # HTML строк таблицы записей: по элементу на запись и её версию.
+    "cashflow_rows": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "cashflow_rows",
+        "OPTIONS": {
+            "MAX_ENTRIES": int(
+                os.getenv("CASHFLOW_ROW_CACHE_MAX_ENTRIES", 20000)
+            ),
+        },
+    },
+}
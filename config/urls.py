@@ -1,8 +1,11 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from cash_flow.metrics import metrics
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("", include("cash_flow.urls", namespace="cashflow")),
-    path("api/", include("cash_flow.api_urls", namespace="cashflow_api"))
+    path("api/", include("cash_flow.api_urls", namespace="cashflow_api")),
+    path("metrics", metrics, name="metrics"),
 ]
@@ -2,44 +2,61 @@ document.addEventListener("DOMContentLoaded", function () {
   const typeSelect = document.getElementById("id_type");
   const categorySelect = document.getElementById("id_category");
   const subcategorySelect = document.getElementById("id_subcategory");
+  const treeUrl = document.querySelector("script[data-tree-url]").dataset.treeUrl;
+
+  // Дерево справочников встроено в страницу (json_script);
+  // если его нет - загружаем один раз целиком.
+  const treeElement = document.getElementById("directory-tree");
+  const treePromise = treeElement
+    ? Promise.resolve(JSON.parse(treeElement.textContent))
+    : fetch(treeUrl).then(response => response.json());
+
+  const categoriesByType = new Map();
+  const subcategoriesByCategory = new Map();
+  treePromise.then(tree => {
+    tree.types.forEach(type => {
+      categoriesByType.set(String(type.id), type.categories);
+      type.categories.forEach(cat => {
+        subcategoriesByCategory.set(String(cat.id), cat.subcategories);
+      });
+    });
+  });
+
+  function fillOptions(select, items) {
+    select.innerHTML = '<option value="">---------</option>';
+    items.forEach(item => {
+      const option = document.createElement("option");
+      option.value = item.id;
+      option.textContent = item.name;
+      select.appendChild(option);
+    });
+  }
 
   // При изменении типа — обновить категории
   typeSelect.addEventListener("change", function () {
     const typeId = this.value;
 
-    categorySelect.innerHTML = '<option value="">---------</option>';
-    subcategorySelect.innerHTML = '<option value="">---------</option>'; // сброс подкатегорий тоже
+    fillOptions(categorySelect, []);
+    fillOptions(subcategorySelect, []); // сброс подкатегорий тоже
 
     if (!typeId) return;
 
-    fetch(`/ajax/load-categories/?type_id=${typeId}`)
-      .then(response => response.json())
-      .then(data => {
-        data.categories.forEach(cat => {
-          const option = document.createElement("option");
-          option.value = cat.id;
-          option.textContent = cat.name;
-          categorySelect.appendChild(option);
-        });
-      });
+    treePromise.then(() => {
+      fillOptions(categorySelect, categoriesByType.get(typeId) || []);
+    });
   });
 
   // При изменении категории — обновить подкатегории
   categorySelect.addEventListener("change", function () {
     const categoryId = this.value;
 
-    subcategorySelect.innerHTML = '<option value="">---------</option>';
+    fillOptions(subcategorySelect, []);
     if (!categoryId) return;
 
-    fetch(`/ajax/load-subcategories/?category_id=${categoryId}`)
-      .then(response => response.json())
-      .then(data => {
-        data.subcategories.forEach(sub => {
-          const option = document.createElement("option");
-          option.value = sub.id;
-          option.textContent = sub.name;
-          subcategorySelect.appendChild(option);
-        });
-      });
+    treePromise.then(() => {
+      fillOptions(
+        subcategorySelect, subcategoriesByCategory.get(categoryId) || []
+      );
+    });
   });
-});
\ No newline at end of file
+});